@@ -2,16 +2,17 @@
 Joins work of other modules together.
 """
 import argparse
+import os
 
 import matplotlib.pyplot as plt
 # In there we have references on to 'home' button
 from matplotlib.backend_bases import NavigationToolbar2
-import numpy as np
-from scipy import stats
 
-from .crystlib import histograms_data
+from .cell_engine import CellEngine
+from .crystlib import HISTOGRAM_ORDER
+from .density import DensityPanel
 from .histogram import Histogram
-from .stream_read import search_crystals_parameters
+from .profiling import enable, instrument_figure
 from .widget import Button, ButtonBins, Span, CenteringButton
 from .zoompan import ZoomOnWheel
 
@@ -22,14 +23,29 @@ class CellExplorer:
     """Displaying the 6 subplots, each containing a histogram with data from
     'indexing stream' file. Each centering type is displayed as a different
     colour and can be switched after clicking on it as in the cell_explorer.
+    The selection and the fits are done by the class:`cell_engine.CellEngine`.
     """
 
-    def __init__(self, streamfile, **kwargs):
+    def __init__(self, streamfile, auto_ranges=False, density_pairs=None,
+                 canonical=False, **kwargs):
         """Parameters
         ----------
         file_stream : Python unicode str (on py3)
 
             Path to stream file.
+        auto_ranges : boolean
+
+            Propose the ranges around the largest clusters
+            of the histograms which are not given in kwargs.
+        density_pairs : list
+
+            Pairs of histogram names e.g. [('a', 'b'), ('alfa', 'gamma')],
+            for each the 2-D density of the selected crystals is shown
+            in an extra figure. Default: None, no extra figure.
+        canonical : boolean
+
+            Show the cells in the canonical setting, equivalent cells
+            (e.g. with permuted axes) fall into the same peaks.
         **kwargs
 
             Sets the ranges on the given histogram types
@@ -41,17 +57,25 @@ class CellExplorer:
         self.kwargs = kwargs
         self.stream_name = streamfile
         self.fig, self.axs_list = plt.subplots(2, 3)
+        instrument_figure(self.fig)
         # Windows for histograms
         self.axs_list = self.axs_list.ravel()
         # Reshaping matrix to vector: [1][1] to [4]
-        # all crystals find in file
-        self.all_crystals_list = search_crystals_parameters(self.stream_name)
-        # Crystals selected by Spanselector (with their colours)
-        self.histograms_data = histograms_data(self.all_crystals_list)
-        # Dictionary with a, b, c, alpha, beta, gamma as keys,
-        # ABCFHIR with list of data as values
-        self.crystals_excluded = []
-        # Excluded crystals
+        # all crystals find in file, selection and fits.
+        self.engine = CellEngine.from_stream(self.stream_name, canonical)
+        self.all_crystals_list = self.engine.all_crystals_list
+        # Crystals selected by Spanselector, with counts
+        # of each centering in the fine bins of each histogram.
+        self.cross_filter = self.engine.cross_filter
+        if auto_ranges:
+            # Clusters among the crystals in the given ranges.
+            self.engine.set_ranges({name: kwargs[name]
+                                    for name in self.engine.ranges
+                                    if name in kwargs})
+            proposed = self.engine.select_clusters(
+                [name for name in self.engine.ranges if name not in kwargs])
+            self.kwargs.update({name: left_right for name, left_right
+                                in proposed.items() if None not in left_right})
 
         # Colours for each centering type during initialization
         self.histogram_colors = {'P': 'gray', 'A': 'cyan', 'B': 'darkblue',
@@ -70,21 +94,33 @@ class CellExplorer:
                 temp_label = 'deg'
             self.histogram_list.append(Histogram(
                 axs=self.axs_list[hist_indx], name=hist_name,
-                xlabel=temp_label, bins=self.bins,
-                data_to_histogram=self.histograms_data[hist_name],
+                xlabel=temp_label, bins=self.bins, data_to_histogram=None,
+                fine_counts=self.cross_filter.fine_counts[hist_indx],
+                value_range=self.cross_filter.value_ranges[hist_indx],
                 colors=self.histogram_colors))
         plt.subplots_adjust(hspace=0.5)
         plt.subplots_adjust(wspace=0.1)
+        # 2-D densities of the selected crystals, refreshed by the Spans.
+        self.density_list = []
+        if density_pairs:
+            self.density_fig, density_axs = plt.subplots(
+                1, len(density_pairs), squeeze=False)
+            for axs, (x_name, y_name) in zip(density_axs[0], density_pairs):
+                self.density_list.append(DensityPanel(
+                    axs, x_name, y_name,
+                    *self.engine.density_counts(x_name, y_name)))
+            self.density_fig.tight_layout()
+            instrument_figure(self.density_fig)
+            # Buttons below are added to the current figure.
+            plt.figure(self.fig.number)
         # Histograms list
         # Buttons below; string list is the colour to which the button
         # and hist. changes after clicking.
         # Using itertools for looping to change color
         # list_color is our cyclic list
         # Buttons list:
-        # All Spans include reference for crystals list which were refused
-        # or not included (?) changes in 1 Span is visible by others.
-        # all_crystals_list has all crystals that were found.
-        # crystals_excluded has all crystal that has not set they are gray
+        # All Spans share the crossfilter, changes in 1 Span
+        # are visible by others.
         # index is used to locate which histogram applies
         button_x_pos = [0.95, 0.935, 0.92, 0.905, 0.89, 0.875, 0.86, 0.845]
         self.buttons_list = []
@@ -101,10 +137,10 @@ class CellExplorer:
         self.span_list = []
         for hist_indx, hist_name in enumerate(self.histogram_order):
             self.span_list.append(Span(
-                crystals_excluded=self.crystals_excluded,
                 fig=self.fig, index=hist_indx, name=hist_name,
-                all_crystals_list=self.all_crystals_list,
-                histogram_list=self.histogram_list))
+                cross_filter=self.cross_filter,
+                histogram_list=self.histogram_list,
+                density_list=self.density_list))
         # self.span_list = (span1, span2, span3, span4, span5, span6)
         self.fig.canvas.mpl_connect('key_press_event', self.press)
         self.fig.canvas.mpl_connect('button_release_event',
@@ -122,6 +158,9 @@ class CellExplorer:
         self.bttn_save = Button(ax=plt.axes([0.91, 0.875, 0.050, 0.025]),
                                 label="Save")
         self.bttn_save.on_clicked(self.save_file)
+        self.bttn_export = Button(ax=plt.axes([0.91, 0.85, 0.050, 0.025]),
+                                  label="Export")
+        self.bttn_export.on_clicked(self.export_stream)
         self.parameters_used()
         self.gauss_draw()
         plt.show()
@@ -142,79 +181,7 @@ class CellExplorer:
 
             Lattice type and unique axis.
         """
-        def tolerance(a, b, percent):
-            if abs(a-b) < abs(a)*(percent/100):
-                return True
-            return False
-
-        def is_close(a, b): return abs(a-b) < 0.3
-
-        if(is_close(gauss_parameters[3], 90) and
-           is_close(gauss_parameters[4], 90) and
-           is_close(gauss_parameters[5], 90)):
-            # I check if the parameters(alfa,beta,gamma) are close 90 deg
-            if(tolerance(gauss_parameters[0], gauss_parameters[1], 1.0) and
-               tolerance(gauss_parameters[1], gauss_parameters[2], 1.0)):
-                lt = "CUBIC"
-                ua = '*'
-            elif tolerance(gauss_parameters[0], gauss_parameters[1], 1.0):
-                lt = 'TETRAGONAL'
-                ua = 'c'
-            elif tolerance(gauss_parameters[0], gauss_parameters[2], 1.0):
-                lt = 'TETRAGONAL'
-                ua = 'b'
-            elif tolerance(gauss_parameters[1], gauss_parameters[2], 1.0):
-                lt = 'TETRAGONAL'
-                ua = 'a'
-            else:
-                lt = 'ORTHORHOMBIC'
-                ua = '*'
-        elif(is_close(gauss_parameters[3], 90) and
-             is_close(gauss_parameters[4], 90) and
-             is_close(gauss_parameters[5], 120)):
-            # I check if the parameters(alfa,beta) are close 90 deg
-            # and gamma are close 120 deg
-            lt = 'HEXAGONAL'
-            ua = 'c'
-        elif(is_close(gauss_parameters[3], 90) and
-             is_close(gauss_parameters[4], 120) and
-             is_close(gauss_parameters[5], 90)):
-            # I check if the parameters(alfa,gamma) are close 90 deg
-            # and beta are close 120 deg
-            lt = 'HEXAGONAL'
-            ua = 'b'
-        elif(is_close(gauss_parameters[3], 120) and
-             is_close(gauss_parameters[4], 90) and
-             is_close(gauss_parameters[5], 90)):
-            # I check if the parameters(gamma,beta) are close 90 deg
-            # and alfa are close 120 deg
-            lt = 'HEXAGONAL'
-            ua = 'a'
-        elif(is_close(gauss_parameters[3], 90) and
-             is_close(gauss_parameters[4], 90)):
-            # I check if the parameters(alfa,beta) are close 90 deg
-            lt = 'MONOCLINIC'
-            ua = 'c'
-        elif(is_close(gauss_parameters[3], 90) and
-             is_close(gauss_parameters[5], 90)):
-            # I check if the parameters(alfa,gamma) are close 90 deg
-            lt = 'MONOCLINIC'
-            ua = 'b'
-        elif(is_close(gauss_parameters[4], 90) and
-             is_close(gauss_parameters[5], 90)):
-            # I check if the parameters(gamma,beta) are close 90 deg
-            lt = 'MONOCLINIC'
-            ua = 'a'
-        elif((is_close(gauss_parameters[3], gauss_parameters[4]) and
-              is_close(gauss_parameters[4], gauss_parameters[5])) and
-             (tolerance(gauss_parameters[0], gauss_parameters[1], 1.0) and
-              tolerance(gauss_parameters[1], gauss_parameters[2], 1.0))):
-            lt = 'RHOMBOHEDRAL'
-            ua = '*'
-        else:
-            lt = "TRICLINIC"
-            ua = '*'
-        return (lt, ua)
+        return self.engine.lattice_type(gauss_parameters)
 
     def group_centering(self):
         """Returns maximum centering group from crystal included list.
@@ -226,26 +193,7 @@ class CellExplorer:
 
             Name of centering.
         """
-        include_crystal = Span.get_crystals_included_list()
-        max_group = 0
-        # remember maximum group
-        centering = None
-        # type of centering
-        counter_group_centering = dict(zip(self.cryst_list,
-                                           [0]*(len(self.cryst_list))))
-        # counter for each centering
-        for crystal in include_crystal:
-            # search maximum group and this centring
-            # Which centering is most common?
-            counter_group_centering[crystal['centering']] += 1
-            if max_group < counter_group_centering[crystal['centering']]:
-                max_group = counter_group_centering[crystal['centering']]
-                centering = crystal['centering']
-        if max_group < len(include_crystal)*0.8:
-            # does it constitute 80% of included crystals?
-            # why 80% I don't know that was in original soft
-            return None
-        return centering
+        return self.engine.group_centering()
 
     def was_all_hist_selected(self):
         """Check all histograms and return true
@@ -272,37 +220,29 @@ class CellExplorer:
         if not self.was_all_hist_selected():
             print("Fit all six parameters first.")
             return
-        gauss_parameters = []
-        # centering is most common
-        centering = self.group_centering()
-        if centering is None:
-            print("Centering could not be determined unambiguously." +
-                  "Select the unit cells more decisively.")
-            return
-        # determination of  Gauss parameters
-        for hist in self.histogram_list:
-            m, s = stats.norm.fit(hist.data_included)
-            gauss_parameters.append(np.round(m, 2))
-        # start dialog window were we selected directory paths
-        # and file name
-        lattice_type, unique_axis = self.lattice_type(gauss_parameters)
-        output = ("CrystFEL unit cell file version 1.0" +
-                  "\nlattice_type = {}".format(lattice_type) +
-                  "\nunique_axis = {}".format(unique_axis) +
-                  "\ncentering = {}".format(centering) +
-                  "\na = {} A".format(gauss_parameters[0]) +
-                  "\nb = {} A".format(gauss_parameters[1]) +
-                  "\nc = {} A".format(gauss_parameters[2]) +
-                  "\nal = {} deg".format(gauss_parameters[3]) +
-                  "\nbe = {} deg".format(gauss_parameters[4]) +
-                  "\nga = {} deg".format(gauss_parameters[5]))
-        filename = "CrystFEL_unit_cell_file"
-        # the name of the file where the parameters will be saved
-        with open(filename, 'w') as file:
-            file.write(output)
-            # open file and save parameters
+        try:
+            self.engine.save_unit_cell()
+        except ValueError as err:
+            print(err)
         return
 
+    def export_stream(self, event):
+        """Writes the chunks with the selected crystals
+        to a new stream file next to the stream file.
+
+        Parameters
+        ----------
+        event : The class:`matplotlib.backend_bases.Event`.
+        """
+        root, extension = os.path.splitext(self.stream_name)
+        filename = root + "_selected" + extension
+        try:
+            chunks = self.engine.export_stream(filename)
+        except (OSError, ValueError) as err:
+            print(err)
+            return
+        print("{} chunks written to {}".format(chunks, filename))
+
     def home_reset(self, *kwargs, **kwkwargs):
         """Method used to set the initial
         state of all histograms with a button
@@ -314,12 +254,14 @@ class CellExplorer:
             ButtonBins.set_bins(self.bins)
         for bttn in self.buttons_list:
             bttn.reset_color()
+        self.engine.reset()
         if len(self.kwargs) == 0:
-            self.crystals_excluded.clear()
-            for hist_indx, hist_name in enumerate(self.histogram_order):
-                self.histogram_list[hist_indx].update(
-                    self.histograms_data[hist_name],
-                    self.crystals_excluded)
+            for hist in self.histogram_list:
+                hist.update()
+                hist.draw_green_space()
+            for panel in self.density_list:
+                panel.update()
+                panel.axs.figure.canvas.draw_idle()
         else:
             self.parameters_used()
         self.fig.canvas.draw()
@@ -353,24 +295,23 @@ class CellExplorer:
         event : The class:`matplotlib.backend_bases.Event`.
         """
         # Changing number of bins; Number is a power of 2. Max val. 512.
+        index = self.cross_filter.last_dimension
         if event.key == '+':
-            for index, boolean in enumerate(Span.get_all_used()):
-                if boolean:
-                    bins = self.histogram_list[index].bins
-                    if bins < 512:
-                        bins *= 2
-                        self.histogram_list[index].bins = bins
-                        self.histogram_list[index].update()
-                        self.histogram_list[index].draw_green_space()
+            if index is not None:
+                bins = self.histogram_list[index].bins
+                if bins < 512:
+                    bins *= 2
+                    self.histogram_list[index].bins = bins
+                    self.histogram_list[index].update()
+                    self.histogram_list[index].draw_green_space()
         elif event.key == '-':
-            for index, boolean in enumerate(Span.get_all_used()):
-                if boolean:
-                    bins = self.histogram_list[index].bins
-                    if bins > 2:
-                        bins /= 2
-                        self.histogram_list[index].bins = bins
-                        self.histogram_list[index].update()
-                        self.histogram_list[index].draw_green_space()
+            if index is not None:
+                bins = self.histogram_list[index].bins
+                if bins > 2:
+                    bins /= 2
+                    self.histogram_list[index].bins = bins
+                    self.histogram_list[index].update()
+                    self.histogram_list[index].draw_green_space()
         # Fitting selected range:
         if event.key == 'g':
             self.gauss_draw()
@@ -379,35 +320,53 @@ class CellExplorer:
     def gauss_draw(self):
         """Draw gauss graphs.
         """
-        for hist in self.histogram_list:
+        for hist_indx, hist in enumerate(self.histogram_list):
             hist.update()
             hist.draw_green_space()
-            m, s = stats.norm.fit(hist.data_included)
-            # Computing mu and sigma
-            lnspc = np.linspace(hist.current_xlim[0], hist.current_xlim[1], 80)
-            # Table 80 arguments x by equal distances [0,1,2]
-            pdf_g = stats.norm.pdf(lnspc, m, s)
-            # Theoretical value for our arguments
-            hist.axs.plot(lnspc, pdf_g)
-            # Setting for relative 3/4 of the height;
-            # each histogram has other y axis scale
-            # and maximum value.
-            position_y_text = 0.75*hist.axs.get_ylim()[1]
-            # Each text will begin with each histogram:
-            position_x_text = hist.current_xlim[0]
-            hist.axs.text(x=position_x_text, y=position_y_text, fontsize=10,
-                          s=r"$\mu = {}\ \sigma = {}$".format(np.round(m, 2),
-                                                              np.round(s, 2)))
+            # Fits are cached by the engine until the selection changes,
+            # the curve and the text are changed in place.
+            hist.draw_fit(*self.engine.fit(hist_indx))
             hist.axs.grid(True)
 
 
+def density_pair(text):
+    """Returns the pair of parameter names of the `--density` option
+    e.g. ('a', 'b') of 'a:b'.
+
+    Raises
+    ------
+    argparse.ArgumentTypeError
+        If the text isn't two names of `crystlib.HISTOGRAM_ORDER`
+        separated by colon.
+    """
+    names = text.split(':')
+    if len(names) != 2 or not set(names) <= set(HISTOGRAM_ORDER):
+        raise argparse.ArgumentTypeError(
+            "{!r} isn't X:Y with X and Y from {}".format(
+                text, ", ".join(HISTOGRAM_ORDER)))
+    return tuple(names)
+
+
 def main(argv=None):
     PARSER = argparse.ArgumentParser()
     PARSER.add_argument('filename', nargs=1, metavar="name.stream",
                         help="Download data from this file")
-    ARGS = PARSER.parse_args()
+    PARSER.add_argument('--auto', action='store_true',
+                        help="Propose the ranges around the largest clusters")
+    PARSER.add_argument('--density', nargs='+', metavar='X:Y', default=[],
+                        type=density_pair,
+                        help="Show 2-D densities of these pairs e.g. a:b")
+    PARSER.add_argument('--canonical', action='store_true',
+                        help="Bring the cells to the canonical setting")
+    PARSER.add_argument('--profile', metavar='FILE',
+                        help="Write timings of the phases to FILE" +
+                        " (.json, or .folded for flame graphs)")
+    ARGS = PARSER.parse_args(argv)
+    if ARGS.profile:
+        enable(ARGS.profile)
     streamfile = ARGS.filename[0]
-    CellExplorer(streamfile)
+    CellExplorer(streamfile, auto_ranges=ARGS.auto,
+                 density_pairs=ARGS.density, canonical=ARGS.canonical)
 
 
 if __name__ == '__main__':
@@ -36,8 +36,26 @@ program. If not, see <https://opensource.org/licenses/BSD-3-Clause>
 
 __version__ = "0.1.0"
 
-from .GUI_tools import *
-from .hdfsee import *
+import importlib
 
+# Public names with their modules, imported at the first use, so parsing
+# the streams in batch jobs doesn't import matplotlib and cfelpyutils.
+_LAZY = {'CellEngine': 'cell_engine',
+         'CellExplorer': 'GUI_tools',
+         'Image': 'hdfsee'}
 
-__all__ = GUI_tools.__all__ + hdfsee.__all__
+__all__ = list(_LAZY)
+
+
+def __getattr__(name):
+    if name in _LAZY:
+        module = importlib.import_module('.' + _LAZY[name], __name__)
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    raise AttributeError("module {!r} has no attribute {!r}".format(
+        __name__, name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
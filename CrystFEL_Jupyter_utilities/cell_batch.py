@@ -0,0 +1,218 @@
+"""Module for writing the unit cell files of many indexing stream
+files without the graphical interface.
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import logging
+import os
+
+from .cell_engine import CELL_FILE_NAMES, CellEngine
+from .crystlib import HISTOGRAM_ORDER
+
+# remove all the handlers.
+for handler in logging.root.handlers[:]:
+    logging.root.removeHandler(handler)
+LOGGER = logging.getLogger(__name__)
+# create console handler with a higher log level
+ch = logging.StreamHandler()
+# create formatter and add it to the handlers
+formatter = logging.Formatter(
+    '%(levelname)s | %(filename)s | %(funcName)s | %(lineno)d | %(message)s\n')
+ch.setFormatter(formatter)
+# add the handlers to logger
+LOGGER.addHandler(ch)
+LOGGER.setLevel("INFO")
+
+# Columns of the summary table.
+SUMMARY_COLUMNS = (['stream', 'crystals', 'selected', 'lattice_type',
+                    'unique_axis', 'centering'] + CELL_FILE_NAMES +
+                   ['cell_file', 'error'])
+
+
+def cell_file_name(streamfile, output_dir=None):
+    """Returns the name of the unit cell file for the stream file.
+
+    Parameters
+    ----------
+    streamfile : Python unicode str (on py3)
+
+        Path to stream file.
+    output_dir : Python unicode str (on py3)
+
+        Directory for the unit cell file.
+        Default: None, next to the stream file.
+
+    Returns
+    -------
+    filename : Python unicode str (on py3)
+
+        Path to the .cell file.
+    """
+    root, _ = os.path.splitext(streamfile)
+    if output_dir is not None:
+        root = os.path.join(output_dir, os.path.basename(root))
+    return root + '.cell'
+
+
+def process_stream(streamfile, ranges=None, auto=True, output_dir=None,
+                   robust=False, canonical=False):
+    """Determines the unit cell from one stream file and writes it.
+
+    Parameters
+    ----------
+    streamfile : Python unicode str (on py3)
+
+        Path to stream file.
+    ranges : dict
+
+        key- histogram order e.g. 'a', 'beta'
+        value - tuple (range).
+    auto : boolean
+
+        Propose the ranges which were not given.
+    output_dir : Python unicode str (on py3)
+
+        Directory for the unit cell file.
+        Default: None, next to the stream file.
+    robust : boolean
+
+        Use the medians instead of the gaussian means.
+    canonical : boolean
+
+        Bring the cells to the canonical setting first.
+
+    Returns
+    -------
+    row : dict
+
+        Row of the summary table, the error column has the reason
+        when the unit cell file was not written.
+    """
+    row = dict.fromkeys(SUMMARY_COLUMNS, '')
+    row['stream'] = streamfile
+    try:
+        if not os.path.isfile(streamfile):
+            # search_crystals_parameters would exit the worker.
+            raise FileNotFoundError("No such stream file")
+        engine = CellEngine.from_stream(streamfile, canonical)
+        row['crystals'] = len(engine.cross_filter)
+        engine.set_ranges(ranges or {})
+        if auto:
+            engine.select_clusters([name for name in HISTOGRAM_ORDER
+                                    if engine.ranges[name][0] is None])
+        row['selected'] = engine.cross_filter.included_count()
+        row.update(engine.cell_parameters(robust))
+        cell_file = cell_file_name(streamfile, output_dir)
+        engine.save_unit_cell(cell_file, robust)
+        row['cell_file'] = cell_file
+    except (OSError, ValueError) as err:
+        LOGGER.warning("{}: {}".format(streamfile, err))
+        row['error'] = str(err)
+    return row
+
+
+def process_streams(streamfiles, ranges=None, auto=True, output_dir=None,
+                    processes=None, robust=False, canonical=False):
+    """Determines the unit cells of many stream files in parallel.
+
+    Parameters
+    ----------
+    streamfiles : list
+
+        Paths to stream files.
+    ranges : dict
+
+        Ranges used for every stream file,
+        key- histogram order e.g. 'a', 'beta'
+        value - tuple (range).
+    auto : boolean
+
+        Propose the ranges which were not given.
+    output_dir : Python unicode str (on py3)
+
+        Directory for the unit cell files.
+    processes : int
+
+        Number of worker processes, 1 runs in this process.
+        Default: None, the number of CPUs.
+    robust : boolean
+
+        Use the medians instead of the gaussian means.
+    canonical : boolean
+
+        Bring the cells to the canonical setting first.
+
+    Returns
+    -------
+    rows : list
+
+        Rows of the summary table in the order of streamfiles.
+    """
+    arguments = [(streamfile, ranges, auto, output_dir, robust, canonical)
+                 for streamfile in streamfiles]
+    if processes == 1 or len(streamfiles) < 2:
+        return [process_stream(*args) for args in arguments]
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        return list(executor.map(process_stream, *zip(*arguments)))
+
+
+def write_summary(rows, filename):
+    """Writes the summary table as tab separated values.
+
+    Parameters
+    ----------
+    rows : list
+
+        Rows of the summary table.
+    filename : Python unicode str (on py3)
+
+        Path to the summary file.
+    """
+    with open(filename, 'w') as file:
+        file.write('\t'.join(SUMMARY_COLUMNS) + '\n')
+        for row in rows:
+            file.write('\t'.join(str(row[column])
+                                 for column in SUMMARY_COLUMNS) + '\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Write CrystFEL unit cell files of the stream files.")
+    parser.add_argument('filenames', nargs='+', metavar="name.stream",
+                        help="Download data from these files")
+    for name in HISTOGRAM_ORDER:
+        parser.add_argument('--' + name, nargs=2, type=float,
+                            metavar=('LEFT', 'RIGHT'),
+                            help="Range of interest of " + name)
+    parser.add_argument('--no-auto', action='store_true',
+                        help="Don't propose the ranges which weren't given")
+    parser.add_argument('--robust', action='store_true',
+                        help="Use the medians instead of the gaussian means")
+    parser.add_argument('--canonical', action='store_true',
+                        help="Bring the cells to the canonical setting")
+    parser.add_argument('-o', '--output-dir', metavar='DIR',
+                        help="Write the .cell files to this directory" +
+                        " (default: next to the stream files)")
+    parser.add_argument('-j', '--processes', type=int, default=None,
+                        help="Number of worker processes")
+    parser.add_argument('-s', '--summary', default='cell_summary.tsv',
+                        metavar='name.tsv', help="Summary table")
+    args = parser.parse_args(argv)
+    ranges = {name: tuple(getattr(args, name)) for name in HISTOGRAM_ORDER
+              if getattr(args, name) is not None}
+    if args.output_dir is not None:
+        os.makedirs(args.output_dir, exist_ok=True)
+    rows = process_streams(args.filenames, ranges=ranges,
+                           auto=not args.no_auto,
+                           output_dir=args.output_dir,
+                           processes=args.processes, robust=args.robust,
+                           canonical=args.canonical)
+    write_summary(rows, args.summary)
+    failed = sum(1 for row in rows if row['error'])
+    LOGGER.info("Unit cells written for {} of {} stream files".format(
+        len(rows) - failed, len(rows)))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    main()
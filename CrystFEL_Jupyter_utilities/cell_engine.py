@@ -0,0 +1,567 @@
+"""Module with the headless part of the cell explorer: crystals,
+selected ranges, binned counts and fits. It doesn't use matplotlib,
+so the unit cell can be determined in batch jobs.
+"""
+import numpy as np
+
+from .clusters import propose_ranges
+from .crossfilter import EXCLUDED, CrossFilter
+from .crystlib import (CENTERING_LIST, FINE_BINS, HISTOGRAM_ORDER,
+                       CrystalsTable, bin_boundaries, fine_range)
+from .stream_export import export_chunks
+from .stream_read import search_crystals_parameters
+
+__all__ = ['CellEngine']
+
+# Names of the parameters in the CrystFEL unit cell file.
+CELL_FILE_NAMES = ['a', 'b', 'c', 'al', 'be', 'ga']
+
+
+class CellEngine:
+    """Crystals from the indexing stream file with the ranges of interest
+    of the six unit cell parameters, the histograms counts and the fits.
+    The class:`GUI_tools.CellExplorer` is a view over it.
+
+    Attributes
+    ----------
+    all_crystals_list : list
+
+        All crystals.
+    crystals_table : The class:`crystlib.CrystalsTable`
+
+        Columnar view of all crystals.
+    cross_filter : The class:`crossfilter.CrossFilter`
+
+        Crystals in the ranges of interest and their counts.
+    streamfile : Python unicode str (on py3)
+
+        Path to stream file of the crystals, None if not known.
+    """
+
+    def __init__(self, crystal_list, canonical=False):
+        """
+        Parameters
+        ----------
+        crystal_list : list
+
+            A list of crystal.
+        canonical : boolean
+
+            Bring the cells to the canonical setting first, so equivalent
+            cells (e.g. with permuted axes) fall into the same peaks.
+        """
+        self.all_crystals_list = crystal_list
+        self.crystals_table = CrystalsTable(crystal_list, canonical)
+        self.cross_filter = CrossFilter(self.crystals_table)
+        self.streamfile = None
+        # Fits of the current selection.
+        self.__fits = {}
+        self.__fits_version = None
+
+    @classmethod
+    def from_stream(cls, streamfile, canonical=False):
+        """Creates the engine from crystals found in the stream file.
+
+        Parameters
+        ----------
+        streamfile : Python unicode str (on py3)
+
+            Path to stream file.
+        canonical : boolean
+
+            Bring the cells to the canonical setting first.
+        """
+        engine = cls(search_crystals_parameters(streamfile), canonical)
+        engine.streamfile = streamfile
+        return engine
+
+    @staticmethod
+    def dimension(name):
+        """Returns index of the unit cell parameter.
+
+        Parameters
+        ----------
+        name : str or int
+
+            Histogram name e.g. 'a', 'beta' or its index.
+        """
+        if isinstance(name, str):
+            return HISTOGRAM_ORDER.index(name)
+        return name
+
+    @property
+    def ranges(self):
+        """Dictionary with the range of interest of each parameter,
+        (None, None) when nothing was selected.
+        """
+        return dict(zip(HISTOGRAM_ORDER, self.cross_filter.ranges))
+
+    def set_range(self, name, left, right):
+        """Sets the range of interest of one parameter.
+
+        Parameters
+        ----------
+        name : str or int
+
+            Histogram name e.g. 'a', 'beta' or its index.
+        left : double
+
+            Left position of the range, None clears the range.
+        right : double
+
+            Right position of the range, None clears the range.
+        """
+        self.cross_filter.set_range(self.dimension(name), left, right)
+
+    def set_ranges(self, ranges):
+        """Sets the ranges of interest of given parameters.
+
+        Parameters
+        ----------
+        ranges : dict
+
+            key- histogram order e.g. 'a', 'beta'
+            value - tuple (range).
+        """
+        for name, (left, right) in ranges.items():
+            self.set_range(name, left, right)
+
+    def reset(self):
+        """Clears all ranges of interest.
+        """
+        self.cross_filter.reset()
+
+    def all_selected(self):
+        """Returns True if all parameters have the range of interest.
+        """
+        return all(left is not None
+                   for left, right in self.cross_filter.ranges)
+
+    def select_clusters(self, names=None, fraction=0.05):
+        """Sets the ranges of interest around the largest cluster of the
+        included crystals, one parameter after another, so each range
+        is found among the crystals selected by the previous ones.
+
+        Parameters
+        ----------
+        names : list
+
+            Histogram names e.g. 'a', 'beta'.
+            Default: None, all parameters.
+        fraction : double
+
+            Fraction of the cluster peak height at the edges of the range.
+
+        Returns
+        -------
+        ranges : dict
+
+            key- histogram order e.g. 'a', 'beta'
+            value - tuple (range), (None, None) when nothing was found.
+        """
+        if names is None:
+            names = HISTOGRAM_ORDER
+        ranges = {}
+        for name in names:
+            dimension = self.dimension(name)
+            # Included crystals of all centering types.
+            counts = self.cross_filter.fine_counts[dimension,
+                                                   :EXCLUDED].sum(axis=0)
+            left, right = propose_ranges(
+                counts[np.newaxis],
+                [self.cross_filter.value_ranges[dimension]], fraction)[0]
+            if left is not None:
+                self.set_range(dimension, left, right)
+            ranges[HISTOGRAM_ORDER[dimension]] = (left, right)
+        return ranges
+
+    def histogram_counts(self, name, bins):
+        """Returns counts of the histogram of one parameter.
+
+        Parameters
+        ----------
+        name : str or int
+
+            Histogram name e.g. 'a', 'beta' or its index.
+        bins : int
+
+            Number of bins.
+
+        Returns
+        -------
+        counts, edges : tuple
+
+            counts : The (9, bins) matrix with number of included crystals
+            of each centering and excluded crystals in the last row.
+            edges : bins + 1 edges of the bins.
+        """
+        dimension = self.dimension(name)
+        boundaries = bin_boundaries(bins)
+        counts = np.add.reduceat(self.cross_filter.fine_counts[dimension],
+                                 boundaries[:-1], axis=1)
+        minimum, maximum = fine_range(
+            *self.cross_filter.value_ranges[dimension])
+        edges = minimum + (maximum - minimum) * boundaries / FINE_BINS
+        return counts, edges
+
+    def density_counts(self, x_name, y_name, bins=128):
+        """Returns the 2-D histogram of the included crystals over a pair
+        of parameters, kept up to date with the selection.
+
+        Parameters
+        ----------
+        x_name : str or int
+
+            Histogram name e.g. 'a', 'beta' or its index, on the x axis.
+        y_name : str or int
+
+            Histogram name or its index, on the y axis.
+        bins : int
+
+            Number of bins along each axis.
+
+        Returns
+        -------
+        counts, x_edges, y_edges : tuple
+
+            counts : The (bins, bins) matrix with number of included
+            crystals, x along the first axis as in numpy.histogram2d.
+            x_edges, y_edges : bins + 1 edges of the bins.
+        """
+        x_index, y_index = self.dimension(x_name), self.dimension(y_name)
+        boundaries = bin_boundaries(bins)
+        edges = []
+        for dimension in (x_index, y_index):
+            minimum, maximum = fine_range(
+                *self.cross_filter.value_ranges[dimension])
+            edges.append(minimum + (maximum - minimum) * boundaries /
+                         FINE_BINS)
+        counts = self.cross_filter.pair_counts(x_index, y_index, bins)
+        return counts, edges[0], edges[1]
+
+    def fit(self, name, robust=False):
+        """Fits the gaussian to the included crystals. The mean and the
+        standard deviation come from the running sums of the crossfilter,
+        the robust ones (median and scaled median absolute deviation)
+        from the fine bins, so the cost doesn't grow with the number of
+        crystals. Fits are kept until the selection changes.
+
+        Parameters
+        ----------
+        name : str or int
+
+            Histogram name e.g. 'a', 'beta' or its index.
+        robust : boolean
+
+            Use the median and the median absolute deviation.
+
+        Returns
+        -------
+        mu, sigma : tuple
+
+            Parameters of the gaussian, NaN if nothing is included.
+        """
+        dimension = self.dimension(name)
+        if self.__fits_version != self.cross_filter.version:
+            self.__fits = {}
+            self.__fits_version = self.cross_filter.version
+        key = (dimension, robust)
+        if key not in self.__fits:
+            if robust:
+                self.__fits[key] = self.robust_fit(dimension)
+            else:
+                self.__fits[key] = self.cross_filter.moments(dimension)
+        return self.__fits[key]
+
+    def robust_fit(self, name):
+        """Returns the median and the scaled median absolute deviation
+        of the included crystals computed from the fine bins.
+
+        Parameters
+        ----------
+        name : str or int
+
+            Histogram name e.g. 'a', 'beta' or its index.
+
+        Returns
+        -------
+        mu, sigma : tuple
+
+            Parameters of the gaussian, NaN if nothing is included.
+        """
+        dimension = self.dimension(name)
+        counts = self.cross_filter.fine_counts[dimension,
+                                               :EXCLUDED].sum(axis=0)
+        total = counts.sum()
+        if total == 0:
+            return np.nan, np.nan
+        minimum, maximum = fine_range(
+            *self.cross_filter.value_ranges[dimension])
+        centers = (minimum + (maximum - minimum) *
+                   (np.arange(FINE_BINS) + 0.5) / FINE_BINS)
+        median = centers[np.searchsorted(np.cumsum(counts), total / 2)]
+        distance = np.abs(centers - median)
+        order = np.argsort(distance, kind='stable')
+        deviation = distance[order][
+            np.searchsorted(np.cumsum(counts[order]), total / 2)]
+        return median, 1.4826 * deviation
+
+    def fits(self, robust=False):
+        """Returns list with (mu, sigma) of each parameter.
+
+        Parameters
+        ----------
+        robust : boolean
+
+            Use the median and the median absolute deviation.
+        """
+        return [self.fit(dimension, robust)
+                for dimension in range(len(HISTOGRAM_ORDER))]
+
+    def group_centering(self):
+        """Returns maximum centering group from crystal included list.
+        More than 80% all crystals.
+
+        Returns
+        -------
+        centering : Python unicode str (on py3)
+
+            Name of centering.
+        """
+        # Which centering is most common?
+        counter_group_centering = self.cross_filter.centering_counts()
+        max_group = counter_group_centering.max()
+        if (max_group == 0 or
+                max_group < self.cross_filter.included_count()*0.8):
+            # does it constitute 80% of included crystals?
+            # why 80% I don't know that was in original soft
+            return None
+        return CENTERING_LIST[counter_group_centering.argmax()]
+
+    @staticmethod
+    def lattice_type(gauss_parameters):
+        """Returns lattice type and unique_axis
+        gauss_parameters = [a, b, c, alfa, beta, gamma]
+
+        Parameters
+        ----------
+        gauss_parameters : list
+
+            Gauss parameters for each type of histogram
+
+        Returns
+        -------
+        lt, ua : tuple
+
+            Lattice type and unique axis.
+        """
+        def tolerance(a, b, percent):
+            if abs(a-b) < abs(a)*(percent/100):
+                return True
+            return False
+
+        def is_close(a, b): return abs(a-b) < 0.3
+
+        if(is_close(gauss_parameters[3], 90) and
+           is_close(gauss_parameters[4], 90) and
+           is_close(gauss_parameters[5], 90)):
+            # I check if the parameters(alfa,beta,gamma) are close 90 deg
+            if(tolerance(gauss_parameters[0], gauss_parameters[1], 1.0) and
+               tolerance(gauss_parameters[1], gauss_parameters[2], 1.0)):
+                lt = "CUBIC"
+                ua = '*'
+            elif tolerance(gauss_parameters[0], gauss_parameters[1], 1.0):
+                lt = 'TETRAGONAL'
+                ua = 'c'
+            elif tolerance(gauss_parameters[0], gauss_parameters[2], 1.0):
+                lt = 'TETRAGONAL'
+                ua = 'b'
+            elif tolerance(gauss_parameters[1], gauss_parameters[2], 1.0):
+                lt = 'TETRAGONAL'
+                ua = 'a'
+            else:
+                lt = 'ORTHORHOMBIC'
+                ua = '*'
+        elif(is_close(gauss_parameters[3], 90) and
+             is_close(gauss_parameters[4], 90) and
+             is_close(gauss_parameters[5], 120)):
+            # I check if the parameters(alfa,beta) are close 90 deg
+            # and gamma are close 120 deg
+            lt = 'HEXAGONAL'
+            ua = 'c'
+        elif(is_close(gauss_parameters[3], 90) and
+             is_close(gauss_parameters[4], 120) and
+             is_close(gauss_parameters[5], 90)):
+            # I check if the parameters(alfa,gamma) are close 90 deg
+            # and beta are close 120 deg
+            lt = 'HEXAGONAL'
+            ua = 'b'
+        elif(is_close(gauss_parameters[3], 120) and
+             is_close(gauss_parameters[4], 90) and
+             is_close(gauss_parameters[5], 90)):
+            # I check if the parameters(gamma,beta) are close 90 deg
+            # and alfa are close 120 deg
+            lt = 'HEXAGONAL'
+            ua = 'a'
+        elif(is_close(gauss_parameters[3], 90) and
+             is_close(gauss_parameters[4], 90)):
+            # I check if the parameters(alfa,beta) are close 90 deg
+            lt = 'MONOCLINIC'
+            ua = 'c'
+        elif(is_close(gauss_parameters[3], 90) and
+             is_close(gauss_parameters[5], 90)):
+            # I check if the parameters(alfa,gamma) are close 90 deg
+            lt = 'MONOCLINIC'
+            ua = 'b'
+        elif(is_close(gauss_parameters[4], 90) and
+             is_close(gauss_parameters[5], 90)):
+            # I check if the parameters(gamma,beta) are close 90 deg
+            lt = 'MONOCLINIC'
+            ua = 'a'
+        elif((is_close(gauss_parameters[3], gauss_parameters[4]) and
+              is_close(gauss_parameters[4], gauss_parameters[5])) and
+             (tolerance(gauss_parameters[0], gauss_parameters[1], 1.0) and
+              tolerance(gauss_parameters[1], gauss_parameters[2], 1.0))):
+            lt = 'RHOMBOHEDRAL'
+            ua = '*'
+        else:
+            lt = "TRICLINIC"
+            ua = '*'
+        return (lt, ua)
+
+    def cell_parameters(self, robust=False):
+        """Returns the unit cell determined from the selected crystals.
+
+        Parameters
+        ----------
+        robust : boolean
+
+            Use the medians instead of the gaussian means.
+
+        Returns
+        -------
+        cell : dict
+
+            lattice_type, unique_axis, centering and the gaussian
+            means of a, b, c, al, be, ga.
+
+        Raises
+        ------
+        ValueError
+
+            When not all parameters were selected or the
+            centering could not be determined.
+        """
+        if not self.all_selected():
+            raise ValueError("Fit all six parameters first.")
+        # centering is most common
+        centering = self.group_centering()
+        if centering is None:
+            raise ValueError("Centering could not be determined "
+                             "unambiguously. Select the unit cells "
+                             "more decisively.")
+        # determination of  Gauss parameters
+        gauss_parameters = [np.round(m, 2) for m, s in self.fits(robust)]
+        lattice_type, unique_axis = self.lattice_type(gauss_parameters)
+        cell = {'lattice_type': lattice_type, 'unique_axis': unique_axis,
+                'centering': centering}
+        cell.update(zip(CELL_FILE_NAMES, gauss_parameters))
+        return cell
+
+    def unit_cell(self, robust=False):
+        """Returns the CrystFEL unit cell file content.
+
+        Parameters
+        ----------
+        robust : boolean
+
+            Use the medians instead of the gaussian means.
+
+        Returns
+        -------
+        output : Python unicode str (on py3)
+
+            The unit cell file.
+
+        Raises
+        ------
+        ValueError
+
+            When the unit cell could not be determined.
+        """
+        cell = self.cell_parameters(robust)
+        output = ("CrystFEL unit cell file version 1.0" +
+                  "\nlattice_type = {}".format(cell['lattice_type']) +
+                  "\nunique_axis = {}".format(cell['unique_axis']) +
+                  "\ncentering = {}".format(cell['centering']) +
+                  "\na = {} A".format(cell['a']) +
+                  "\nb = {} A".format(cell['b']) +
+                  "\nc = {} A".format(cell['c']) +
+                  "\nal = {} deg".format(cell['al']) +
+                  "\nbe = {} deg".format(cell['be']) +
+                  "\nga = {} deg".format(cell['ga']))
+        return output
+
+    def save_unit_cell(self, filename="CrystFEL_unit_cell_file",
+                       robust=False):
+        """Writes the crystallography parameters to the file.
+
+        Parameters
+        ----------
+        filename : Python unicode str (on py3)
+
+            The name of the file where the parameters will be saved.
+        robust : boolean
+
+            Use the medians instead of the gaussian means.
+
+        Raises
+        ------
+        ValueError
+
+            When the unit cell could not be determined.
+        """
+        output = self.unit_cell(robust)
+        with open(filename, 'w') as file:
+            file.write(output)
+
+    def selected_chunks(self):
+        """Returns chunks of the stream file with the included crystals.
+
+        Returns
+        -------
+        chunks : numpy.ndarray
+
+            Sorted indices of the chunks.
+        """
+        chunks = self.crystals_table.chunk[self.cross_filter.included]
+        return np.unique(chunks[chunks >= 0])
+
+    def export_stream(self, filename):
+        """Writes the chunks with the included crystals to a new stream
+        file, e.g. for partialator. Chunks are copied as they are, also
+        the other crystals of the same images.
+
+        Parameters
+        ----------
+        filename : Python unicode str (on py3)
+
+            Path to the new stream file.
+
+        Returns
+        -------
+        chunks : int
+
+            Number of written chunks.
+
+        Raises
+        ------
+        ValueError
+
+            When the crystals don't come from a stream file.
+        """
+        if self.streamfile is None:
+            raise ValueError("The crystals don't come from a stream file.")
+        chunks = self.selected_chunks()
+        export_chunks(self.streamfile, filename, chunks)
+        return len(chunks)
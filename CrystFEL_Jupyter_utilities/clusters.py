@@ -0,0 +1,304 @@
+"""Module for finding clusters of the unit cell parameters in the
+binned counts, used to propose the ranges of interest.
+"""
+import numpy as np
+
+from .crystlib import FINE_BINS, fine_range
+
+
+def bandwidth(counts):
+    """Returns the bandwidth of the kernel density estimate of each row
+    of binned counts (Silverman's rule of thumb with the smallest of the
+    standard deviation, interquartile range and median absolute deviation
+    estimates of the spread), in bins.
+
+    Parameters
+    ----------
+    counts : numpy.ndarray
+
+        The (D, bins) matrix with counts.
+
+    Returns
+    -------
+    bandwidth : numpy.ndarray
+
+        D bandwidths, at least one bin.
+    """
+    counts = np.asarray(counts, dtype=float)
+    total = counts.sum(axis=1)
+    safe_total = np.maximum(total, 1)
+    centers = np.arange(counts.shape[1]) + 0.5
+    mean = counts @ centers / safe_total
+    variance = counts @ centers**2 / safe_total - mean**2
+    std = np.sqrt(np.maximum(variance, 0))
+    cumulative = np.cumsum(counts, axis=1)
+    first_quartile = np.argmax(cumulative >= 0.25 * total[:, np.newaxis],
+                               axis=1)
+    third_quartile = np.argmax(cumulative >= 0.75 * total[:, np.newaxis],
+                               axis=1)
+    median = np.argmax(cumulative >= 0.5 * total[:, np.newaxis], axis=1)
+    # Weighted median of the distances from the median.
+    distance = np.abs(centers - (median[:, np.newaxis] + 0.5))
+    order = np.argsort(distance, axis=1, kind='stable')
+    cumulative = np.cumsum(np.take_along_axis(counts, order, axis=1), axis=1)
+    deviation = np.take_along_axis(
+        distance, order, axis=1)[np.arange(len(counts)), np.argmax(
+            cumulative >= 0.5 * total[:, np.newaxis], axis=1)]
+    spreads = np.array([std, (third_quartile - first_quartile) / 1.34,
+                        1.4826 * deviation])
+    # Estimates equal 0 for very narrow peaks.
+    spreads[spreads <= 0] = np.inf
+    spread = spreads.min(axis=0)
+    spread = np.where(np.isfinite(spread), spread, 0)
+    return np.maximum(0.9 * spread * safe_total**-0.2, 1.0)
+
+
+def smooth_counts(counts, sigma=None):
+    """Kernel density estimate from binned counts:
+    counts convolved with a gaussian.
+
+    Parameters
+    ----------
+    counts : numpy.ndarray
+
+        The (D, bins) matrix with counts.
+    sigma : numpy.ndarray
+
+        Width of the gaussian for each row, in bins.
+        Default: None, Silverman's rule of thumb.
+
+    Returns
+    -------
+    density : numpy.ndarray
+
+        The (D, bins) matrix with smoothed counts.
+    """
+    # Imported here, scipy takes longer to import than stream parsing.
+    from scipy.ndimage import gaussian_filter1d
+
+    counts = np.asarray(counts, dtype=float)
+    if sigma is None:
+        sigma = bandwidth(counts)
+    return np.array([gaussian_filter1d(row, width, mode='constant')
+                     for row, width in zip(counts, sigma)])
+
+
+def find_peaks(density, min_height=0.05):
+    """Returns local maxima of the density higher than
+    min_height of the highest one.
+
+    Parameters
+    ----------
+    density : numpy.ndarray
+
+        Smoothed counts of one parameter.
+    min_height : double
+
+        Fraction of the highest maximum.
+
+    Returns
+    -------
+    peaks : numpy.ndarray
+
+        Bins of the maxima, in increasing order.
+    """
+    padded = np.concatenate(([-np.inf], density, [-np.inf]))
+    is_peak = ((padded[1:-1] > padded[:-2]) & (padded[1:-1] >= padded[2:]) &
+               (density > 0))
+    peaks = np.flatnonzero(is_peak)
+    if len(peaks) == 0:
+        return peaks
+    return peaks[density[peaks] >= min_height * density[peaks].max()]
+
+
+def merge_peaks(density, peaks, depth=0.5):
+    """Drops the lower of two neighbouring peaks when the valley between
+    them is shallow, so noise does not split a cluster.
+
+    Parameters
+    ----------
+    density : numpy.ndarray
+
+        Smoothed counts of one parameter.
+    peaks : numpy.ndarray
+
+        Bins of the maxima, in increasing order.
+    depth : double
+
+        The valley must be lower than depth of the lower peak.
+
+    Returns
+    -------
+    peaks : numpy.ndarray
+
+        Bins of the remaining maxima, in increasing order.
+    """
+    peaks = list(peaks)
+    index = 0
+    while index + 1 < len(peaks):
+        left, right = peaks[index], peaks[index + 1]
+        valley = density[left:right + 1].min()
+        if valley > depth * min(density[left], density[right]):
+            # Keep the higher one and compare it with the next.
+            del peaks[index + (density[left] >= density[right])]
+            index = max(index - 1, 0)
+        else:
+            index += 1
+    return np.array(peaks, dtype=int)
+
+
+def peak_bounds(density, peaks, peak, fraction=0.05):
+    """Returns bins of the cluster around the peak: the density is
+    above fraction of the peak height and the cluster does not cross
+    the lowest point between the peak and its neighbours.
+
+    Parameters
+    ----------
+    density : numpy.ndarray
+
+        Smoothed counts of one parameter.
+    peaks : numpy.ndarray
+
+        All significant peaks, in increasing order.
+    peak : int
+
+        Bin of the peak.
+    fraction : double
+
+        Fraction of the peak height at the edges of the cluster.
+
+    Returns
+    -------
+    start, stop : tuple
+
+        The cluster is in bins [start, stop).
+    """
+    position = np.searchsorted(peaks, peak)
+    # Valleys between the peak and the neighbouring peaks.
+    left_limit = 0
+    if position > 0:
+        previous = peaks[position - 1]
+        left_limit = previous + np.argmin(density[previous:peak + 1])
+    right_limit = len(density) - 1
+    if position + 1 < len(peaks):
+        following = peaks[position + 1]
+        right_limit = peak + np.argmin(density[peak:following + 1])
+    above = density >= fraction * density[peak]
+    below_left = np.flatnonzero(~above[left_limit:peak])
+    start = left_limit if len(below_left) == 0 else \
+        left_limit + below_left[-1] + 1
+    below_right = np.flatnonzero(~above[peak:right_limit + 1])
+    stop = right_limit + 1 if len(below_right) == 0 else \
+        peak + below_right[0]
+    return int(start), int(stop)
+
+
+def find_clusters(counts, fraction=0.05, min_height=0.05):
+    """Finds clusters in each row of the binned counts. The bandwidth
+    estimated from the whole row smooths too much when there are
+    several clusters, so it is estimated again from the counts
+    of the largest cluster found with it.
+
+    Parameters
+    ----------
+    counts : numpy.ndarray
+
+        The (D, bins) matrix with counts.
+    fraction : double
+
+        Fraction of the peak height at the edges of the clusters.
+    min_height : double
+
+        Clusters lower than min_height of the highest one are ignored.
+
+    Returns
+    -------
+    clusters : list
+
+        For each row list of (start, stop, size) clusters, sorted
+        from the largest one. Bins are [start, stop).
+    """
+    counts = np.asarray(counts)
+    clusters = row_clusters(counts, smooth_counts(counts), fraction,
+                            min_height)
+    largest = np.zeros(counts.shape)
+    for row, found in enumerate(clusters):
+        if found:
+            start, stop, size = found[0]
+            largest[row, start:stop] = counts[row, start:stop]
+    return row_clusters(counts, smooth_counts(counts, bandwidth(largest)),
+                        fraction, min_height)
+
+
+def row_clusters(counts, density, fraction, min_height):
+    """Finds clusters in each row of the smoothed counts.
+
+    Parameters
+    ----------
+    counts : numpy.ndarray
+
+        The (D, bins) matrix with counts.
+    density : numpy.ndarray
+
+        The (D, bins) matrix with smoothed counts.
+    fraction : double
+
+        Fraction of the peak height at the edges of the clusters.
+    min_height : double
+
+        Clusters lower than min_height of the highest one are ignored.
+
+    Returns
+    -------
+    clusters : list
+
+        For each row list of (start, stop, size) clusters, sorted
+        from the largest one. Bins are [start, stop).
+    """
+    clusters = []
+    for row_counts, row_density in zip(counts, density):
+        peaks = merge_peaks(row_density, find_peaks(row_density, min_height))
+        found = []
+        for peak in peaks:
+            start, stop = peak_bounds(row_density, peaks, peak, fraction)
+            found.append((int(start), int(stop),
+                          int(row_counts[start:stop].sum())))
+        found.sort(key=lambda cluster: -cluster[2])
+        clusters.append(found)
+    return clusters
+
+
+def propose_ranges(fine_counts, value_ranges, fraction=0.05):
+    """Proposes the ranges of interest around the largest cluster
+    of each parameter.
+
+    Parameters
+    ----------
+    fine_counts : numpy.ndarray
+
+        The (D, FINE_BINS) matrix with counts.
+    value_ranges : list
+
+        (min, max) range of the fine bins of each parameter.
+    fraction : double
+
+        Fraction of the peak height at the edges of the ranges.
+
+    Returns
+    -------
+    ranges : list
+
+        (left, right) range of each parameter,
+        (None, None) if there are no counts.
+    """
+    ranges = []
+    for row_clusters, value_range in zip(
+            find_clusters(fine_counts, fraction), value_ranges):
+        if len(row_clusters) == 0:
+            ranges.append((None, None))
+            continue
+        start, stop, size = row_clusters[0]
+        minimum, maximum = fine_range(*value_range)
+        width = (maximum - minimum) / FINE_BINS
+        ranges.append((minimum + start * width, minimum + stop * width))
+    return ranges
@@ -0,0 +1,396 @@
+"""Module for the incremental selection of the crystals
+in the regions of interest of the six histograms.
+"""
+import numpy as np
+
+from .crystlib import (CENTERING_LIST, FINE_BINS, bin_boundaries,
+                       fine_bin_index)
+
+# Row of the excluded crystals in the fine counts,
+# after the rows of the centering types.
+EXCLUDED = len(CENTERING_LIST)
+
+
+class CrossFilter:
+    """Selection of the crystals in the ranges of interest of all
+    histograms updated incrementally: a change of one range touches
+    only the crystals entering or leaving it, found in the sorted index
+    of this parameter, and moves only their counts in the histograms.
+
+    Attributes
+    ----------
+    parameters : numpy.ndarray
+
+        The (N, 6) matrix with unit cell parameters of each crystal.
+    centering : numpy.ndarray
+
+        Index of the centering type of each crystal in `CENTERING_LIST`,
+        -1 for unknown centering.
+    order : numpy.ndarray
+
+        The (N, 6) matrix, for each parameter the crystals
+        sorted by its value.
+    sorted_values : numpy.ndarray
+
+        The (N, 6) matrix with the sorted values of each parameter.
+    value_ranges : list
+
+        (min, max) of each parameter, the range of the fine bins.
+    fine_index : numpy.ndarray
+
+        The (N, 6) matrix with the fine bin of each parameter
+        of each crystal.
+    ranges : list
+
+        (left, right) range of interest of each parameter,
+        (None, None) when nothing was selected.
+    positions : list
+
+        (start, stop) positions of the range of interest
+        in the sorted values of each parameter.
+    filters : numpy.ndarray
+
+        For each crystal bit mask of the parameters whose range
+        of interest does not contain it. 0 for the included crystals.
+    fine_counts : numpy.ndarray
+
+        The (6, 9, FINE_BINS) cube with number of included crystals
+        of each centering (and excluded crystals in the last row)
+        in the fine bins of each parameter.
+    reference : numpy.ndarray
+
+        Mean of each parameter of all crystals, subtracted from the values
+        in the sums below to keep them accurate.
+    value_sums : numpy.ndarray
+
+        Sum of each parameter (minus reference) of the included crystals
+        with known centering, the ones counted in the centering rows.
+    square_sums : numpy.ndarray
+
+        Sum of squares of each parameter (minus reference)
+        of the same crystals.
+    last_dimension : int
+
+        Index of the parameter whose range was changed last,
+        None after reset.
+    version : int
+
+        Increased on every change of the selection.
+    pairs : dict
+
+        key - (x, y, bins) pair of parameters and number of bins,
+        value - the (bins, bins) matrix with number of included crystals
+        in the 2-D bins, kept up to date like fine_counts.
+    """
+
+    def __init__(self, crystals_table):
+        """
+        Parameters
+        ----------
+        crystals_table : The class:`crystlib.CrystalsTable`
+
+            Columnar view of all crystals.
+        """
+        self.parameters = crystals_table.parameters
+        self.centering = crystals_table.centering
+        size, dimensions = self.parameters.shape
+        self.order = np.argsort(self.parameters, axis=0, kind='stable')
+        self.sorted_values = np.take_along_axis(self.parameters, self.order,
+                                                axis=0)
+        if size:
+            self.value_ranges = [(self.sorted_values[0, dimension],
+                                  self.sorted_values[-1, dimension])
+                                 for dimension in range(dimensions)]
+        else:
+            self.value_ranges = [(0.0, 0.0)] * dimensions
+        self.fine_index = np.empty((size, dimensions), dtype=np.intp)
+        for dimension, (minimum, maximum) in enumerate(self.value_ranges):
+            self.fine_index[:, dimension] = fine_bin_index(
+                self.parameters[:, dimension], minimum, maximum)
+        self.filters = np.zeros(size, dtype=np.uint8)
+        self.fine_counts = np.zeros((dimensions, EXCLUDED + 1, FINE_BINS),
+                                    dtype=np.int64)
+        self.reference = (self.parameters.mean(axis=0) if size
+                          else np.zeros(dimensions))
+        self.value_sums = np.zeros(dimensions)
+        self.square_sums = np.zeros(dimensions)
+        self.version = 0
+        self.pairs = {}
+        self.reset()
+
+    def __len__(self):
+        return len(self.parameters)
+
+    def reset(self):
+        """Clears all ranges of interest, all crystals are included.
+        """
+        size, dimensions = self.parameters.shape
+        self.ranges = [(None, None)] * dimensions
+        self.positions = [(0, size)] * dimensions
+        self.last_dimension = None
+        self.version += 1
+        self.filters[:] = 0
+        self.fine_counts[:] = 0
+        known = self.centering >= 0
+        values = self.parameters[known] - self.reference
+        self.value_sums = values.sum(axis=0)
+        self.square_sums = (values**2).sum(axis=0)
+        for x_index, y_index, bins in self.pairs:
+            self.pairs[x_index, y_index, bins][:] = np.bincount(
+                self.pair_index(x_index, y_index, bins),
+                minlength=bins * bins).reshape(bins, bins)
+        for dimension in range(dimensions):
+            self.fine_counts[dimension, :EXCLUDED] = np.bincount(
+                self.centering[known] * FINE_BINS +
+                self.fine_index[known, dimension],
+                minlength=EXCLUDED * FINE_BINS).reshape(EXCLUDED, FINE_BINS)
+
+    def search_positions(self, dimension, left, right):
+        """Returns positions of the range in the sorted values.
+
+        Parameters
+        ----------
+        dimension : int
+
+            Index of the parameter.
+        left : double
+
+            Left position of the range, None for the whole range.
+        right : double
+
+            Right position of the range, None for the whole range.
+
+        Returns
+        -------
+        start, stop : tuple
+
+            The crystals order[start:stop] are in the range.
+        """
+        if left is None or right is None:
+            return 0, len(self.parameters)
+        values = self.sorted_values[:, dimension]
+        return (int(np.searchsorted(values, left, side='left')),
+                int(np.searchsorted(values, right, side='right')))
+
+    def set_range(self, dimension, left, right):
+        """Changes the range of interest of one parameter.
+
+        Parameters
+        ----------
+        dimension : int
+
+            Index of the parameter.
+        left : double
+
+            Left position of the range, None clears the range.
+        right : double
+
+            Right position of the range, None clears the range.
+
+        Returns
+        -------
+        entering, leaving : tuple
+
+            Arrays with crystals which were included
+            and excluded by the change.
+        """
+        if left is None or right is None:
+            left = right = None
+        old_start, old_stop = self.positions[dimension]
+        start, stop = self.search_positions(dimension, left, right)
+        self.ranges[dimension] = (left, right)
+        self.positions[dimension] = (start, stop)
+        self.last_dimension = dimension
+        self.version += 1
+        # Crystals in only one of the old and new ranges
+        # (symmetric difference of the two intervals).
+        if max(start, old_start) >= min(stop, old_stop):
+            intervals = [(old_start, old_stop), (start, stop)]
+        else:
+            intervals = [(min(start, old_start), max(start, old_start)),
+                         (min(stop, old_stop), max(stop, old_stop))]
+        rows = self.order[np.concatenate(
+            [np.arange(first, last) for first, last in intervals]),
+            dimension]
+        was_included = self.filters[rows] == 0
+        self.filters[rows] ^= np.uint8(1 << dimension)
+        is_included = self.filters[rows] == 0
+        entering = rows[is_included & ~was_included]
+        leaving = rows[was_included & ~is_included]
+        self.move_counts(entering, 1)
+        self.move_counts(leaving, -1)
+        return entering, leaving
+
+    def move_counts(self, rows, sign):
+        """Moves counts of the crystals between the row of their
+        centering and the excluded row in all histograms.
+
+        Parameters
+        ----------
+        rows : numpy.ndarray
+
+            The crystals.
+        sign : int
+
+            1 for the included crystals, -1 for the excluded.
+        """
+        if len(rows) == 0:
+            return
+        known = self.centering[rows] >= 0
+        values = self.parameters[rows[known]] - self.reference
+        self.value_sums += sign * values.sum(axis=0)
+        self.square_sums += sign * (values**2).sum(axis=0)
+        for (x_index, y_index, bins), counts in self.pairs.items():
+            pair_index = self.pair_index(x_index, y_index, bins, rows)
+            if len(rows) < bins * bins:
+                np.add.at(counts.ravel(), pair_index, sign)
+            else:
+                counts += sign * np.bincount(
+                    pair_index, minlength=bins * bins).reshape(bins, bins)
+        if len(rows) < EXCLUDED * FINE_BINS:
+            # Few crystals: scatter them straight into the counts.
+            dimensions = np.arange(self.parameters.shape[1])
+            fine_index = self.fine_index[rows]
+            np.add.at(self.fine_counts, (dimensions, EXCLUDED, fine_index),
+                      -sign)
+            np.add.at(self.fine_counts,
+                      (dimensions, self.centering[rows][known, np.newaxis],
+                       fine_index[known]), sign)
+            return
+        # Many crystals: count them first, one histogram at a time.
+        centering = self.centering[rows][known]
+        for dimension in range(self.parameters.shape[1]):
+            fine_index = self.fine_index[rows, dimension]
+            self.fine_counts[dimension, EXCLUDED] -= sign * np.bincount(
+                fine_index, minlength=FINE_BINS)
+            self.fine_counts[dimension, :EXCLUDED] += sign * np.bincount(
+                centering * FINE_BINS + fine_index[known],
+                minlength=EXCLUDED * FINE_BINS).reshape(EXCLUDED, FINE_BINS)
+
+    def pair_index(self, x_index, y_index, bins, rows=None):
+        """Returns the flat index of the 2-D bin of each crystal,
+        the 2-D bins are sums of the fine bins like in the histograms.
+
+        Parameters
+        ----------
+        x_index : int
+
+            Index of the parameter on the x axis.
+        y_index : int
+
+            Index of the parameter on the y axis.
+        bins : int
+
+            Number of bins along each axis.
+        rows : numpy.ndarray
+
+            The crystals. Default: None, all crystals.
+
+        Returns
+        -------
+        index : numpy.ndarray
+
+            x bin * bins + y bin of each crystal.
+        """
+        if rows is None:
+            rows = slice(None)
+        # The bin of each fine bin.
+        coarse = np.repeat(np.arange(bins), np.diff(bin_boundaries(bins)))
+        return (coarse[self.fine_index[rows, x_index]] * bins +
+                coarse[self.fine_index[rows, y_index]])
+
+    def pair_counts(self, x_index, y_index, bins=128):
+        """Returns the 2-D histogram of the included crystals over a pair
+        of parameters, like numpy.histogram2d over the ranges of the fine
+        bins. The matrix is kept up to date with the selection.
+
+        Parameters
+        ----------
+        x_index : int
+
+            Index of the parameter on the x axis.
+        y_index : int
+
+            Index of the parameter on the y axis.
+        bins : int
+
+            Number of bins along each axis.
+
+        Returns
+        -------
+        counts : numpy.ndarray
+
+            The (bins, bins) matrix, x along the first axis.
+        """
+        key = (x_index, y_index, bins)
+        if key not in self.pairs:
+            included = np.flatnonzero(self.filters == 0)
+            self.pairs[key] = np.bincount(
+                self.pair_index(x_index, y_index, bins, included),
+                minlength=bins * bins).reshape(bins, bins)
+        return self.pairs[key]
+
+    def moments(self, dimension):
+        """Returns mean and standard deviation of one parameter of the
+        included crystals with known centering, from the running sums.
+
+        Parameters
+        ----------
+        dimension : int
+
+            Index of the parameter.
+
+        Returns
+        -------
+        mean, std : tuple
+
+            NaN when there are no such crystals.
+        """
+        count = self.fine_counts[dimension, :EXCLUDED].sum()
+        if count == 0:
+            return np.nan, np.nan
+        mean = self.value_sums[dimension] / count
+        variance = self.square_sums[dimension] / count - mean**2
+        return (self.reference[dimension] + mean,
+                np.sqrt(max(variance, 0.0)))
+
+    @property
+    def included(self):
+        """Boolean array, True for the crystals in the region of interest.
+        """
+        return self.filters == 0
+
+    def included_count(self):
+        """Returns the number of crystals in the region of interest.
+        """
+        return int(np.count_nonzero(self.filters == 0))
+
+    def included_values(self, dimension):
+        """Returns values of one parameter of the included crystals.
+
+        Parameters
+        ----------
+        dimension : int
+
+            Index of the parameter.
+
+        Returns
+        -------
+        values : numpy.ndarray
+
+            Values of the parameter.
+        """
+        return self.parameters[self.filters == 0, dimension]
+
+    def centering_counts(self):
+        """Returns the number of included crystals of each centering.
+
+        Returns
+        -------
+        counts : numpy.ndarray
+
+            Counts in the `CENTERING_LIST` order.
+        """
+        centering = self.centering[(self.filters == 0) &
+                                   (self.centering >= 0)]
+        return np.bincount(centering, minlength=EXCLUDED)
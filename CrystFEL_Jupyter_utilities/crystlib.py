@@ -1,5 +1,88 @@
 """Module for getting crystals info from input indexing stream file.
 """
+import numpy as np
+
+from .profiling import timed
+from .reduction import canonical_cells
+
+HISTOGRAM_ORDER = ['a', 'b', 'c', 'alfa', 'beta', 'gamma']
+CENTERING_LIST = ['P', 'A', 'B', 'C', 'I', 'F', 'H', 'R']
+# Number of the high-resolution bins kept for each histogram,
+# the displayed bins are sums of adjacent fine bins.
+FINE_BINS = 4096
+
+
+def fine_range(minimum, maximum):
+    """Returns the range covered by the fine bins.
+
+    Parameters
+    ----------
+    minimum : double
+
+        Minimum of the data.
+    maximum : double
+
+        Maximum of the data.
+
+    Returns
+    -------
+    minimum, maximum : tuple
+
+        Range of the fine bins.
+    """
+    if minimum == maximum:
+        # The same as numpy.histogram for the empty range.
+        return minimum - 0.5, maximum + 0.5
+    return minimum, maximum
+
+
+def fine_bin_index(data, minimum, maximum):
+    """Returns the index of the fine bin for each value.
+
+    Parameters
+    ----------
+    data : list or numpy.ndarray
+
+        Values from the range.
+    minimum : double
+
+        Minimum of the data.
+    maximum : double
+
+        Maximum of the data.
+
+    Returns
+    -------
+    index : numpy.ndarray
+
+        Indices of fine bins.
+    """
+    minimum, maximum = fine_range(minimum, maximum)
+    scaled = ((np.asarray(data, dtype=float) - minimum) /
+              (maximum - minimum) * FINE_BINS)
+    # The last bin includes the maximum as in numpy.histogram.
+    return np.clip(np.nan_to_num(scaled), 0, FINE_BINS - 1).astype(int)
+
+
+def bin_boundaries(bins):
+    """Returns indices of the fine bins where the displayed bins begin.
+    For bins being a power of 2 every bin has the same number of
+    fine bins.
+
+    Parameters
+    ----------
+    bins : int
+
+        Number of the displayed bins.
+
+    Returns
+    -------
+    boundaries : numpy.ndarray
+
+        Bins + 1 indices, the last one is FINE_BINS.
+    """
+    bins = min(int(bins), FINE_BINS)
+    return np.round(np.linspace(0, FINE_BINS, bins + 1)).astype(int)
 
 
 def crystal_search(crystals, histogram_type):
@@ -49,6 +132,136 @@ def histograms_data(crystal_list):
         value - dict
     """
     cryst = crystal_list  # Crystals list
-    histogram_order = ['a', 'b', 'c', 'alfa', 'beta', 'gamma']
-    dict_data = {key: crystal_search(cryst, key) for key in histogram_order}
+    dict_data = {key: crystal_search(cryst, key) for key in HISTOGRAM_ORDER}
     return dict_data
+
+
+class CrystalsTable:
+    """Columnar representation of the crystals list used for
+    vectorized selection of the region of interest.
+
+    Attributes
+    ----------
+    parameters : numpy.ndarray
+
+        The (N, 6) matrix with unit cell parameters of each crystal
+        in the `HISTOGRAM_ORDER` order.
+    centering : numpy.ndarray
+
+        Index of the centering type of each crystal in `CENTERING_LIST`,
+        -1 for unknown centering.
+    centering_rows : list
+
+        For each centering type an array with the rows of crystals
+        which have this centering.
+    centering_parameters : list
+
+        For each centering type the (n, 6) matrix with parameters
+        of crystals which have this centering.
+    chunk : numpy.ndarray
+
+        Index of the chunk of the stream file of each crystal,
+        -1 if not known.
+    """
+
+    @timed('cell_compute', lambda result, self, *args, **kwargs: (
+        len(self), self.parameters.nbytes))
+    def __init__(self, crystal_list, canonical=False):
+        """
+        Parameters
+        ----------
+        crystal_list : list
+
+            A list of crystal.
+        canonical : boolean
+
+            Use the cells in the canonical setting (see
+            `reduction.canonical_cells`), computed from the reciprocal
+            vectors of the crystals which have them.
+        """
+        self.parameters = np.array(
+            [[crystal[name] for name in HISTOGRAM_ORDER]
+             for crystal in crystal_list], dtype=float).reshape(-1, 6)
+        centering = [crystal['centering'] for crystal in crystal_list]
+        rows = [row for row, crystal in enumerate(crystal_list)
+                if canonical and 'astar' in crystal]
+        if rows:
+            reciprocal = [[crystal_list[row][name]
+                           for name in ('astar', 'bstar', 'cstar')]
+                          for row in rows]
+            parameters, canonical_centering, _ = canonical_cells(
+                reciprocal,
+                [crystal_list[row]['lattice_type'] for row in rows],
+                [centering[row] for row in rows],
+                [crystal_list[row]['unique_axis'] for row in rows])
+            self.parameters[rows] = parameters
+            for row, name in zip(rows, canonical_centering):
+                centering[row] = name
+        centering_index = {centering: index for index, centering
+                           in enumerate(CENTERING_LIST)}
+        self.centering = np.array(
+            [centering_index.get(name, -1) for name in centering], dtype=int)
+        self.chunk = np.array([crystal.get('chunk', -1)
+                               for crystal in crystal_list], dtype=np.intp)
+        self.centering_rows = [np.flatnonzero(self.centering == index)
+                               for index in range(len(CENTERING_LIST))]
+        self.centering_parameters = [self.parameters[rows]
+                                     for rows in self.centering_rows]
+
+    def __len__(self):
+        return len(self.parameters)
+
+    def selection_mask(self, ranges):
+        """Returns the crystals which are in the region of interest
+        of every histogram.
+
+        Parameters
+        ----------
+        ranges : list
+
+            (left, right) range of interest for each histogram
+            in the `HISTOGRAM_ORDER` order. (None, None) means
+            that nothing was selected on the histogram.
+
+        Returns
+        -------
+        mask : numpy.ndarray
+
+            Boolean array, True for the included crystals.
+        """
+        mask = np.ones(len(self.parameters), dtype=bool)
+        for column, (left, right) in enumerate(ranges):
+            if left is None or right is None:
+                continue
+            values = self.parameters[:, column]
+            mask &= ~((values < left) | (values > right))
+        return mask
+
+    def histograms_data(self, mask):
+        """Splits parameters of the crystals into included, divided
+        into centering types, and excluded for each histogram.
+
+        Parameters
+        ----------
+        mask : numpy.ndarray
+
+            Boolean array, True for the included crystals.
+
+        Returns
+        -------
+        data_included, data_excluded : tuple
+
+            data_included : list of dicts, one for each histogram,
+            key - type centering, value - numpy.ndarray.
+            data_excluded : list of numpy.ndarray, one for each histogram.
+        """
+        included = [parameters[mask[rows]] for rows, parameters
+                    in zip(self.centering_rows, self.centering_parameters)]
+        excluded = self.parameters[~mask]
+        data_included = [
+            {centering: included[index][:, column]
+             for index, centering in enumerate(CENTERING_LIST)}
+            for column in range(len(HISTOGRAM_ORDER))]
+        data_excluded = [excluded[:, column]
+                         for column in range(len(HISTOGRAM_ORDER))]
+        return data_included, data_excluded
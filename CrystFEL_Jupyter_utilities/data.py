@@ -6,6 +6,9 @@ import sys
 import h5py
 import numpy as np
 
+from .h5pool import open_file
+from .profiling import timed
+
 # remove all the handlers.
 for handler in logging.root.handlers[:]:
     logging.root.removeHandler(handler)
@@ -19,6 +22,11 @@ ch.setFormatter(formatter)
 # add the handlers to logger
 LOGGER.addHandler(ch)
 
+# Default path of the dataset with the image.
+DATA_PATH = "/data/data"
+# Default path of the dataset with the peaks found by Cheetah.
+PEAKS_PATH = "/processing/hitfinder/peakinfo-assembled"
+
 
 def list_datasets(dictionary, list_dataset):
     """Recursively searches all Datasets
@@ -86,7 +94,7 @@ def catalog(dictionary):
     return dictionary
 
 
-def get_data_peaks(list_dataset):
+def get_data_peaks(list_dataset, peaks_path=PEAKS_PATH):
     """Returned Dataset with peaks data from 'hitfinder/peakinfo'.
 
     Parameters
@@ -94,6 +102,9 @@ def get_data_peaks(list_dataset):
     list_dataset : list
 
         List with dataset from h5py.
+    peaks_path : Python unicode str (on py3)
+
+        Path of the dataset. Default: PEAKS_PATH.
 
     Returns
     -------
@@ -104,13 +115,12 @@ def get_data_peaks(list_dataset):
     # we are looking for the end because in LCLS H5.
     # this datasets is near the end.
     for dataset in list_dataset[::-1]:
-        if dataset.name == "/processing/hitfinder/peakinfo-assembled":
+        if dataset.name == peaks_path:
             return dataset
-    LOGGER.warning("Missing Dataset /processing/hitfinder/peakinfo-assembled \
-        containing peaki cheetah")
+    LOGGER.warning("Missing Dataset %s containing peaki cheetah", peaks_path)
 
 
-def get_data_image(list_dataset):
+def get_data_image(list_dataset, data_path=DATA_PATH):
     """Look for a raw data from h5 with a specific name '/data/data'
     if we don't find it we return the first datata with shape = 2.
 
@@ -119,6 +129,9 @@ def get_data_image(list_dataset):
     list_dataset : list
 
         List with dataset from h5py.
+    data_path : Python unicode str (on py3)
+
+        Path of the dataset. Default: DATA_PATH.
 
     Returns
     -------
@@ -128,7 +141,7 @@ def get_data_image(list_dataset):
     """
     for dataset in list_dataset:
         # panel data
-        if dataset.name == "/data/data":
+        if dataset.name == data_path:
             return dataset
     for dataset in list_dataset:
         # we return the first data with shape = 2
@@ -137,37 +150,139 @@ def get_data_image(list_dataset):
     raise Exception("There is no data representing panels in the h5 file")
 
 
-def get_diction_data(file):
+def geometry_paths(geomfile):
+    """Returns the paths of the datasets given in the geometry file:
+    the image from the `data` entry (of the detector or of the first
+    panel) and the peaks from the `peak_list` entry.
+
+    Parameters
+    ----------
+    geomfile : Python unicode str (on py3)
+
+        Path to geometry file.
+
+    Returns
+    -------
+    paths : dict
+
+        'data' and 'peaks' paths, only those given in the file.
+        Paths with placeholders (%) of the panels are left out.
+    """
+    paths = {}
+    with open(geomfile) as file:
+        for line in file:
+            # Comments start with ';'.
+            line = line.split(';', 1)[0]
+            if '=' not in line:
+                continue
+            key, value = (part.strip() for part in line.split('=', 1))
+            # Entries of the panels are 'panel/key'.
+            key = key.rsplit('/', 1)[-1]
+            if '%' in value:
+                continue
+            if key == 'data':
+                paths.setdefault('data', value)
+            elif key == 'peak_list':
+                paths.setdefault('peaks', value)
+    return paths
+
+
+def find_dataset(fileh5, path):
+    """Returns the dataset with the path, None if the file doesn't
+    have it.
+    """
+    dataset = fileh5.get(path)
+    return dataset if isinstance(dataset, h5py.Dataset) else None
+
+
+def count_data(data, *args, **kwargs):
+    """Returns number of images and bytes read, for the profiler."""
+    peaks = data["Peaks"]
+    return 1, data["Panels"].nbytes + (0 if peaks is None else peaks.nbytes)
+
+
+@timed('hdf5_read', count_data)
+def get_diction_data(file, data_path=None, peaks_path=None, search=False,
+                     event=None):
     """Opens the H5 file and creates a dictionary
     with two entries: "Panels" with image data and
-    "Peaks" with peaks data.
+    "Peaks" with peaks data. Only the frame of the event is read
+    from 3-D image datasets. The datasets are read from their paths,
+    only with `search` all groups of the file are listed to look
+    for missing ones, which is slow for files with many groups.
 
     Parameters
     ----------
     file : Python unicode str (on py3)
 
         Path to hdf5 file.
+    data_path : Python unicode str (on py3)
+
+        Path of the image dataset. Default: None, DATA_PATH.
+    peaks_path : Python unicode str (on py3)
+
+        Path of the peaks dataset. Default: None, PEAKS_PATH.
+    search : bool
+
+        Whether to look for missing datasets in all groups, the image
+        is then the first 2-D dataset. Default: False.
+    event : int
+
+        Index of the frame in 3-D image dataset, or in 4-D one of the
+        frames of the modules stacked along slow scan. Default: None,
+        the first.
 
     Returns
     -------
     dictionary : dict
 
-        Dictionary with two entries: image data and peaks data.
+        Dictionary with two entries: image data and peaks data,
+        None when the file hasn't the peaks, and "Events" with the number
+        of frames in the image dataset.
     """
-    # the variable contains all dataset from H5
-    list_dataset = []
+    data_path = DATA_PATH if data_path is None else data_path
+    peaks_path = PEAKS_PATH if peaks_path is None else peaks_path
     try:
-        with h5py.File(file, "r") as fileh5:
+        # kept open in the pool for the next frames
+        fileh5 = open_file(file)
+        data = find_dataset(fileh5, data_path)
+        peaks = find_dataset(fileh5, peaks_path)
+        if search and (data is None or peaks is None):
+            # the variable contains all dataset from H5
+            list_dataset = []
             dictionary = {x: fileh5[x] for x in fileh5}
             dictionary = catalog(dictionary)
             # create a list of all datasets
             list_datasets(dictionary, list_dataset)
-            # copies the necessary matrices data
-            data = np.copy(get_data_image(list_dataset))
-            peaks = np.copy(get_data_peaks(list_dataset))
-            # create a data dictionary
-            dictionary = {"Panels": data, "Peaks": peaks}
-            return dictionary
+            if data is None:
+                data = get_data_image(list_dataset, data_path)
+            if peaks is None:
+                peaks = get_data_peaks(list_dataset, peaks_path)
+        elif data is None:
+            raise ValueError(
+                "There is no dataset {} with the image in the h5 file,"
+                " give its path or search all groups".format(data_path))
+        elif peaks is None:
+            LOGGER.warning("Missing Dataset %s containing peaki cheetah",
+                           peaks_path)
+        # frames of the events along the first axis
+        events = data.shape[0] if data.ndim > 2 else 1
+        if data.ndim > 2:
+            event = 0 if event is None else event
+            if not 0 <= event < events:
+                raise ValueError("There is no event {} in the dataset {} with"
+                                 " {} events".format(event, data.name,
+                                                     events))
+        # copies the necessary matrices data
+        if data.ndim > 2:
+            # modules of 4-D dataset stacked as the geometry sees them
+            data = data[event].reshape(-1, data.shape[-1])
+        else:
+            data = data[()]
+        peaks = None if peaks is None else peaks[()]
+        # create a data dictionary
+        dictionary = {"Panels": data, "Peaks": peaks, "Events": events}
+        return dictionary
     except OSError:
         LOGGER.critical("Error opening the file H5")
         sys.exit(1)
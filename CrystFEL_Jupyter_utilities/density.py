@@ -0,0 +1,87 @@
+"""Module for displaying the 2-D density of the crystals over
+a pair of unit cell parameters in a single subplot.
+"""
+import numpy as np
+
+from .profiling import timed
+
+
+class DensityPanel:
+    """Represents the 2-D histogram of the included crystals on a single
+    subplot. The counts are drawn as an image, so the cost of drawing
+    doesn't grow with the number of crystals.
+
+    Attributes
+    ----------
+    axs : The class:`matplotlib.axes.Axes`
+
+        The Axes contains most of the figure elements.
+    x_name : str
+
+        Name of the parameter on the x axis.
+    y_name : str
+
+        Name of the parameter on the y axis.
+    counts : numpy.ndarray
+
+        The (bins, bins) matrix with number of included crystals,
+        x along the first axis. Shared with (and kept up to date by)
+        the class:`crossfilter.CrossFilter`.
+    image : The class:`matplotlib.image.AxesImage`
+
+        The drawn counts, in logarithmic scale.
+    """
+
+    def __init__(self, axs, x_name, y_name, counts, x_edges, y_edges,
+                 cmap='viridis'):
+        """
+        Parameters
+        ----------
+        axs : The class:`matplotlib.axes.Axes`
+
+            The Axes contains most of the figure elements.
+        x_name : str
+
+            Name of the parameter on the x axis.
+        y_name : str
+
+            Name of the parameter on the y axis.
+        counts : numpy.ndarray
+
+            The (bins, bins) matrix with number of included crystals.
+        x_edges : numpy.ndarray
+
+            Edges of the bins on the x axis.
+        y_edges : numpy.ndarray
+
+            Edges of the bins on the y axis.
+        cmap : str
+
+            Name of the colormap.
+        """
+        self.axs = axs
+        self.x_name = x_name
+        self.y_name = y_name
+        self.counts = counts
+        self.image = self.axs.imshow(
+            self.image_data(), origin='lower', aspect='auto',
+            interpolation='nearest', cmap=cmap,
+            extent=(x_edges[0], x_edges[-1], y_edges[0], y_edges[-1]))
+        self.axs.set_xlabel(x_name)
+        self.axs.set_ylabel(y_name)
+        self.update()
+
+    def image_data(self):
+        """Returns the counts in logarithmic scale, y along the rows.
+        """
+        return np.log1p(self.counts.T)
+
+    @timed('histogram_update')
+    def update(self):
+        """Method for refreshing the image, the counts
+        were already changed by the crossfilter.
+        """
+        data = self.image_data()
+        self.image.set_data(data)
+        # Colour scale from 0 so an empty selection stays dark.
+        self.image.set_clim(0, max(data.max(), 1.0))
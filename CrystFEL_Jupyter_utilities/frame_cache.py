@@ -0,0 +1,227 @@
+"""Module with the cache of the frames assembled by the image viewer,
+so going back to a recently shown frame doesn't read and arrange its
+panels again. The cache is bounded by the bytes of the frames,
+the least recently shown frames are dropped first.
+"""
+from collections import OrderedDict
+import hashlib
+import os
+
+import numpy as np
+
+# Default bound of the cache, in bytes.
+FRAME_CACHE_BYTES = 512 * 2**20
+# Types of the compact copies of the images.
+COMPACT_TYPES = ('float32', 'uint16')
+
+# Hashes of the geometry files by their path, modification time and size.
+_GEOMETRY_HASHES = {}
+
+
+def file_version(filename):
+    """Returns modification time and size of the file, None if it
+    can't be found.
+    """
+    try:
+        stat = os.stat(filename)
+    except (OSError, TypeError):
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def geometry_hash(geomfile):
+    """Returns SHA-1 of the content of the geometry file, None without
+    the geometry. The hash is computed again only when the file changes.
+    """
+    version = file_version(geomfile)
+    if version is None:
+        return None
+    key = (os.path.abspath(geomfile), version)
+    if key not in _GEOMETRY_HASHES:
+        with open(geomfile, 'rb') as file:
+            _GEOMETRY_HASHES[key] = hashlib.sha1(file.read()).hexdigest()
+    return _GEOMETRY_HASHES[key]
+
+
+def frame_key(filename, dataset, event, geomfile=None, streamfile=None,
+              peaks_path=None, search=False):
+    """Returns the key of the frame in the cache.
+
+    Parameters
+    ----------
+    filename : Python unicode str (on py3) or list
+
+        Path to hdf5 file, or paths to the files of the run.
+    dataset : Python unicode str (on py3)
+
+        Path of the image dataset, None for the default one.
+    event : int
+
+        Index of the frame in the dataset, None for 2-D dataset.
+    geomfile : Python unicode str (on py3)
+
+        Path to geometry file. Default: None, the frame isn't arranged.
+    streamfile : Python unicode str (on py3)
+
+        Path to stream file with the peaks. Default: None.
+    peaks_path : Python unicode str (on py3)
+
+        Path of the peaks dataset. Default: None, the default one.
+    search : bool
+
+        Whether missing datasets are looked for in all groups.
+        Default: False.
+
+    Returns
+    -------
+    key : tuple
+
+        The files with their versions, the dataset, the event, the hash
+        of the geometry, the stream file with its version, the peaks
+        dataset and the search, the frame is assembled again when any
+        of them changes.
+    """
+    filenames = [filename] if isinstance(filename, str) else sorted(filename)
+    return (tuple((os.path.abspath(name), file_version(name))
+                  for name in filenames), dataset, event,
+            geometry_hash(geomfile),
+            None if streamfile is None else os.path.abspath(streamfile),
+            file_version(streamfile), peaks_path, bool(search))
+
+
+def frame_nbytes(value):
+    """Returns bytes of the arrays of the frame: of the arrays in
+    dictionaries, lists and tuples and of the `array` attribute of the
+    objects (the panels), each memory buffer counted once.
+    """
+    buffers = {}
+    stack = [value]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, np.ndarray):
+            base = item
+            while isinstance(base.base, np.ndarray):
+                base = base.base
+            buffers[id(base)] = base.nbytes
+        elif isinstance(item, dict):
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple)):
+            stack.extend(item)
+        elif hasattr(item, 'array'):
+            stack.append(item.array)
+    return sum(buffers.values())
+
+
+def compact_array(array, dtype):
+    """Returns the image converted to the compact type, uint16 values
+    are rounded and clipped to 0-65535.
+    """
+    if dtype == 'uint16':
+        info = np.iinfo(np.uint16)
+        return np.clip(np.rint(array), info.min, info.max).astype(np.uint16)
+    return np.asarray(array, dtype=dtype)
+
+
+class FrameCache:
+    """Least recently used assembled frames, bounded by their bytes.
+
+    Attributes
+    ----------
+    max_bytes : int
+
+        Bound of the bytes of the frames, a frame larger than the bound
+        isn't kept.
+    compact : Python unicode str (on py3)
+
+        'float32' or 'uint16' to keep the images converted to it,
+        None to keep them as they are.
+    frames : The class:`collections.OrderedDict`
+
+        key - the key from `frame_key`,
+        value - tuple of the frame and its bytes, the most recently
+        used last.
+    nbytes : int
+
+        Bytes of the kept frames.
+    hits : int
+
+        Number of frames found in the cache.
+    misses : int
+
+        Number of frames not found in the cache.
+    """
+
+    def __init__(self, max_bytes=FRAME_CACHE_BYTES, compact=None):
+        if compact is not None and compact not in COMPACT_TYPES:
+            raise ValueError("Unknown compact type {}, use one of {}".format(
+                compact, ", ".join(COMPACT_TYPES)))
+        self.max_bytes = max_bytes
+        self.compact = compact
+        self.frames = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __contains__(self, key):
+        return key in self.frames
+
+    def get(self, key):
+        """Returns the frame, None if it isn't in the cache."""
+        entry = self.frames.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.frames.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, frame):
+        """Keeps the frame, dropping the least recently used ones over
+        the bound.
+
+        Parameters
+        ----------
+        key : tuple
+
+            The key from `frame_key`.
+        frame : dict
+
+            The frame, its 'matrix' entry is the assembled image.
+
+        Returns
+        -------
+        frame : dict
+
+            The kept frame, with compact image.
+        """
+        if self.compact is not None and frame.get('matrix') is not None:
+            frame = dict(frame, matrix=compact_array(frame['matrix'],
+                                                     self.compact))
+        self.remove(key)
+        nbytes = frame_nbytes(frame)
+        if nbytes > self.max_bytes:
+            return frame
+        self.frames[key] = (frame, nbytes)
+        self.nbytes += nbytes
+        while self.nbytes > self.max_bytes:
+            _, (_, dropped) = self.frames.popitem(last=False)
+            self.nbytes -= dropped
+        return frame
+
+    def remove(self, key):
+        """Drops the frame if it is in the cache."""
+        entry = self.frames.pop(key, None)
+        if entry is not None:
+            self.nbytes -= entry[1]
+
+    def clear(self):
+        """Drops all frames."""
+        self.frames = OrderedDict()
+        self.nbytes = 0
+
+
+# The cache of the image viewer of this process.
+FRAME_CACHE = FrameCache()
@@ -0,0 +1,171 @@
+"""Module with the pool of open read-only HDF5 files shared by the
+image viewer and the batch tools. Browsing frames spread over many
+run files reopens the same files, keeping the recently used ones open
+saves the opening and reading of their metadata, and their chunk cache
+keeps the recently read chunks.
+"""
+import atexit
+from collections import OrderedDict
+import os
+
+import h5py
+
+# Default number of files kept open.
+POOL_SIZE = 8
+# Default size of the chunk cache of each file, in bytes.
+RDCC_NBYTES = 16 * 2**20
+# Default number of slots of the chunk cache, a prime number.
+RDCC_NSLOTS = 10007
+
+
+class FilePool:
+    """Least recently used open HDF5 files, the least recently used one
+    is closed when more than `size` files are open. A file changed since
+    it was opened, or closed by its user, is opened again.
+
+    Attributes
+    ----------
+    size : int
+
+        Maximum number of open files.
+    rdcc_nbytes : int
+
+        Size of the chunk cache of each file in bytes,
+        None for the default of h5py.
+    rdcc_nslots : int
+
+        Number of slots of the chunk cache, None for the default of h5py.
+    files : The class:`collections.OrderedDict`
+
+        key - absolute path of the file,
+        value - tuple of the open file and its modification time and size,
+        the most recently used last.
+    hits : int
+
+        Number of requests for files already open.
+    misses : int
+
+        Number of requests which opened the file.
+    """
+
+    def __init__(self, size=POOL_SIZE, rdcc_nbytes=RDCC_NBYTES,
+                 rdcc_nslots=RDCC_NSLOTS):
+        self.size = size
+        self.rdcc_nbytes = rdcc_nbytes
+        self.rdcc_nslots = rdcc_nslots
+        self.files = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.pid = os.getpid()
+
+    def __len__(self):
+        return len(self.files)
+
+    def __contains__(self, filename):
+        return os.path.abspath(filename) in self.files
+
+    def open(self, filename):
+        """Returns the open file, opening it if it isn't in the pool.
+        The file mustn't be closed by the caller, it stays open for the
+        next calls.
+
+        Parameters
+        ----------
+        filename : Python unicode str (on py3)
+
+            Path to hdf5 file.
+
+        Returns
+        -------
+        file : The class:`h5py.File`
+
+            The file opened for reading.
+
+        Raises
+        ------
+        OSError
+
+            If the file can't be opened.
+        """
+        # Files opened before a fork can't be used by the child process.
+        if os.getpid() != self.pid:
+            self.files = OrderedDict()
+            self.pid = os.getpid()
+        path = os.path.abspath(filename)
+        stat = os.stat(path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        entry = self.files.get(path)
+        if entry is not None:
+            file, opened_version = entry
+            if file.id.valid and opened_version == version:
+                self.files.move_to_end(path)
+                self.hits += 1
+                return file
+            self.close(path)
+        self.misses += 1
+        # Only given settings, older h5py doesn't have them.
+        options = {}
+        if self.rdcc_nbytes is not None:
+            options['rdcc_nbytes'] = self.rdcc_nbytes
+        if self.rdcc_nslots is not None:
+            options['rdcc_nslots'] = self.rdcc_nslots
+        file = h5py.File(path, 'r', **options)
+        self.files[path] = (file, version)
+        self.trim()
+        return file
+
+    def trim(self):
+        """Closes the least recently used files over the size."""
+        while len(self.files) > max(self.size, 1):
+            _, (oldest, _) = self.files.popitem(last=False)
+            oldest.close()
+
+    def close(self, filename=None):
+        """Closes the file and removes it from the pool.
+
+        Parameters
+        ----------
+        filename : Python unicode str (on py3)
+
+            Path to hdf5 file. Default: None, all files.
+        """
+        if filename is None:
+            paths = list(self.files)
+        else:
+            paths = [os.path.abspath(filename)]
+        for path in paths:
+            entry = self.files.pop(path, None)
+            if entry is not None and entry[0].id.valid:
+                entry[0].close()
+
+    def configure(self, size=None, rdcc_nbytes=None, rdcc_nslots=None):
+        """Changes the settings, closing the open files when the chunk
+        cache changes. Settings not given are kept.
+        """
+        if rdcc_nbytes is not None or rdcc_nslots is not None:
+            self.close()
+        self.size = size if size is not None else self.size
+        self.rdcc_nbytes = (rdcc_nbytes if rdcc_nbytes is not None
+                            else self.rdcc_nbytes)
+        self.rdcc_nslots = (rdcc_nslots if rdcc_nslots is not None
+                            else self.rdcc_nslots)
+        self.trim()
+
+
+# The pool of this process.
+POOL = FilePool()
+atexit.register(POOL.close)
+
+
+def open_file(filename):
+    """Returns the file open for reading from the pool of this process,
+    see `FilePool.open`.
+    """
+    return POOL.open(filename)
+
+
+def configure(size=None, rdcc_nbytes=None, rdcc_nslots=None):
+    """Changes the settings of the pool of this process,
+    see `FilePool.configure`.
+    """
+    POOL.configure(size, rdcc_nbytes, rdcc_nslots)
@@ -6,15 +6,18 @@ refreshes (updates) the image and adds widgets.
 import argparse
 import logging
 import sys
-# Module for parsing geometry file and determining size of the
-# image after panel arrangement.
-from cfelpyutils.crystfel_utils import load_crystfel_geometry
+
 import matplotlib.pyplot as plt
 import numpy as np
 
-from .data import get_diction_data
-from .panel import bad_places,  get_detectors
-from .peak_h5 import get_list_peaks
+from .data import DATA_PATH, geometry_paths, get_diction_data
+from .frame_cache import (COMPACT_TYPES, FRAME_CACHE_BYTES, FRAME_CACHE,
+                          FrameCache, frame_key)
+from .h5pool import POOL_SIZE, configure
+from .panel import assemble, get_detectors, image_size
+from .peak_h5 import get_peaks_array
+from .profiling import enable, file_size, instrument_figure, phase
+from .run_reader import RunReader
 from .stream_read import search_peaks
 from .widget import ContrastSlider, PeakButtons, Radio
 
@@ -63,42 +66,95 @@ class Image:
 
         The image module supports basic rescaling and display operations.
         Returned by matplotlib imshow.
-    peaks : list
+    peaks : dict
 
-        Containing peak objects from 'peak_h5' module.
+        Positions, intensities and offsets of the peaks from the h5 file,
+        see `peak_h5.get_peaks_array`.
     detectors : dict
 
         Containing Detector object from 'panel' module.
-    bad_places : list
+    event : int
+
+        Index of the shown frame in 3-D image dataset, None for 2-D one.
+    events : int
+
+        Number of frames in the image dataset.
+    cache : The class:`frame_cache.FrameCache`
+
+        The recently shown frames.
+    run : The class:`run_reader.RunReader`
 
-        Containing BadRegion object from 'panel' module.
+        The files of the run, None for single file.
     """
 
-    def __init__(self, path, geomfile=None, streamfile=None):
+    def __init__(self, path, geomfile=None, streamfile=None, data_path=None,
+                 peaks_path=None, search=False, event=None, cache=None):
         """Method for initializing image and checking options how to run code.
 
         Parameters
         ----------
-        path : Python unicode str (on py3).
+        path : Python unicode str (on py3) or list
 
-            Path to h5 file.
+            Path to h5 file, or paths to the files of the run.
        geomfile : Python unicode str (on py3)
 
             Path to geomfile file.
         streamfile : Python unicode str (on py3)
 
             Path to stream file.
+        data_path : Python unicode str (on py3)
+
+            Path of the image dataset. Default: None, the `data` entry
+            of the geometry file or '/data/data'.
+        peaks_path : Python unicode str (on py3)
+
+            Path of the peaks dataset. Default: None, the `peak_list`
+            entry of the geometry file or
+            '/processing/hitfinder/peakinfo-assembled'.
+        search : bool
+
+            Whether to look for missing datasets in all groups of the file.
+        event : int
+
+            Index of the frame in 3-D image dataset. Default: None,
+            the first.
+        cache : The class:`frame_cache.FrameCache`
+
+            Cache of the frames. Default: None, the cache shared
+            by the images of this process.
         """
         self.path = path
         self.geomfile = geomfile
         self.streamfile = streamfile
-        # Dictionary containing panels and peaks info from the h5 file.
-        self.dict_witch_data = get_diction_data(self.path)
+        self.event = event
+        self.events = 1
+        self.cache = cache if cache is not None else FRAME_CACHE
+        # Paths of the datasets given in the geometry file.
+        paths = {}
+        if self.geomfile is not None:
+            try:
+                paths = geometry_paths(self.geomfile)
+            # Reported when the geometry is loaded.
+            except FileNotFoundError:
+                pass
+        self.data_path = (data_path if data_path is not None
+                          else paths.get('data'))
+        self.peaks_path = (peaks_path if peaks_path is not None
+                           else paths.get('peaks'))
+        self.search = search
+        # Frames of the run from many files.
+        self.run = None
+        if not isinstance(self.path, str):
+            self.run = RunReader(self.path, self.data_path or DATA_PATH)
+        # Dictionary containing panels and peaks info from the h5 file,
+        # read when the frame isn't in the cache.
+        self.dict_witch_data = None
         # Creating a figure and suplot
         # used 10X10 because default size is to small in notebook
         self.fig, self.ax = plt.subplots(figsize=(9.5, 9.5))
-        # Setting the title to filename path.
-        self.ax.set_title(self.path)
+        instrument_figure(self.fig)
+        # Keys 'n' and 'b' show the next and the previous event.
+        self.fig.canvas.mpl_connect('key_press_event', self.on_key)
         # Setting the contrast.
         self.vmax = 600
         self.vmin = 0
@@ -109,14 +165,14 @@ class Image:
         self.image = None
         self.peaks = None
         self.detectors = None
-        self.bad_places = None
+        self.peak_buttons = None
         # For displaying the image in the right orientation (?).
         # display without laying the panels
         if self.geomfile is None:
             # Just the image from file with no buttons or reconstruction.
-            self.matrix = np.copy(self.dict_witch_data["Panels"])
-            # Rotating to get the same image as CrystFEL hdfsee.
-            self.matrix = self.matrix[::-1, :]
+            self.load_frame()
+            # Setting the title to filename path.
+            self.ax.set_title(self.frame_title())
             # Creating the image with imshow().
             self.image = self.ax.imshow(self.matrix, cmap=self.cmap,
                                         vmax=self.vmax, vmin=self.vmin)
@@ -134,14 +190,21 @@ class Image:
                                cmap=self.cmap, image=self.image)
         # When the geometry file was provided:
         else:
+            # Module for parsing geometry file and determining size of the
+            # image after panel arrangement, only needed with the geometry.
+            from cfelpyutils.crystfel_utils import load_crystfel_geometry
             try:
-                self.geom = load_crystfel_geometry(self.geomfile)
+                with phase('geometry_compile',
+                           nbytes=file_size(self.geomfile)):
+                    self.geom = load_crystfel_geometry(self.geomfile)
             # Dictionary with information about the image: panels, bad places.
             except FileNotFoundError:
                 LOGGER.critical("Error while opening geometry file.")
                 sys.exit(1)
             # Panels reconstruction:
             self.display_arrangement_view()
+            # Setting the title to filename path.
+            self.ax.set_title(self.frame_title())
             # Slider position.
             axes = plt.axes([.90, 0.78, 0.09, 0.075], facecolor='lightyellow')
             self.slider = ContrastSlider(image=self.image, fig=self.fig,
@@ -183,223 +246,173 @@ class Image:
         plt.show()
 
     def display_arrangement_view(self):
-        """Creating the image filled with ones (?)
-        and applies bad pixel mask (?). Then adds panels (?).
+        """Arranges the frame, or takes it from the cache,
+        and displays it.
         """
-        columns, rows, center_x, center_y = self.find_image_size(self.geom)
-        # Creating an 'empty' matrix ready to be filled with pixel data.
-        self.matrix = np.ones((columns, rows))
-        # Creates a detector dictionary with keys as panels name and values
-        # as class Panel objects.
-        peaks_search, peaks_reflections = search_peaks(self.streamfile,
-                                                       self.path)
-        self.detectors = get_detectors(self.dict_witch_data["Panels"],
-                                       (columns, rows), self.geom,
-                                       peaks_search, peaks_reflections)
-        # Creating a peak list from the h5 file.
-        self.peaks = get_list_peaks(self.dict_witch_data["Peaks"],
-                                    (columns, rows))
-        # Creating a bad pixel mask (?).
-        self.bad_places = bad_places((columns, rows), self.geom)
-        # Arranging the panels.
-        self.arrangement_panels(center_x, center_y)
-        # Masking the bad pixels (?).
-        self.arrangement_bad_places()
+        self.load_frame()
         # Displaying the image.
         self.image = plt.imshow(self.matrix, cmap=self.cmap, vmax=self.vmax,
                                 vmin=self.vmin, animated=True)
 
-    def set_panel_in_view(self, detector, center_x, center_y):
-        """Positions (?) the detector in the right place on the matrix.
-        Changes the 1 values to the correct pixel value.
-
-        Parameters
-        ----------
-        detector : The: class Detector object
-
-            Detector which has been set in the image.
-        center_x : int
-
-            Displacement of centre x-axis.
-        center_y : int
-
-            Displacement of centre y-axis.
-        Raises
-        ------
-        ValueError
-            If wrong panel position.
-        """
-        # Trying to reposition the panels.
-        try:
-            self.matrix[detector.position[0]: detector.position[0] +
-                        detector.array.shape[0],
-                        detector.position[1]: detector.position[1] +
-                        detector.array.shape[1]] = detector.get_array_rotated(
-                            center_x, center_y)
-        except ValueError:
-            text = " ".join(["Wrong panel position",
-                             "{}, Position: {}".format(detector.name,
-                                                       detector.position)])
-            LOGGER.critical(text)
-            sys.exit(1)
-
-    def set_bad_place_in_view(self, bad_place):
-        """Copying the bad pixel ranges to the image.
-
-        Parameters
-        ----------
-        bad_place : The: class BadRegion object
-
-            BadRegion which has been set in the image.
-
-        Raises
-        ------
-        ValueError
-            If wrong bad_place position.
+    def frame_title(self):
+        """Returns the title of the shown frame: filename path
+        and the event of 3-D dataset.
         """
-        try:
-            self.matrix[bad_place.max_y: bad_place.max_y + bad_place.shape[0],
-                        bad_place.min_x: bad_place.min_x +
-                        bad_place.array.shape[1]] = bad_place.get_array()
-        except ValueError:
-            LOGGER.critical("Wrong mask position: {}".format(bad_place.name))
-            sys.exit(1)
-
-    def arrangement_bad_places(self):
-        """Iterates through each bad pixel (?) region and positions it to the
-        correct place on the image.
+        name = self.path
+        if self.run is not None:
+            name = "{} (run of {} files)".format(self.run.files[0],
+                                                  len(self.run.files))
+        if self.events > 1:
+            return "{} //{}".format(name, self.event or 0)
+        return name
+
+    def load_frame(self):
+        """Reads and arranges the frame of the file `path` and
+        the `event`, or takes it from the cache when it was recently
+        shown: sets the matrix, peaks and detectors.
         """
-        for name_bad_place in self.bad_places:
-            bad_place = self.bad_places[name_bad_place]
-            self.set_bad_place_in_view(bad_place)
-
-    def arrangement_panels(self, center_x, center_y):
-        """Iterates through each detector (?) and positions them.
+        key = frame_key(self.path, self.data_path, self.event, self.geomfile,
+                        self.streamfile, self.peaks_path, self.search)
+        frame = self.cache.get(key)
+        if frame is None:
+            if self.run is not None:
+                self.dict_witch_data = self.run.get_diction_data(self.event)
+            else:
+                self.dict_witch_data = get_diction_data(
+                    self.path, self.data_path, self.peaks_path, self.search,
+                    self.event)
+            if self.geomfile is None:
+                self.matrix = np.copy(self.dict_witch_data["Panels"])
+                # Rotating to get the same image as CrystFEL hdfsee.
+                self.matrix = self.matrix[::-1, :]
+            else:
+                self.arrange_frame()
+            frame = self.cache.put(key, {
+                'matrix': self.matrix, 'peaks': self.peaks,
+                'detectors': self.detectors,
+                'events': self.dict_witch_data["Events"]})
+        self.matrix = frame['matrix']
+        self.peaks = frame['peaks']
+        self.detectors = frame['detectors']
+        self.events = frame['events']
+
+    def show_frame(self, path=None, event=None):
+        """Shows other frame, keeping the colour map, the contrast
+        and the shown peaks.
 
         Parameters
         ----------
-        center_x : int
+        path : Python unicode str (on py3) or list
 
-            Displacement of centre x-axis.
-        center_y : int
+            Path to h5 file, or paths to the files of the run.
+            Default: None, the shown file.
+        event : int
 
-            Displacement of centre y-axis.
+            Index of the frame in 3-D image dataset. Default: None,
+            the first.
         """
-        for key in self.detectors:
-            detector = self.detectors[key]
-            self.set_panel_in_view(detector, center_x, center_y)
-
-    def local_range(self, panel):
-        """Calculates the location of the two extreme corners of the panel.
+        if path is not None:
+            self.path = path
+            self.run = (None if isinstance(path, str)
+                        else RunReader(path, self.data_path or DATA_PATH))
+        self.event = event
+        self.load_frame()
+        title = self.frame_title()
+        if self.peak_buttons is not None:
+            self.peak_buttons.set_frame(self.matrix, self.peaks,
+                                        self.detectors, title)
+            return
+        self.image.set_data(self.matrix)
+        self.ax.set_title(title)
+        self.fig.canvas.draw_idle()
+
+    def on_key(self, event):
+        """Shows the next event for key 'n' and the previous one for 'b'.
 
         Parameters
         ----------
-        panel : dict
-
-            A CrystFEL geometry data for panel.
-
-        Returns
-        -------
-        (local_xmin, local_xmax, local_ymin, local_ymax) : tuple
-
-            The location of the two extreme corners of the panel.
+        event : The class:`matplotlib.backend_bases.KeyEvent`.
         """
-        if (np.abs(panel['xfs']) < np.abs(panel['xss']) and
-                np.abs(panel['yfs']) > np.abs(panel['yss'])):
-            if panel['xss'] > 0 and panel['yfs'] < 0:
-                # After rotation along y=x
-                local_xmax = panel['cnx']
-                local_ymin = panel['cny']
-                local_xmin = (panel['cnx'] - panel['max_ss'] +
-                              panel['min_ss'] - 1)
-                local_ymax = (panel['cny'] + panel['max_fs'] -
-                              panel['min_fs'] + 1)
-            elif panel['xss'] < 0 and panel['yfs'] > 0:
-                # After rotation along y=-x
-                local_xmin = panel['cnx']
-                local_ymax = panel['cny']
-                local_xmax = (panel['cnx'] + panel['max_ss'] -
-                              panel['min_ss'] + 1)
-                local_ymin = (panel['cny'] - panel['max_fs'] +
-                              panel['min_fs'] - 1)
-        elif (np.abs(panel['xfs']) > np.abs(panel['xss']) and
-              np.abs(panel['yfs']) < np.abs(panel['yss'])):
-            if panel['xfs'] < 0 and panel['yss'] < 0:
-                # After rotation along y-axis
-                local_xmax = panel['cnx']
-                local_ymax = panel['cny']
-                local_xmin = (panel['cnx'] - panel['max_fs'] +
-                              panel['min_fs'] - 1)
-                local_ymin = (panel['cny'] - panel['max_ss'] +
-                              panel['min_ss'] - 1)
-            elif panel['xfs'] > 0 and panel['yss'] > 0:
-                # After rotation along x-axis
-                local_xmin = panel['cnx']
-                local_ymin = panel['cny']
-                local_xmax = (panel['cnx'] + panel['max_fs'] -
-                              panel['min_fs'] + 1)
-                local_ymax = (panel['cny'] + panel['max_ss'] -
-                              panel['min_ss'] + 1)
-        return local_xmin, local_xmax, local_ymin, local_ymax
-
-    def find_image_size(self, geom):
-        """Finds a matrix size that allows you to hold all the panels.
-
-        Parameters
-        ----------
-        geom : dict
-
-            Dictionary with the geometry information loaded from the geomfile.
-
-        Returns
-        -------
-        (columns, rows,  center_x, center_y) : tuple
-
-            columns, rows : Matrix size used in imshow.
-            center_x, center_y : Displacement of centre.
+        steps = {'n': 1, 'b': -1}
+        if event.key not in steps or self.events < 2:
+            return
+        self.show_frame(event=((self.event or 0) + steps[event.key]) %
+                        self.events)
+
+    def arrange_frame(self):
+        """Reads the peaks of the frame and arranges the panels
+        with `panel.assemble`, moving the peaks with them.
         """
-        # current length and height.
-        x_min = x_max = y_min = y_max = 0
-        # I am looking for the most remote panel points.
-        for name in geom["panels"]:
-            local_xmin, local_xmax, local_ymin, local_ymax = self.local_range(
-                geom["panels"][name])
-            if local_xmax > x_max:
-                x_max = local_xmax
-            elif local_xmin < x_min:
-                x_min = local_xmin
-            if local_ymax > y_max:
-                y_max = local_ymax
-            elif local_ymin < y_min:
-                y_min = local_ymin
-        # The number of columns.
-        columns = x_max - x_min
-        # The number of rows.
-        rows = y_max - y_min
-        # Displacement of centre.
-        center_y = -int(x_max - columns/2)
-        center_x = int(y_max - rows/2)
-        # conversion to integer.
-        rows = int(np.ceil(rows))
-        columns = int(np.ceil(columns))
-        return columns, rows, center_x, center_y
+        columns, rows, _, _ = image_size(self.geom)
+        # Creates a detector dictionary with keys as panels name and values
+        # as class Panel objects.
+        filename, event = self.path, self.event
+        if self.run is not None:
+            # The stream names the frame by its file of the run.
+            filename, event = self.run.locate(self.event or 0)
+        peaks_search, peaks_reflections = search_peaks(self.streamfile,
+                                                       filename, event)
+        self.detectors = get_detectors(self.dict_witch_data["Panels"],
+                                       (columns, rows), self.geom,
+                                       peaks_search, peaks_reflections)
+        # Creating the peak arrays from the h5 file.
+        self.peaks = get_peaks_array(self.dict_witch_data["Peaks"],
+                                     (columns, rows))
+        # Arranging the panels and masking the bad regions.
+        try:
+            self.matrix = assemble(self.dict_witch_data["Panels"], self.geom,
+                                   self.detectors)
+        except ValueError as error:
+            LOGGER.critical(str(error))
+            sys.exit(1)
 
 
 def main(argv=None):
     parser = argparse.ArgumentParser()
-    parser.add_argument('filename', nargs=1, metavar="name.H5",
-                        help='Display this image.')
+    parser.add_argument('filename', nargs='+', metavar="name.H5",
+                        help='Display this image, or the run of these' +
+                        ' sequence and module files.')
     parser.add_argument('-g', "--geomfile", nargs=1, metavar='name.GEOM',
                         help='Use geometry from file' +
                         ' to display arrangment panels')
     parser.add_argument('-p', '--peaks', nargs=1, metavar='name.STREAM',
                         help='use to display peaks' +
                         ' from stream is used only witch geom')
+    parser.add_argument('-d', '--data', metavar='PATH',
+                        help="Path of the image dataset" +
+                        " (default: data in the geometry or /data/data)")
+    parser.add_argument('--peaks-dataset', metavar='PATH',
+                        help="Path of the peaks dataset (default: peak_list" +
+                        " in the geometry or" +
+                        " /processing/hitfinder/peakinfo-assembled)")
+    parser.add_argument('--search', action='store_true',
+                        help="Look for missing datasets in all groups" +
+                        " of the file (slow for many groups)")
+    parser.add_argument('-e', '--event', type=int, metavar='N',
+                        help="Show frame N of 3-D image dataset, keys n and" +
+                        " b show the next and the previous one")
+    parser.add_argument('--frame-cache', type=float, metavar='MIB',
+                        default=FRAME_CACHE_BYTES / 2**20,
+                        help="Memory for the recently shown frames" +
+                        " (default: %(default)s MiB)")
+    parser.add_argument('--compact', choices=COMPACT_TYPES,
+                        help="Keep the recently shown frames as this type")
+    parser.add_argument('--profile', metavar='FILE',
+                        help="Write timings of the phases to FILE" +
+                        " (.json, or .folded for flame graphs)")
+    parser.add_argument('--pool-size', type=int, metavar='N',
+                        help="Number of HDF5 files kept open, at least" +
+                        " the number of modules (default: {})".format(
+                            POOL_SIZE))
     # Parsing command line arguments.
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    if args.profile:
+        enable(args.profile)
+    if args.pool_size:
+        configure(size=args.pool_size)
     # Variable for running mode.
     # Variable for filename.
-    path = args.filename[0]
+    path = args.filename[0] if len(args.filename) == 1 else args.filename
     if args.geomfile:
         # Check if the geometry file was provided.
         geomfile = args.geomfile[0]
@@ -416,7 +429,10 @@ def main(argv=None):
         streamfile = None
         geomfile = None
 
-    Image(path=path, geomfile=geomfile, streamfile=streamfile)
+    cache = FrameCache(int(args.frame_cache * 2**20), args.compact)
+    Image(path=path, geomfile=geomfile, streamfile=streamfile,
+          data_path=args.data, peaks_path=args.peaks_dataset,
+          search=args.search, event=args.event, cache=cache)
 
 
 if __name__ == '__main__':
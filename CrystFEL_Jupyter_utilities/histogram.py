@@ -1,5 +1,10 @@
 """Module for displaying a single module in a subplot.
 """
+from matplotlib.patches import Polygon
+import numpy as np
+
+from .crystlib import FINE_BINS, bin_boundaries, fine_bin_index, fine_range
+from .profiling import timed
 
 
 class Histogram:
@@ -29,9 +34,11 @@ class Histogram:
     data_included : list
 
         Data not excluded during selection.
+        None when the counts come from the crossfilter.
     data_excluded : list
 
         Data in the range which was not selected.
+        None when the counts come from the crossfilter.
     color_exclude : str
 
         The name of the color to the exclude histogram bar.
@@ -39,12 +46,31 @@ class Histogram:
     current_xlim : tuple
 
             Current x limits of the histogram.
+    fine_counts : numpy.ndarray
+
+        The (9, FINE_BINS) matrix with number of crystals in each fine bin
+        over [min, max] for each centering and for the excluded crystals.
+    counts : numpy.ndarray
+
+        The (9, bins) matrix with number of crystals in each bin
+        for each centering and for the excluded crystals.
     patches : list
 
-        Individual patches used to create the histogram.
+        Stepfilled Polygons, one for each centering and
+        the last one for the excluded crystals.
+    green_space : The class:`matplotlib.patches.Polygon`
+
+        The drawn range of interest. None if not drawn.
+    fit_line : The class:`matplotlib.lines.Line2D`
+
+        The fitted gaussian curve, created once and hidden on update.
+    fit_text : The class:`matplotlib.text.Text`
+
+        Parameters of the fitted gaussian.
     """
 
-    def __init__(self, axs, name, xlabel, data_to_histogram, colors, bins):
+    def __init__(self, axs, name, xlabel, data_to_histogram, colors, bins,
+                 fine_counts=None, value_range=None):
         """
             Attributes
             ----------
@@ -66,7 +92,16 @@ class Histogram:
                 Colors of changing the bars in the histogram.
             data_to_histogram : dict
 
-                Data for the histogram.
+                Data for the histogram. Not used when
+                fine_counts are given.
+            fine_counts : numpy.ndarray
+
+                The (9, FINE_BINS) counts shared with (and kept up
+                to date by) the class:`crossfilter.CrossFilter`.
+                Default: None, counted from data_to_histogram.
+            value_range : tuple
+
+                (min, max) range of the fine_counts.
         """
         self.name = name
         self.axs = axs
@@ -78,36 +113,50 @@ class Histogram:
         # on centering type.
         self.cryst_list = ['P', 'A', 'B', 'C', 'I', 'F', 'H', 'R']
         self.list_data = []
-        self.data_included = []
-        for k, a_cryst in enumerate(self.cryst_list):
-            try:
-                self.list_data.append(data_to_histogram[a_cryst])
-            except KeyError:
-                self.list_data.append([])
-            self.data_included += self.list_data[k]
-        try:
-            self.data_excluded = []
-        except KeyError:
+        if fine_counts is None:
+            for a_cryst in self.cryst_list:
+                try:
+                    self.list_data.append(data_to_histogram[a_cryst])
+                except KeyError:
+                    self.list_data.append([])
+            self.data_included = np.concatenate(
+                [np.asarray(data, dtype=float) for data in self.list_data])
             self.data_excluded = []
-        self.list_data.append(self.data_excluded)
-        self.max = max(self.data_included + self.data_excluded)
-        self.min = min(self.data_included + self.data_excluded)
+            self.list_data.append(self.data_excluded)
+            self.max = np.max(self.data_included)
+            self.min = np.min(self.data_included)
+        else:
+            # The crossfilter owns the data.
+            self.data_included = None
+            self.data_excluded = None
+            self.min, self.max = value_range
         self.color_exclude = 'lightgray'
         self.__list_colors = [
             colors[centering] for centering in self.cryst_list]
         self.__list_colors.append(self.color_exclude)
         self.axs.set_title("Histogram of " + self.name)
         self.axs.set_xlabel(self.xlabel)
-        _, _, self.patches = self.axs.hist(x=self.list_data, bins=self.bins,
-                                           density=1, stacked=True, alpha=0.9,
-                                           range=(self.min, self.max),
-                                           color=self.__list_colors,
-                                           histtype='stepfilled')
+        self.green_space = None
+        self.fit_line = None
+        self.fit_text = None
+        if fine_counts is None:
+            fine_counts = self.fine_histogram_counts()
+        self.fine_counts = fine_counts
+        self.counts = self.histogram_counts()
         # Draw the histogram
-        # histtype = 'stepfilled' because for the default type refreshing is
-        # very slow.
-        # patches is a list of 8 Polygons containing matrix N2 where
-        # y height is in the second column.
+        # One stepfilled polygon for each centering stacked on each other,
+        # refreshing only changes their vertices.
+        self.patches = []
+        for color in self.__list_colors:
+            polygon = Polygon(np.zeros((1, 2)), closed=True,
+                              facecolor=color, alpha=0.9)
+            # Like in the matplotlib histogram, y axis starts at 0.
+            polygon.sticky_edges.y.append(0)
+            self.patches.append(polygon)
+        self.set_patches_vertices()
+        for polygon in self.patches:
+            self.axs.add_patch(polygon)
+        self.axs.autoscale_view()
         # Drawing the grid:
         self.axs.grid(True)
         self.__xlim = self.axs.get_xlim()
@@ -163,12 +212,16 @@ class Histogram:
 
     def draw_green_space(self):
         """Draw the range of ​​interest ('green')
+        replacing the one drawn before.
         """
+        if self.green_space is not None:
+            self.green_space.remove()
+            self.green_space = None
         if (self.__range_green_space[0] is not None or
                 self.__range_green_space[1] is not None):
-            self.axs.axvspan(self.__range_green_space[0],
-                             self.__range_green_space[1],
-                             facecolor='#2ca02c', alpha=0.5)
+            self.green_space = self.axs.axvspan(self.__range_green_space[0],
+                                                self.__range_green_space[1],
+                                                facecolor='#2ca02c', alpha=0.5)
 
     @property
     def was_clicked_before(self):
@@ -237,13 +290,186 @@ class Histogram:
         self.__list_colors.append(self.color_exclude)
 
     def update_colors(self):
-        """Loop for each bin and updating colour for the next in colour loop.
+        """Loop for each polygon and updating colour
+        for the next in colour loop.
+        """
+        for polygon, color in zip(self.patches, self.__list_colors):
+            polygon.set_facecolor(color)
+
+    def fine_range(self):
+        """Returns the range covered by the fine bins.
+
+        Returns
+        -------
+        minimum, maximum : tuple
+
+            Range of all data.
         """
+        return fine_range(self.min, self.max)
 
-        for patch_index in range(9):
-            for box in self.patches[patch_index]:
-                box.set_facecolor(self.__list_colors[patch_index])
+    def fine_bin_index(self, data):
+        """Returns the index of the fine bin for each value.
+
+        Parameters
+        ----------
+        data : list or numpy.ndarray
+
+            Values from the histogram range.
+
+        Returns
+        -------
+        index : numpy.ndarray
+
+            Indices of fine bins.
+        """
+        return fine_bin_index(data, self.min, self.max)
+
+    def fine_histogram_counts(self):
+        """Counts the data of each centering and the excluded data
+        in the fine bins. The only place which walks through the data.
+
+        Returns
+        -------
+        fine_counts : numpy.ndarray
+
+            The (9, FINE_BINS) matrix with counts.
+        """
+        return np.array([np.bincount(self.fine_bin_index(data),
+                                     minlength=FINE_BINS)
+                         for data in self.list_data])
+
+    def bin_boundaries(self):
+        """Returns indices of the fine bins where the displayed bins begin.
+        For bins being a power of 2 every bin has the same number of
+        fine bins.
+
+        Returns
+        -------
+        boundaries : numpy.ndarray
 
+            Bins + 1 indices, the last one is FINE_BINS.
+        """
+        return bin_boundaries(self.bins)
+
+    def bin_edges(self):
+        """Returns edges of the bins, fixed by the range of all data.
+
+        Returns
+        -------
+        edges : numpy.ndarray
+
+            Bins + 1 edges.
+        """
+        minimum, maximum = self.fine_range()
+        return (minimum + (maximum - minimum) *
+                self.bin_boundaries() / FINE_BINS)
+
+    def histogram_counts(self):
+        """Sums the adjacent fine bins into the displayed bins.
+
+        Returns
+        -------
+        counts : numpy.ndarray
+
+            The (9, bins) matrix with counts.
+        """
+        return np.add.reduceat(self.fine_counts,
+                               self.bin_boundaries()[:-1], axis=1)
+
+    def range_counts(self, left, right):
+        """Counts the data of each centering and the excluded data
+        in the range with cumulative sums of the fine bins.
+
+        Parameters
+        ----------
+        left : double
+
+            Left position of the range.
+        right : double
+
+            Right position of the range.
+
+        Returns
+        -------
+        counts : numpy.ndarray
+
+            The number of crystals in the range for each of 9 series.
+        """
+        cumulative = np.zeros((self.fine_counts.shape[0], FINE_BINS + 1),
+                              dtype=self.fine_counts.dtype)
+        np.cumsum(self.fine_counts, axis=1, out=cumulative[:, 1:])
+        first, last = self.fine_bin_index([left, right])
+        return cumulative[:, last + 1] - cumulative[:, first]
+
+    def set_patches_vertices(self):
+        """Changes in place the vertices of the stepfilled polygons
+        to the current counts (stacked and normalized as density).
+        """
+        edges = self.bin_edges()
+        tops = np.cumsum(self.counts, axis=0).astype(float)
+        total = tops[-1].sum()
+        if total > 0:
+            tops /= np.diff(edges) * total
+        bottoms = np.vstack([np.zeros((1, tops.shape[1])), tops[:-1]])
+        x_top = np.repeat(edges, 2)
+        x_bottom = x_top[1:-1][::-1]
+        for polygon, bottom, top in zip(self.patches, bottoms, tops):
+            y_top = np.concatenate(([bottom[0]], np.repeat(top, 2),
+                                    [bottom[-1]]))
+            y_bottom = np.repeat(bottom, 2)[::-1]
+            polygon.set_xy(np.column_stack(
+                (np.concatenate((x_top, x_bottom)),
+                 np.concatenate((y_top, y_bottom)))))
+
+    def clear_fit(self):
+        """Hides the fitted curve and its text.
+        """
+        if self.fit_line is not None:
+            self.fit_line.set_visible(False)
+            self.fit_text.set_visible(False)
+
+    def draw_fit(self, mu, sigma, points=80):
+        """Shows the gaussian over the current x limits, changing the data
+        of the curve and the text drawn before.
+
+        Parameters
+        ----------
+        mu : double
+
+            Mean of the gaussian.
+        sigma : double
+
+            Standard deviation of the gaussian.
+        points : int
+
+            Number of points of the curve.
+        """
+        lnspc = np.linspace(self.__current_xlim[0], self.__current_xlim[1],
+                            points)
+        if np.isfinite(mu) and sigma > 0:
+            pdf_g = (np.exp(-0.5 * ((lnspc - mu) / sigma)**2) /
+                     (sigma * np.sqrt(2 * np.pi)))
+        else:
+            # Nothing to draw for a single value.
+            pdf_g = np.full(points, np.nan)
+        # Setting for relative 3/4 of the height;
+        # each histogram has other y axis scale
+        # and maximum value.
+        position = (self.__current_xlim[0], 0.75*self.axs.get_ylim()[1])
+        label = r"$\mu = {}\ \sigma = {}$".format(np.round(mu, 2),
+                                                  np.round(sigma, 2))
+        if self.fit_line is None:
+            self.fit_line, = self.axs.plot(lnspc, pdf_g)
+            self.fit_text = self.axs.text(x=position[0], y=position[1],
+                                          s=label, fontsize=10)
+        else:
+            self.fit_line.set_data(lnspc, pdf_g)
+            self.fit_text.set_position(position)
+            self.fit_text.set_text(label)
+        self.fit_line.set_visible(True)
+        self.fit_text.set_visible(True)
+
+    @timed('histogram_update')
     def update(self, data_to_histogram=None, data_excluded=None):
         """Updates a single histogram.
 
@@ -261,33 +487,29 @@ class Histogram:
         """
         # update new data to the histogram when selecting the range.
         if data_to_histogram is not None and data_excluded is not None:
-            try:
-                self.data_excluded = data_excluded
-            except KeyError:
-                self.data_excluded = []
+            self.data_excluded = data_excluded
             self.list_data = []
-            self.data_included = []
-            for k, a_cryst in enumerate(self.cryst_list):
+            for a_cryst in self.cryst_list:
                 try:
                     self.list_data.append(data_to_histogram[a_cryst])
                 except KeyError:
                     self.list_data.append([])
-                self.data_included += self.list_data[k]
+            # Data may be lists or numpy arrays
+            # (vectorized selection from the Span).
+            self.data_included = np.concatenate(
+                [np.asarray(data, dtype=float) for data in self.list_data])
             self.list_data.append(self.data_excluded)
-
-        # Refresh histogram
-        # Clear subplot
-        self.axs.clear()
-        self.axs.set_title("Histogram of " + self.name)
-        self.axs.set_xlabel(self.xlabel)
-        # Draw histogram
-        _, _, self.patches = self.axs.hist(x=self.list_data, bins=self.bins,
-                                           density=1, stacked=True, alpha=0.9,
-                                           range=(self.min, self.max),
-                                           color=self.__list_colors,
-                                           histtype='stepfilled')
-        # Draw mesh
-        self.axs.grid(True)
+            self.fine_counts = self.fine_histogram_counts()
+        # Refresh histogram without clearing the subplot:
+        # counts summed from the fine bins (changing the bins doesn't touch
+        # the data) and vertices of the existing polygons.
+        self.clear_fit()
+        self.counts = self.histogram_counts()
+        self.set_patches_vertices()
+        # Limits straight from the counts, without
+        # recalculating them from all artists.
+        top = self.patches[-1].get_xy()[:, 1].max()
+        self.axs.set_ylim(0, 1.05 * top if top > 0 else 1)
         self.axs.set_xlim(self.__current_xlim)
 
     @property
@@ -7,6 +7,8 @@ import sys
 
 import numpy as np
 
+from .profiling import timed
+
 # remove all the handlers.
 for handler in logging.root.handlers[:]:
     logging.root.removeHandler(handler)
@@ -64,6 +66,10 @@ class Detector:
     position : tuple
 
         Panel coordinates on the final image.
+    rotation : str
+
+        Rotation applied by `type_rotation`: 'x', 'y', 'y_x' or 'y_2x',
+        None before.
     peaks_search : list
 
         List of peaks from the stream file.
@@ -133,6 +139,7 @@ class Detector:
                                   self.min_fs: self.max_fs + 1])
         # my position in matrix
         self.position = (0, 0)
+        self.rotation = None
         self.peaks_search = []
         self.peaks_reflection = []
         self.image_size = image_size
@@ -210,6 +217,41 @@ class Detector:
             LOGGER.critical("{} Unknown rotation!".format(self.name))
             sys.exit(1)
 
+    def assembled_position(self, fs_px, ss_px):
+        """Returns the position on the final image of the points of the
+        panel, as the peaks are moved by the rotations. The rotation
+        has to be applied before.
+
+        Parameters
+        ----------
+        fs_px : numpy.array
+
+            Fast scan coordinates of the points in the data.
+        ss_px : numpy.array
+
+            Slow scan coordinates of the points in the data.
+
+        Returns
+        -------
+        (posx, posy) : tuple
+
+            numpy.arrays of the columns and the rows on the image.
+        """
+        fs_px = np.asarray(fs_px, dtype=float) - self.min_fs
+        ss_px = np.asarray(ss_px, dtype=float) - self.min_ss
+        rows, columns = self.array.shape
+        if self.rotation == 'x':
+            posx, posy = fs_px, rows - 1 - ss_px
+        elif self.rotation == 'y':
+            posx, posy = columns - 1 - fs_px, ss_px
+        elif self.rotation == 'y_x':
+            posx, posy = columns - 1 - ss_px, rows - 1 - fs_px
+        elif self.rotation == 'y_2x':
+            posx, posy = ss_px, fs_px
+        else:
+            raise ValueError("Panel {} isn't rotated".format(self.name))
+        return posx + self.position[1], posy + self.position[0]
+
     def rot_x(self, center_x, center_y):
         """Rotation along x-axis, columns stay the same, rows are switched.
 
@@ -224,6 +266,7 @@ class Detector:
         """
         # rotation x
         self.array = self.array[::-1, :]
+        self.rotation = 'x'
         # The position of the panel
         # position x
         pos_x = int(np.round(self.image_size[0]/2.0 - self.corner_y -
@@ -278,6 +321,7 @@ class Detector:
         """
         # rotation y
         self.array = self.array[:, ::-1]
+        self.rotation = 'y'
         # The position of the panel
         # position y
         pos_y = (int(self.image_size[1]/2) + int(self.corner_x) -
@@ -330,6 +374,7 @@ class Detector:
         """
         # rotation y=x diagonal
         self.array = np.rot90(self.array)[:, ::-1]
+        self.rotation = 'y_x'
         # The position of the panel
         # position y
         pos_y = int(np.round(self.image_size[1]/2.0 + self.corner_x -
@@ -387,6 +432,7 @@ class Detector:
         """
         # rotation y=-x transpose
         self.array = np.transpose(self.array)
+        self.rotation = 'y_2x'
         # The position of the panel
         # position x
         pos_x = int(np.round(self.image_size[0]/2.0 - self.corner_y, 0))
@@ -426,6 +472,106 @@ class Detector:
             peak_reflection['position'] = (posx, posy)
 
 
+def panel_range(panel):
+    """Calculates the location of the two extreme corners of the panel.
+
+    Parameters
+    ----------
+    panel : dict
+
+        A CrystFEL geometry data for panel.
+
+    Returns
+    -------
+    (local_xmin, local_xmax, local_ymin, local_ymax) : tuple
+
+        The location of the two extreme corners of the panel.
+    """
+    if (np.abs(panel['xfs']) < np.abs(panel['xss']) and
+            np.abs(panel['yfs']) > np.abs(panel['yss'])):
+        if panel['xss'] > 0 and panel['yfs'] < 0:
+            # After rotation along y=x
+            local_xmax = panel['cnx']
+            local_ymin = panel['cny']
+            local_xmin = (panel['cnx'] - panel['max_ss'] +
+                          panel['min_ss'] - 1)
+            local_ymax = (panel['cny'] + panel['max_fs'] -
+                          panel['min_fs'] + 1)
+        elif panel['xss'] < 0 and panel['yfs'] > 0:
+            # After rotation along y=-x
+            local_xmin = panel['cnx']
+            local_ymax = panel['cny']
+            local_xmax = (panel['cnx'] + panel['max_ss'] -
+                          panel['min_ss'] + 1)
+            local_ymin = (panel['cny'] - panel['max_fs'] +
+                          panel['min_fs'] - 1)
+    elif (np.abs(panel['xfs']) > np.abs(panel['xss']) and
+          np.abs(panel['yfs']) < np.abs(panel['yss'])):
+        if panel['xfs'] < 0 and panel['yss'] < 0:
+            # After rotation along y-axis
+            local_xmax = panel['cnx']
+            local_ymax = panel['cny']
+            local_xmin = (panel['cnx'] - panel['max_fs'] +
+                          panel['min_fs'] - 1)
+            local_ymin = (panel['cny'] - panel['max_ss'] +
+                          panel['min_ss'] - 1)
+        elif panel['xfs'] > 0 and panel['yss'] > 0:
+            # After rotation along x-axis
+            local_xmin = panel['cnx']
+            local_ymin = panel['cny']
+            local_xmax = (panel['cnx'] + panel['max_fs'] -
+                          panel['min_fs'] + 1)
+            local_ymax = (panel['cny'] + panel['max_ss'] -
+                          panel['min_ss'] + 1)
+    return local_xmin, local_xmax, local_ymin, local_ymax
+
+
+@timed('geometry_compile')
+def image_size(geom):
+    """Finds a matrix size that allows you to hold all the panels.
+
+    Parameters
+    ----------
+    geom : dict
+
+        Dictionary with the geometry information loaded from the geomfile.
+
+    Returns
+    -------
+    (columns, rows,  center_x, center_y) : tuple
+
+        columns, rows : Matrix size used in imshow.
+        center_x, center_y : Displacement of centre.
+    """
+    # current length and height.
+    x_min = x_max = y_min = y_max = 0
+    # I am looking for the most remote panel points.
+    for name in geom["panels"]:
+        local_xmin, local_xmax, local_ymin, local_ymax = panel_range(
+            geom["panels"][name])
+        if local_xmax > x_max:
+            x_max = local_xmax
+        elif local_xmin < x_min:
+            x_min = local_xmin
+        if local_ymax > y_max:
+            y_max = local_ymax
+        elif local_ymin < y_min:
+            y_min = local_ymin
+    # The number of columns.
+    columns = x_max - x_min
+    # The number of rows.
+    rows = y_max - y_min
+    # Displacement of centre.
+    center_y = -int(x_max - columns/2)
+    center_x = int(y_max - rows/2)
+    # conversion to integer.
+    rows = int(np.ceil(rows))
+    columns = int(np.ceil(columns))
+    return columns, rows, center_x, center_y
+
+
+@timed('assembly', lambda panels, raw_data_from_h5, *args: (
+    len(panels), raw_data_from_h5.nbytes))
 def get_detectors(raw_data_from_h5, image_size, geom,
                   peaks_search, peaks_reflections):
     """Creates a dictionary with detector class objects as items and
@@ -483,6 +629,61 @@ def get_detectors(raw_data_from_h5, image_size, geom,
     return panels
 
 
+def assembled_positions(geom, panel_names, fs_px, ss_px):
+    """Returns the positions on the image arranged with the geometry of
+    the points given in the data of the panels, e.g. the peaks of the peak
+    tables. The points of each panel are moved at once.
+
+    Parameters
+    ----------
+    geom : dict
+
+        Dictionary with the geometry information loaded from the geomfile.
+    panel_names : numpy.array
+
+        Name of the panel of each point.
+    fs_px : numpy.array
+
+        Fast scan coordinates of the points in the data.
+    ss_px : numpy.array
+
+        Slow scan coordinates of the points in the data.
+
+    Returns
+    -------
+    (posx, posy) : tuple
+
+        numpy.arrays of the columns and the rows on the image,
+        NaN for the points of panels not in the geometry.
+    """
+    columns, rows, center_x, center_y = image_size(geom)
+    posx = np.full(len(panel_names), np.nan)
+    posy = np.full(len(panel_names), np.nan)
+    names, inverse = np.unique(np.asarray(panel_names, dtype=str),
+                               return_inverse=True)
+    # Indices of the points of each panel.
+    order = np.argsort(inverse, kind='stable')
+    bounds = np.searchsorted(inverse[order], np.arange(len(names) + 1))
+    for index, name in enumerate(names):
+        panel = geom["panels"].get(name)
+        if panel is None:
+            continue
+        # Only the shape of the panel data is needed for the rotation.
+        data = np.broadcast_to(np.float32(0), (panel["max_ss"] + 1,
+                                               panel["max_fs"] + 1))
+        detector = Detector(name=name, image_size=(columns, rows),
+                            corner_x=panel["cnx"], corner_y=panel["cny"],
+                            min_fs=panel["min_fs"], min_ss=panel["min_ss"],
+                            max_fs=panel["max_fs"], max_ss=panel["max_ss"],
+                            xfs=panel["xfs"], yfs=panel["yfs"],
+                            xss=panel["xss"], yss=panel["yss"], data=data)
+        detector.type_rotation(center_x, center_y)
+        points = order[bounds[index]: bounds[index + 1]]
+        posx[points], posy[points] = detector.assembled_position(
+            np.asarray(fs_px)[points], np.asarray(ss_px)[points])
+    return posx, posy
+
+
 class BadRegion:
     """Class for mapping bad pixel regions on the image.
     Regions are read from the geometry file.
@@ -565,6 +766,7 @@ class BadRegion:
         return self.array
 
 
+@timed('bad_region_masking', lambda regions, *args: (len(regions), 0))
 def bad_places(image_size, geom):
     """Creates a dictionary with bad pixel regions from geom file.
 
@@ -591,3 +793,54 @@ def bad_places(image_size, geom):
                                       geom['bad'][bad_name]['max_y'])
                   for bad_name in geom['bad']}
     return bad_places
+
+
+@timed('assembly', lambda matrix, raw_data_from_h5, geom, *args: (
+    len(geom["panels"]), matrix.nbytes))
+def assemble(raw_data_from_h5, geom, detectors=None):
+    """Arranges the panels of the data in the image and masks
+    the bad regions.
+
+    Parameters
+    ----------
+    raw_data_from_h5 : numpy.array
+
+        Data from h5 for all detectors.
+    geom : dict
+
+        Dictionary with the geometry information loaded from the geomfile.
+    detectors : dict
+
+        Detectors of the data from `get_detectors`, their peaks are moved
+        with the panels. Default: None, detectors without peaks.
+
+    Returns
+    -------
+    matrix : numpy.array
+
+        The image, ones outside the panels and zeros in the bad regions.
+
+    Raises
+    ------
+    ValueError
+        If wrong panel position.
+    """
+    columns, rows, center_x, center_y = image_size(geom)
+    matrix = np.ones((columns, rows))
+    if detectors is None:
+        detectors = get_detectors(raw_data_from_h5, (columns, rows), geom,
+                                  {}, {})
+    for detector in detectors.values():
+        array = detector.get_array_rotated(center_x, center_y)
+        row, column = detector.position
+        target = matrix[row: row + array.shape[0],
+                        column: column + array.shape[1]]
+        if row < 0 or column < 0 or target.shape != array.shape:
+            raise ValueError("Wrong panel position {}, Position: {}".format(
+                detector.name, detector.position))
+        target[...] = array
+    for bad_place in bad_places((columns, rows), geom).values():
+        matrix[bad_place.max_y: bad_place.max_y + bad_place.shape[0],
+               bad_place.min_x: bad_place.min_x +
+               bad_place.array.shape[1]] = bad_place.get_array()
+    return matrix
@@ -1,10 +1,14 @@
 """This module depicts peaks on the panels
 gets the poles connection matrix from the h5 file,
-all peaks are kept in the list
+all peaks are kept in the arrays
 """
 
 import logging
 
+import numpy as np
+
+from .profiling import timed
+
 # remove all the handlers.
 for handler in logging.root.handlers[:]:
     logging.root.removeHandler(handler)
@@ -70,10 +74,15 @@ class Peak:
         return self.posx, self.posy
 
 
+@timed('peak_overlay_build', lambda peaks, *args: (len(peaks or []), 0))
 def get_list_peaks(matrix, image_size):
     """Return a list of class Peak form H5
     gets a matrix with data for all peas given
     file h5
+
+    Kept only for compatibility, `hdfsee.Image` uses
+    `get_peaks_array` instead.
+
     Returns
     -------
     peaks : list
@@ -88,3 +97,53 @@ def get_list_peaks(matrix, image_size):
         return peaks
     except IndexError:
         LOGGER.warning("Problem with peaks from the h5 file.")
+
+
+def count_peaks(peaks, *args):
+    """Returns the number of peaks and bytes of their arrays, for
+    the profiler.
+    """
+    if peaks is None:
+        return 0, 0
+    return len(peaks['intensity']), sum(array.nbytes
+                                        for array in peaks.values())
+
+
+@timed('peak_overlay_build', count_peaks)
+def get_peaks_array(matrix, image_size):
+    """Returns positions of the peaks from the H5 file in the image
+    and their intensities and offsets, converted by one expression
+    for all peaks.
+
+    Parameters
+    ----------
+    matrix : numpy.ndarray
+
+        The (N, 4) matrix from 'processing/hitfinder/peakinfo-assembled':
+        x, y with the origin in the center of the image,
+        intensity and offset of each peak.
+    image_size : tuple
+
+        Number of rows and columns of the image.
+
+    Returns
+    -------
+    peaks : dict
+
+        'position' - the (N, 2) array of x, y in the image,
+        'intensity' and 'offset' - arrays of N values,
+        None if there are no peaks or the matrix isn't a peak list.
+    """
+    # The file has no peaks, already reported.
+    if matrix is None:
+        return None
+    matrix = np.asarray(matrix)
+    if matrix.ndim != 2 or matrix.shape[1] < 4:
+        LOGGER.warning("Problem with peaks from the h5 file.")
+        return None
+    matrix = matrix.astype(float, copy=False)
+    # Origin of the image in the top left corner, y axis down.
+    position = (matrix[:, :2] * np.array([1.0, -1.0]) +
+                np.array([image_size[1], image_size[0]]) / 2.0)
+    return {'position': position, 'intensity': matrix[:, 2],
+            'offset': matrix[:, 3]}
@@ -0,0 +1,587 @@
+"""Module for the virtual powder patterns of a run: the sum, maximum
+or mean of the frames of HDF5 files, of all frames or of the hits
+listed in indexing stream file. The frames are read in slabs of
+consecutive events by worker processes and the result is written
+to HDF5 file, in the layout of the raw data for the image viewer
+and arranged with the geometry. The positions of all peaks of the
+stream file can also be counted on the arranged image, showing the
+rings and the offsets of the panels without reading the frames.
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import logging
+import os
+
+import h5py
+import numpy as np
+
+from .data import DATA_PATH
+from .h5pool import POOL_SIZE, configure, open_file
+from .panel import assemble, assembled_positions, image_size
+from .run_reader import SLAB_EVENTS, RunReader
+from .stream_tables import iter_chunks, iter_table_blocks
+
+# remove all the handlers.
+for handler in logging.root.handlers[:]:
+    logging.root.removeHandler(handler)
+LOGGER = logging.getLogger(__name__)
+# create console handler with a higher log level
+ch = logging.StreamHandler()
+# create formatter and add it to the handlers
+formatter = logging.Formatter(
+    '%(levelname)s | %(filename)s | %(funcName)s | %(lineno)d | %(message)s\n')
+ch.setFormatter(formatter)
+# add the handlers to logger
+LOGGER.addHandler(ch)
+LOGGER.setLevel("INFO")
+
+REDUCTIONS = ['sum', 'max', 'mean']
+# Path of the image arranged with the geometry in the written file.
+ASSEMBLED_PATH = '/data/assembled'
+# Paths of the histograms of the positions of the peaks and
+# the reflections in the written file.
+PEAK_POWDER_PATHS = {'peaks': '/data/peak_powder',
+                     'reflections': '/data/reflection_powder'}
+
+
+class FrameAccumulator:
+    """Reduction of frames added in parts, the parts can be added in any
+    order or merged from other processes.
+
+    Attributes
+    ----------
+    reduction : str
+
+        'sum', 'max' or 'mean'.
+    frames : int
+
+        Number of added frames.
+    total : numpy.ndarray
+
+        Sum or maximum of the frames, with the modules stacked along slow
+        scan, None before the first frame.
+    """
+
+    def __init__(self, reduction='sum'):
+        if reduction not in REDUCTIONS:
+            raise ValueError("Unknown reduction {}, use one of {}".format(
+                reduction, ", ".join(REDUCTIONS)))
+        self.reduction = reduction
+        self.frames = 0
+        self.total = None
+
+    def combine(self, total):
+        """Adds the sum or maximum of other frames."""
+        if self.total is None:
+            self.total = total
+        elif self.total.shape != total.shape:
+            raise ValueError("Frames of shape {} can't be added to {}".format(
+                total.shape, self.total.shape))
+        elif self.reduction == 'max':
+            np.fmax(self.total, total, out=self.total)
+        else:
+            self.total += total
+
+    def add(self, frames):
+        """Adds the frames.
+
+        Parameters
+        ----------
+        frames : numpy.ndarray
+
+            The (events, ss, fs) or (events, module, ss, fs) array.
+        """
+        if not len(frames):
+            return
+        frames = frames.reshape(len(frames), -1, frames.shape[-1])
+        if self.reduction == 'max':
+            total = frames.max(axis=0).astype(np.float64)
+        else:
+            total = frames.sum(axis=0, dtype=np.float64)
+        self.combine(total)
+        self.frames += len(frames)
+
+    def merge(self, other):
+        """Adds the frames of the other accumulator.
+
+        Parameters
+        ----------
+        other : The class:`FrameAccumulator`
+        """
+        if other.total is not None:
+            self.combine(other.total)
+        self.frames += other.frames
+
+    def result(self):
+        """Returns the reduced frame, None without frames."""
+        if self.total is None:
+            return None
+        if self.reduction == 'mean':
+            return self.total / self.frames
+        return self.total
+
+
+def reduce_run(files, data_path=DATA_PATH, reduction='sum', start=0,
+               stop=None, slab=SLAB_EVENTS):
+    """Returns the reduction of the events from start to stop of the run.
+
+    Parameters
+    ----------
+    files : list
+
+        Paths to the files of the run, see `run_reader.RunReader`.
+    data_path : Python unicode str (on py3)
+
+        Path of the image dataset. Default: DATA_PATH.
+    reduction : str
+
+        'sum', 'max' or 'mean'.
+    start, stop : int
+
+        Range of the events. Default: all events.
+    slab : int
+
+        Number of events read at once.
+
+    Returns
+    -------
+    accumulator : The class:`FrameAccumulator`
+    """
+    accumulator = FrameAccumulator(reduction)
+    run = RunReader(files, data_path)
+    for _, frames in run.iter_slabs(start, stop, slab):
+        accumulator.add(frames)
+    return accumulator
+
+
+def reduce_events(filename, events, data_path=DATA_PATH, reduction='sum',
+                  slab=SLAB_EVENTS):
+    """Returns the reduction of the events of the file, consecutive
+    events are read as one slab.
+
+    Parameters
+    ----------
+    filename : Python unicode str (on py3)
+
+        Path to hdf5 file.
+    events : list
+
+        Indices of the frames in the image dataset, ignored for 2-D one.
+    data_path : Python unicode str (on py3)
+
+        Path of the image dataset. Default: DATA_PATH.
+    reduction : str
+
+        'sum', 'max' or 'mean'.
+    slab : int
+
+        Maximum number of events read at once.
+
+    Returns
+    -------
+    accumulator : The class:`FrameAccumulator`
+    """
+    accumulator = FrameAccumulator(reduction)
+    dataset = open_file(filename)[data_path]
+    if dataset.ndim == 2:
+        accumulator.add(dataset[()][np.newaxis])
+        return accumulator
+    events = np.unique(np.asarray(events, dtype=int))
+    if not len(events):
+        return accumulator
+    # Starts of the runs of consecutive events.
+    breaks = np.flatnonzero(np.diff(events) != 1) + 1
+    for run in np.split(events, breaks):
+        for first in range(int(run[0]), int(run[-1]) + 1, slab):
+            accumulator.add(dataset[first: min(first + slab,
+                                               int(run[-1]) + 1)])
+    return accumulator
+
+
+def stream_frames(streamfile, hits_only=True):
+    """Returns the frames listed in the stream file, by their file.
+
+    Parameters
+    ----------
+    streamfile : Python unicode str (on py3)
+
+        Path to stream file.
+    hits_only : bool
+
+        Whether to leave out the frames which aren't hits.
+
+    Returns
+    -------
+    frames : dict
+
+        key - path to hdf5 file, relative ones found from the current
+        directory or the directory of the stream file,
+        value - list of the events, None for files of single frames.
+    """
+    directory = os.path.dirname(os.path.abspath(streamfile))
+    frames = {}
+    for chunk in iter_chunks(streamfile):
+        fields = chunk['fields']
+        if hits_only and fields.get('hit', '').strip() == '0':
+            continue
+        filename = fields.get('Image filename', '').strip()
+        if not filename:
+            continue
+        if not os.path.exists(filename) and not os.path.isabs(filename):
+            filename = os.path.join(directory, filename)
+        event = fields.get('Event', '').strip().lstrip('/')
+        frames.setdefault(filename, []).append(int(event) if event.isdigit()
+                                               else None)
+    return frames
+
+
+def reduce_parts(function, arguments, reduction, processes=None):
+    """Returns the merged reductions of the parts, computed by worker
+    processes.
+
+    Parameters
+    ----------
+    function : function
+
+        `reduce_run` or `reduce_events`.
+    arguments : list
+
+        Tuples of the arguments of the parts.
+    reduction : str
+
+        'sum', 'max' or 'mean'.
+    processes : int
+
+        Number of worker processes, 1 reduces the parts in this process.
+        Default: None, the number of CPUs.
+
+    Returns
+    -------
+    accumulator : The class:`FrameAccumulator`
+    """
+    accumulator = FrameAccumulator(reduction)
+    if processes == 1 or len(arguments) < 2:
+        for part in arguments:
+            accumulator.merge(function(*part))
+        return accumulator
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        for part in executor.map(function, *zip(*arguments)):
+            accumulator.merge(part)
+    return accumulator
+
+
+def run_powder(files, data_path=DATA_PATH, reduction='sum', processes=None,
+               parts=None, slab=SLAB_EVENTS):
+    """Returns the reduction of all frames of the run, parts of the events
+    are read by worker processes.
+
+    Parameters
+    ----------
+    files : list
+
+        Paths to the files of the run, see `run_reader.RunReader`.
+    data_path : Python unicode str (on py3)
+
+        Path of the image dataset. Default: DATA_PATH.
+    reduction : str
+
+        'sum', 'max' or 'mean'.
+    processes : int
+
+        Number of worker processes, 1 reads the files in this process.
+        Default: None, the number of CPUs.
+    parts : int
+
+        Number of parts of the events. Default: None, 4 per process.
+    slab : int
+
+        Number of events read at once.
+
+    Returns
+    -------
+    accumulator : The class:`FrameAccumulator`
+    """
+    events = len(RunReader(files, data_path))
+    if parts is None:
+        parts = 1 if processes == 1 else 4 * (processes or
+                                              os.cpu_count() or 1)
+    firsts = np.unique(np.linspace(0, events, parts + 1).astype(int))
+    arguments = [(files, data_path, reduction, int(first), int(last), slab)
+                 for first, last in zip(firsts[:-1], firsts[1:])]
+    return reduce_parts(reduce_run, arguments, reduction, processes)
+
+
+def stream_powder(streamfile, data_path=DATA_PATH, reduction='sum',
+                  hits_only=True, processes=None, parts=None,
+                  slab=SLAB_EVENTS):
+    """Returns the reduction of the frames listed in the stream file,
+    parts of the events of the files are read by worker processes.
+
+    Parameters
+    ----------
+    streamfile : Python unicode str (on py3)
+
+        Path to stream file.
+    data_path : Python unicode str (on py3)
+
+        Path of the image dataset in each listed file, without `{module}`.
+        Default: DATA_PATH.
+    reduction : str
+
+        'sum', 'max' or 'mean'.
+    hits_only : bool
+
+        Whether to leave out the frames which aren't hits.
+    processes : int
+
+        Number of worker processes, 1 reads the files in this process.
+        Default: None, the number of CPUs.
+    parts : int
+
+        Number of parts of the events of each file.
+        Default: None, 4 per process over all files.
+    slab : int
+
+        Maximum number of events read at once.
+
+    Returns
+    -------
+    accumulator : The class:`FrameAccumulator`
+
+    Raises
+    ------
+    ValueError
+
+        If the dataset path has `{module}`, the stream file doesn't
+        name the files of the modules.
+    """
+    if '{module}' in data_path:
+        raise ValueError("Dataset path {} of module files can't be used"
+                         " with the stream file".format(data_path))
+    frames = stream_frames(streamfile, hits_only)
+    if parts is None:
+        parts = max(1, (4 * (processes or os.cpu_count() or 1)) //
+                    max(len(frames), 1))
+    arguments = []
+    for filename, events in frames.items():
+        if None in events:
+            # The only frame of the file.
+            arguments.append((filename, [], data_path, reduction, slab))
+            continue
+        events = np.unique(events)
+        for part in np.array_split(events, min(parts, len(events))):
+            arguments.append((filename, part.tolist(), data_path,
+                              reduction, slab))
+    return reduce_parts(reduce_events, arguments, reduction, processes)
+
+
+def write_powder(filename, accumulator, geom=None, dataset=DATA_PATH):
+    """Writes the reduced frame to HDF5 file, with the reduction and the
+    number of frames as attributes.
+
+    Parameters
+    ----------
+    filename : Python unicode str (on py3)
+
+        Path to the new hdf5 file.
+    accumulator : The class:`FrameAccumulator`
+    geom : dict
+
+        Geometry from `load_crystfel_geometry`, the frame arranged with it
+        is also written to ASSEMBLED_PATH. Default: None.
+    dataset : Python unicode str (on py3)
+
+        Path of the frame, in the layout of the raw data. Default: DATA_PATH.
+
+    Raises
+    ------
+    ValueError
+
+        If there are no frames.
+    """
+    frame = accumulator.result()
+    if frame is None:
+        raise ValueError("There are no frames to write")
+    with h5py.File(filename, 'w') as file:
+        data = file.create_dataset(dataset, data=frame.astype(np.float32))
+        datasets = [data]
+        if geom is not None:
+            datasets.append(file.create_dataset(
+                ASSEMBLED_PATH, data=assemble(frame, geom).astype(
+                    np.float32)))
+        for data in datasets:
+            data.attrs['reduction'] = accumulator.reduction
+            data.attrs['frames'] = accumulator.frames
+
+
+def peak_powder(streamfile, geom, reflections=False, block_size=10000):
+    """Returns the numbers of the peaks of all frames of the stream file
+    at each pixel of the image arranged with the geometry, read in
+    a single pass over the blocks of the peak tables.
+
+    Parameters
+    ----------
+    streamfile : Python unicode str (on py3)
+
+        Path to stream file.
+    geom : dict
+
+        Geometry from `load_crystfel_geometry`.
+    reflections : bool
+
+        Whether to count also the reflections measured after indexing.
+    block_size : int
+
+        Number of chunks converted at once.
+
+    Returns
+    -------
+    histograms : dict
+
+        key - 'peaks' and 'reflections',
+        value - numpy.ndarray of the shape of the arranged image.
+    """
+    columns, rows, _, _ = image_size(geom)
+    names = ['peaks'] + (['reflections'] if reflections else [])
+    counts = {name: np.zeros(columns * rows, dtype=np.int64)
+              for name in names}
+    for tables in iter_table_blocks(streamfile, block_size):
+        for name in names:
+            table = tables[name]
+            posx, posy = assembled_positions(geom, table['panel_name'],
+                                             table['fs_px'], table['ss_px'])
+            posx = np.rint(posx)
+            posy = np.rint(posy)
+            # The rows of the image are along its first axis.
+            inside = ((posx >= 0) & (posx < rows) &
+                      (posy >= 0) & (posy < columns))
+            pixels = (posy[inside].astype(np.int64) * rows +
+                      posx[inside].astype(np.int64))
+            counts[name] += np.bincount(pixels, minlength=columns * rows)
+    return {name: count.reshape(columns, rows)
+            for name, count in counts.items()}
+
+
+def write_peak_powder(filename, histograms):
+    """Writes the histograms of the peaks to HDF5 file, to
+    PEAK_POWDER_PATHS, with their total as attribute.
+
+    Parameters
+    ----------
+    filename : Python unicode str (on py3)
+
+        Path to the new hdf5 file.
+    histograms : dict
+
+        Histograms from `peak_powder`.
+    """
+    with h5py.File(filename, 'w') as file:
+        for name, histogram in histograms.items():
+            data = file.create_dataset(PEAK_POWDER_PATHS[name],
+                                       data=histogram.astype(np.int32),
+                                       compression='gzip')
+            data.attrs['total'] = int(histogram.sum())
+
+
+def show_peak_powder(histograms):
+    """Displays the histograms of the peaks with logarithmic colours.
+
+    Parameters
+    ----------
+    histograms : dict
+
+        Histograms from `peak_powder`.
+    """
+    # Only the display needs matplotlib.
+    import matplotlib.pyplot as plt
+    from matplotlib.colors import LogNorm
+    fig, axes = plt.subplots(1, len(histograms), squeeze=False,
+                             figsize=(9.5 * len(histograms), 9.5))
+    for ax, (name, histogram) in zip(axes[0], histograms.items()):
+        ax.imshow(np.ma.masked_equal(histogram, 0), cmap='inferno',
+                  norm=LogNorm())
+        ax.set_title("{} ({} in total)".format(name, histogram.sum()))
+    plt.show()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Sum, maximum or mean of the frames of a run.")
+    parser.add_argument('filenames', nargs='*', metavar='name.H5',
+                        help="Files of the run, all their frames are used")
+    parser.add_argument('-s', '--stream', metavar='name.STREAM',
+                        help="Use the frames listed in the stream file")
+    parser.add_argument('--all-frames', action='store_true',
+                        help="Use also the frames of the stream file which" +
+                        " aren't hits")
+    parser.add_argument('-r', '--reduction', choices=REDUCTIONS,
+                        default='sum', help="(default: %(default)s)")
+    parser.add_argument('-g', '--geomfile', metavar='name.GEOM',
+                        help="Also write the frame arranged with the" +
+                        " geometry to " + ASSEMBLED_PATH)
+    parser.add_argument('-d', '--data', default=DATA_PATH, metavar='PATH',
+                        help="Path of the image dataset, {module} is number" +
+                        " of the module in the files of the run" +
+                        " (default: %(default)s)")
+    parser.add_argument('-o', '--output', default='powder.h5',
+                        metavar='FILE',
+                        help="The new HDF5 file (default: %(default)s)")
+    parser.add_argument('-j', '--processes', type=int, default=None,
+                        help="Number of worker processes")
+    parser.add_argument('--peaks', action='store_true',
+                        help="Count the peaks of the stream file at the" +
+                        " pixels of the image arranged with the geometry," +
+                        " instead of reading the frames")
+    parser.add_argument('--reflections', action='store_true',
+                        help="With --peaks, count also the reflections" +
+                        " measured after indexing")
+    parser.add_argument('--show', action='store_true',
+                        help="Display the result in the image viewer")
+    parser.add_argument('--pool-size', type=int, metavar='N',
+                        help="Number of HDF5 files kept open, at least" +
+                        " the number of modules (default: {})".format(
+                            POOL_SIZE))
+    args = parser.parse_args(argv)
+    if args.pool_size:
+        # Set before the worker processes are started.
+        configure(size=args.pool_size)
+    if args.peaks:
+        if args.stream is None or args.geomfile is None:
+            parser.error("--peaks needs the stream file and the geometry")
+        from cfelpyutils.crystfel_utils import load_crystfel_geometry
+        histograms = peak_powder(args.stream,
+                                 load_crystfel_geometry(args.geomfile),
+                                 args.reflections)
+        write_peak_powder(args.output, histograms)
+        LOGGER.info("Written %d peaks to %s", histograms['peaks'].sum(),
+                    args.output)
+        if args.show:
+            show_peak_powder(histograms)
+        return 0
+    if args.stream is None and not args.filenames:
+        parser.error("give the files of the run or the stream file")
+    if args.stream is not None and '{module}' in args.data:
+        parser.error("{module} in --data needs the files of the run," +
+                     " not --stream")
+    if args.stream is not None:
+        accumulator = stream_powder(args.stream, args.data, args.reduction,
+                                    not args.all_frames, args.processes)
+    else:
+        accumulator = run_powder(args.filenames, args.data, args.reduction,
+                                 args.processes)
+    geom = None
+    if args.geomfile:
+        from cfelpyutils.crystfel_utils import load_crystfel_geometry
+        geom = load_crystfel_geometry(args.geomfile)
+    write_powder(args.output, accumulator, geom)
+    LOGGER.info("Written %s of %d frames to %s", accumulator.reduction,
+                accumulator.frames, args.output)
+    if args.show:
+        # The viewer needs matplotlib, not needed for the batch run.
+        from .hdfsee import Image
+        Image(args.output, geomfile=args.geomfile)
+    return 0
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,272 @@
+"""Module for opt-in timing of the named phases of a session: parsing,
+reading HDF5, arranging the panels, updating the histograms, drawing...
+Timing is enabled by the `--profile` option of `hdfsee_py` and
+`cell_explorer_py` or the environment variable `CRYSTFEL_JUPYTER_PROFILE`
+with the name of the report, which is written at exit as JSON, or as
+folded stacks for flamegraph.pl and speedscope when the name ends
+with `.folded`. When not enabled the phases cost a function call.
+"""
+import atexit
+import functools
+import json
+import os
+import sys
+import time
+import weakref
+
+# Environment variable with the name of the report.
+PROFILE_ENV = 'CRYSTFEL_JUPYTER_PROFILE'
+# Names of the phases of the instrumented code.
+PHASES = ['parse', 'cell_compute', 'hdf5_read', 'geometry_compile',
+          'assembly', 'bad_region_masking', 'peak_overlay_build',
+          'histogram_update', 'canvas_draw']
+
+
+class Phase:
+    """Single timing of a phase, records and bytes processed can be set
+    before its end.
+
+    Attributes
+    ----------
+    name : str
+
+        Name of the phase.
+    records : int
+
+        Number of records (crystals, peaks, panels...) processed.
+    nbytes : int
+
+        Number of bytes processed.
+    """
+    __slots__ = ['profiler', 'name', 'records', 'nbytes', 'start']
+
+    def __init__(self, profiler, name, records=0, nbytes=0):
+        self.profiler = profiler
+        self.name = name
+        self.records = records
+        self.nbytes = nbytes
+        self.start = None
+
+    def __enter__(self):
+        if self.profiler.enabled:
+            self.profiler.stack.append(self.name)
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        if self.start is not None:
+            self.profiler.add(time.perf_counter() - self.start,
+                              self.records, self.nbytes)
+            self.profiler.stack.pop()
+
+
+class Profiler:
+    """Totals of the phases by their stack, phases started inside other
+    ones are nested.
+
+    Attributes
+    ----------
+    enabled : bool
+
+        Whether the phases are timed.
+    filename : Python unicode str (on py3)
+
+        Name of the report written at exit, None if not written.
+    stack : list
+
+        Names of the phases being timed.
+    totals : dict
+
+        key - tuple of the names of the stack,
+        value - list of calls, seconds, records and bytes.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.filename = None
+        self.stack = []
+        self.totals = {}
+        self.start = time.perf_counter()
+
+    def enable(self, filename=None):
+        """Starts timing the phases.
+
+        Parameters
+        ----------
+        filename : Python unicode str (on py3)
+
+            Name of the report written at exit. Default: None, not written.
+        """
+        if filename is not None and self.filename is None:
+            atexit.register(self.write_report)
+        self.filename = filename if filename is not None else self.filename
+        self.enabled = True
+
+    def disable(self):
+        """Stops timing the phases, the totals are kept."""
+        self.enabled = False
+
+    def reset(self):
+        """Forgets the totals."""
+        self.totals = {}
+        self.start = time.perf_counter()
+
+    def phase(self, name, records=0, nbytes=0):
+        """Returns the class:`Phase` for timing a `with` block."""
+        return Phase(self, name, records, nbytes)
+
+    def add(self, seconds, records=0, nbytes=0):
+        """Adds a timing of the phase on the top of the stack."""
+        total = self.totals.setdefault(tuple(self.stack), [0, 0.0, 0, 0])
+        total[0] += 1
+        total[1] += seconds
+        total[2] += records
+        total[3] += nbytes
+
+    def report(self):
+        """Returns the report.
+
+        Returns
+        -------
+        report : dict
+
+            'wall_seconds' since enabled or reset, 'phases' with calls,
+            seconds, records, bytes and their rates for each name, the
+            nested phases count also in their parents once,
+            and 'stacks' with the same for each stack and the seconds
+            outside of the nested phases ('self_seconds').
+        """
+        phases = {}
+        stacks = []
+        for stack, (calls, seconds, records, nbytes) in sorted(
+                self.totals.items()):
+            children = sum(total[1] for other, total in self.totals.items()
+                           if len(other) == len(stack) + 1 and
+                           other[:-1] == stack)
+            stacks.append({'stack': ';'.join(stack), 'calls': calls,
+                           'seconds': seconds,
+                           'self_seconds': max(seconds - children, 0.0),
+                           'records': records, 'bytes': nbytes})
+            # Recursive phases are counted at the outermost one.
+            if stack[-1] in stack[:-1]:
+                continue
+            phase = phases.setdefault(stack[-1], {
+                'calls': 0, 'seconds': 0.0, 'records': 0, 'bytes': 0})
+            phase['calls'] += calls
+            phase['seconds'] += seconds
+            phase['records'] += records
+            phase['bytes'] += nbytes
+        # Rates of the phases which count records or bytes.
+        for phase in phases.values():
+            seconds = phase['seconds']
+            phase['records_per_second'] = (phase['records'] / seconds
+                                           if seconds and phase['records']
+                                           else None)
+            phase['bytes_per_second'] = (phase['bytes'] / seconds
+                                         if seconds and phase['bytes']
+                                         else None)
+        return {'argv': sys.argv, 'pid': os.getpid(),
+                'wall_seconds': time.perf_counter() - self.start,
+                'phases': phases, 'stacks': stacks}
+
+    def folded(self):
+        """Returns the stacks in the folded format of flamegraph.pl,
+        lines `phase;nested phase microseconds` of the self time.
+        """
+        return ["{} {}".format(stack['stack'],
+                               int(round(stack['self_seconds'] * 1e6)))
+                for stack in self.report()['stacks']]
+
+    def write_report(self, filename=None):
+        """Writes the report to JSON file or, for the `.folded`
+        extension, the folded stacks.
+
+        Parameters
+        ----------
+        filename : Python unicode str (on py3)
+
+            Default: None, the name given to `enable`.
+        """
+        filename = filename if filename is not None else self.filename
+        if filename is None or not self.totals:
+            return
+        with open(filename, 'w') as file:
+            if filename.endswith('.folded'):
+                file.write("\n".join(self.folded()) + "\n")
+            else:
+                json.dump(self.report(), file, indent=1)
+
+
+# The profiler of this process.
+PROFILER = Profiler()
+# Figures whose drawing is timed.
+_FIGURES = weakref.WeakSet()
+
+
+def enable(filename=None):
+    """Starts timing the phases, see `Profiler.enable`."""
+    PROFILER.enable(filename)
+
+
+def phase(name, records=0, nbytes=0):
+    """Returns the class:`Phase` for timing a `with` block::
+
+        with phase('parse') as timing:
+            crystals = parse(file_name)
+            timing.records = len(crystals)
+    """
+    return PROFILER.phase(name, records, nbytes)
+
+
+def timed(name, count=None):
+    """Decorator timing each call of the function as the phase.
+
+    Parameters
+    ----------
+    name : str
+
+        Name of the phase.
+    count : function
+
+        Called with the result and the arguments of the function,
+        returns (records, bytes) processed. Default: None, no counts.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not PROFILER.enabled:
+                return function(*args, **kwargs)
+            with PROFILER.phase(name) as timing:
+                result = function(*args, **kwargs)
+                if count is not None:
+                    timing.records, timing.nbytes = count(result, *args,
+                                                          **kwargs)
+            return result
+        return wrapper
+    return decorator
+
+
+def file_size(file_name):
+    """Returns size of the file, 0 if it can't be found."""
+    try:
+        return os.path.getsize(file_name)
+    except (OSError, TypeError):
+        return 0
+
+
+def instrument_figure(fig):
+    """Times the drawing of the figure as 'canvas_draw' phase,
+    when the profiler is enabled.
+
+    Parameters
+    ----------
+    fig : The class:`matplotlib.figure.Figure`
+    """
+    if not PROFILER.enabled or fig in _FIGURES:
+        return
+    _FIGURES.add(fig)
+    fig.draw = timed('canvas_draw')(fig.draw)
+
+
+if os.environ.get(PROFILE_ENV):
+    enable(os.environ[PROFILE_ENV])
@@ -0,0 +1,290 @@
+"""Module for the reduction of the unit cells to the canonical setting,
+so equivalent cells of many crystals fall into the same histogram peaks.
+All functions work on batches of cells.
+"""
+import numpy as np
+
+# Index of the axis perpendicular to the centered face.
+FACE_CENTERING = 'ABC'
+# Index of the unique axis of the standard setting.
+STANDARD_UNIQUE_AXIS = {'monoclinic': 1, 'tetragonal': 2, 'hexagonal': 2}
+
+
+def direct_vectors(reciprocal):
+    """Returns the direct cell vectors of the reciprocal ones.
+
+    Parameters
+    ----------
+    reciprocal : numpy.ndarray
+
+        The (N, 3, 3) array, for each crystal rows `astar`, `bstar`,
+        `cstar` from the stream file in nm^-1.
+
+    Returns
+    -------
+    vectors : numpy.ndarray
+
+        The (N, 3, 3) array, for each crystal rows a, b, c in Angstroms.
+    """
+    return 10 * np.linalg.inv(np.swapaxes(reciprocal, 1, 2))
+
+
+def cell_parameters(vectors):
+    """Calculates unit cell parameters of the cells.
+
+    Parameters
+    ----------
+    vectors : numpy.ndarray
+
+        The (N, 3, 3) array, for each crystal rows a, b, c.
+
+    Returns
+    -------
+    parameters : numpy.ndarray
+
+        The (N, 6) matrix with a, b, c, alfa, beta, gamma.
+    """
+    lengths = np.linalg.norm(vectors, axis=2)
+    angles = []
+    for first, second in [(1, 2), (0, 2), (0, 1)]:
+        dot = np.einsum('ni,ni->n', vectors[:, first], vectors[:, second])
+        cosine = dot / (lengths[:, first] * lengths[:, second])
+        angles.append(np.rad2deg(np.arccos(np.clip(cosine, -1, 1))))
+    return np.column_stack([lengths] + angles)
+
+
+def buerger_reduce(vectors, max_iterations=100):
+    """Reduces the cells to the shortest three non-coplanar vectors
+    (Buerger reduction) with the Niggli convention of all angles either
+    acute or not acute. The basis stays right-handed.
+
+    Parameters
+    ----------
+    vectors : numpy.ndarray
+
+        The (N, 3, 3) array, for each crystal rows a, b, c
+        of the primitive cell.
+    max_iterations : int
+
+        Maximum number of reduction rounds.
+
+    Returns
+    -------
+    vectors : numpy.ndarray
+
+        The (N, 3, 3) array with the reduced cells, a <= b <= c.
+    """
+    vectors = np.array(vectors, dtype=float)
+    for _ in range(max_iterations):
+        changed = False
+        # Shorten each vector by multiples of each other one.
+        for first in range(3):
+            for second in range(3):
+                if first == second:
+                    continue
+                dot = np.einsum('ni,ni->n', vectors[:, first],
+                                vectors[:, second])
+                multiple = np.rint(dot / np.einsum(
+                    'ni,ni->n', vectors[:, first], vectors[:, first]))
+                active = multiple != 0
+                if active.any():
+                    changed = True
+                    vectors[active, second] -= (multiple[active, np.newaxis] *
+                                                vectors[active, first])
+        # Pairwise reduced cells can still be shortened by the sum
+        # or the difference of the two shorter vectors.
+        vectors = sort_by_length(vectors)
+        lengths = np.einsum('nij,nij->ni', vectors, vectors)
+        for first_sign in (1, -1):
+            for second_sign in (1, -1):
+                candidate = (vectors[:, 2] + first_sign * vectors[:, 0] +
+                             second_sign * vectors[:, 1])
+                shorter = (np.einsum('ni,ni->n', candidate, candidate) <
+                           lengths[:, 2] * (1 - 1e-9))
+                if shorter.any():
+                    changed = True
+                    vectors[shorter, 2] = candidate[shorter]
+                    lengths[shorter, 2] = np.einsum(
+                        'ni,ni->n', candidate[shorter], candidate[shorter])
+        if not changed:
+            break
+    return niggli_signs(sort_by_length(vectors))
+
+
+def sort_by_length(vectors):
+    """Returns the cells with vectors sorted by length.
+
+    Parameters
+    ----------
+    vectors : numpy.ndarray
+
+        The (N, 3, 3) array, for each crystal rows a, b, c.
+    """
+    order = np.argsort(np.einsum('nij,nij->ni', vectors, vectors), axis=1,
+                       kind='stable')
+    return np.take_along_axis(vectors, order[:, :, np.newaxis], axis=1)
+
+
+def niggli_signs(vectors):
+    """Changes signs of the vectors so all angles are acute (type I cell)
+    or all are not acute (type II cell), then keeps the basis right-handed
+    by changing signs of all of them.
+
+    Parameters
+    ----------
+    vectors : numpy.ndarray
+
+        The (N, 3, 3) array, for each crystal rows a, b, c.
+    """
+    vectors = np.array(vectors, dtype=float)
+    # Right angles count as not acute.
+    signs = [np.where(np.einsum('ni,ni->n', vectors[:, first],
+                                vectors[:, second]) > 0, 1, -1)
+             for first, second in [(0, 1), (0, 2), (1, 2)]]
+    # The product of the three signs doesn't depend on the signs
+    # of the vectors, it is the type of the cell.
+    cell_type = signs[0] * signs[1] * signs[2]
+    vectors[:, 1] *= (cell_type * signs[0])[:, np.newaxis]
+    vectors[:, 2] *= (cell_type * signs[1])[:, np.newaxis]
+    left_handed = np.linalg.det(vectors) < 0
+    vectors[left_handed] *= -1
+    return vectors
+
+
+def cyclic_shift(vectors, centering, unique_axis, rows, shift):
+    """Renames the axes of the cells: new axis i is the old axis
+    i + shift, the face centering and the unique axis are renamed too.
+
+    Parameters
+    ----------
+    vectors : numpy.ndarray
+
+        The (N, 3, 3) array, changed in place.
+    centering : numpy.ndarray
+
+        Centering of each crystal, changed in place.
+    unique_axis : numpy.ndarray
+
+        Unique axis of each crystal, changed in place.
+    rows : numpy.ndarray
+
+        The crystals to change.
+    shift : int
+
+        Number of places, the handedness doesn't change.
+    """
+    if len(rows) == 0 or shift % 3 == 0:
+        return
+    vectors[rows] = np.roll(vectors[rows], -shift, axis=1)
+    for names, values in [(FACE_CENTERING, centering), ('abc', unique_axis)]:
+        old = values[rows]
+        for index, name in enumerate(names):
+            values[rows[old == name]] = names[(index - shift) % 3]
+
+
+def swap_axes(vectors, rows, first, second):
+    """Swaps two axes of the cells, the third one changes its sign
+    so the basis stays right-handed.
+
+    Parameters
+    ----------
+    vectors : numpy.ndarray
+
+        The (N, 3, 3) array, changed in place.
+    rows : numpy.ndarray
+
+        The crystals to change.
+    first : int
+
+        Index of the axis.
+    second : int
+
+        Index of the other axis.
+    """
+    if len(rows) == 0:
+        return
+    third = 3 - first - second
+    swapped = vectors[rows]
+    swapped[:, [first, second]] = swapped[:, [second, first]]
+    swapped[:, third] *= -1
+    vectors[rows] = swapped
+
+
+def canonical_cells(reciprocal, lattice_type, centering, unique_axis):
+    """Brings the cells of many crystals to the canonical setting:
+
+    - triclinic cells are Buerger reduced with Niggli signs,
+    - the unique axis of monoclinic cells is b with beta >= 90 and for
+      primitive ones a <= c, the unique axis of tetragonal and hexagonal
+      cells is c,
+    - the centered face of orthorhombic cells is C and a <= b <= c
+      as far as the centering allows.
+
+    Other cells are kept.
+
+    Parameters
+    ----------
+    reciprocal : numpy.ndarray
+
+        The (N, 3, 3) array, for each crystal rows `astar`, `bstar`,
+        `cstar` from the stream file in nm^-1.
+    lattice_type : list
+
+        Lattice type of each crystal e.g. 'monoclinic'.
+    centering : list
+
+        Centering of each crystal e.g. 'C'.
+    unique_axis : list
+
+        Unique axis of each crystal e.g. 'b', '?' if not known.
+
+    Returns
+    -------
+    parameters, centering, unique_axis : tuple
+
+        parameters : The (N, 6) matrix with a, b, c, alfa, beta, gamma.
+        centering, unique_axis : arrays of str in the canonical setting.
+    """
+    vectors = direct_vectors(np.asarray(reciprocal, dtype=float).reshape(
+        -1, 3, 3))
+    lattice_type = np.asarray(lattice_type, dtype=str)
+    centering = np.array(centering, dtype='<U2')
+    unique_axis = np.array(unique_axis, dtype='<U2')
+
+    rows = np.flatnonzero((lattice_type == 'triclinic') & (centering == 'P'))
+    vectors[rows] = buerger_reduce(vectors[rows])
+
+    for lattice, standard in STANDARD_UNIQUE_AXIS.items():
+        for index, axis in enumerate('abc'):
+            rows = np.flatnonzero((lattice_type == lattice) &
+                                  (unique_axis == axis))
+            cyclic_shift(vectors, centering, unique_axis, rows,
+                         (index - standard) % 3)
+
+    monoclinic = lattice_type == 'monoclinic'
+    rows = np.flatnonzero(monoclinic & (unique_axis == 'b') & (np.einsum(
+        'ni,ni->n', vectors[:, 0], vectors[:, 2]) > 0))
+    # b and c change the sign, beta becomes obtuse.
+    vectors[rows, 1] *= -1
+    vectors[rows, 2] *= -1
+    lengths = np.linalg.norm(vectors, axis=2)
+    swap_axes(vectors, np.flatnonzero(
+        monoclinic & (unique_axis == 'b') & (centering == 'P') &
+        (lengths[:, 0] > lengths[:, 2])), 0, 2)
+
+    orthorhombic = lattice_type == 'orthorhombic'
+    for index, face in enumerate(FACE_CENTERING):
+        cyclic_shift(vectors, centering, unique_axis, np.flatnonzero(
+            orthorhombic & (centering == face)), (index - 2) % 3)
+    # Swaps which keep the centering: a and b of C cells, all of the others.
+    pairs = {'C': [(0, 1)]}
+    for name in ['P', 'I', 'F']:
+        pairs[name] = [(0, 1), (1, 2), (0, 1)]
+    for name, swaps in pairs.items():
+        for first, second in swaps:
+            lengths = np.linalg.norm(vectors, axis=2)
+            swap_axes(vectors, np.flatnonzero(
+                orthorhombic & (centering == name) &
+                (lengths[:, first] > lengths[:, second])), first, second)
+    return (cell_parameters(vectors), centering.astype(str),
+            unique_axis.astype(str))
@@ -0,0 +1,324 @@
+"""Module for reading a run split into many HDF5 files: sequence files
+with consecutive frames and files of the detector modules (AGIPD00,
+AGIPD01...). The run is one `(event, module, ss, fs)` array, each read
+takes the slabs from the files through an index of their frame ranges,
+without copying the run into one file. The index can also be written
+as HDF5 virtual dataset for other programs.
+"""
+import argparse
+import logging
+import os
+import re
+
+import h5py
+import numpy as np
+
+from .data import DATA_PATH
+from .h5pool import POOL, POOL_SIZE, configure, open_file
+
+# remove all the handlers.
+for handler in logging.root.handlers[:]:
+    logging.root.removeHandler(handler)
+LOGGER = logging.getLogger(__name__)
+# create console handler with a higher log level
+ch = logging.StreamHandler()
+# create formatter and add it to the handlers
+formatter = logging.Formatter(
+    '%(levelname)s | %(filename)s | %(funcName)s | %(lineno)d | %(message)s\n')
+ch.setFormatter(formatter)
+# add the handlers to logger
+LOGGER.addHandler(ch)
+LOGGER.setLevel("INFO")
+
+# Module number in the names of the files of the modules.
+MODULE_PATTERN = r'(?:AGIPD|LPD|DSSC|JNGFR)(\d+)'
+# Default number of events of the slabs.
+SLAB_EVENTS = 16
+
+
+class Section:
+    """Sequence files of the same modules, their frames follow each other.
+
+    Attributes
+    ----------
+    module : int
+
+        Number of the module in the names of the files, 0 if not given.
+    files : list
+
+        Paths to the files in order of the frames.
+    data_path : Python unicode str (on py3)
+
+        Path of the image dataset in the files.
+    starts : numpy.ndarray
+
+        Index of the first frame of each file in the run,
+        with the number of frames at the end.
+    modules : int
+
+        Number of modules in each file.
+    frame_shape : tuple
+
+        Size of the slow scan and fast scan of the modules.
+    dtype : The class:`numpy.dtype`
+
+        Type of the data.
+    """
+
+    def __init__(self, module, files, data_path):
+        self.module = module
+        self.files = files
+        self.data_path = data_path
+        counts = []
+        shapes = set()
+        for filename in files:
+            dataset = open_file(filename)[data_path]
+            if dataset.ndim not in (2, 3, 4):
+                raise ValueError("Dataset {} in {} isn't 2-D, 3-D or 4-D"
+                                 .format(data_path, filename))
+            counts.append(dataset.shape[0] if dataset.ndim > 2 else 1)
+            shapes.add((dataset.shape[1] if dataset.ndim == 4 else 1,) +
+                       dataset.shape[-2:])
+            self.dtype = dataset.dtype
+        if len(shapes) != 1:
+            raise ValueError("Files of module {} have different frame"
+                             " shapes {}".format(module, sorted(shapes)))
+        shape = shapes.pop()
+        self.modules = shape[0]
+        self.frame_shape = shape[1:]
+        self.starts = np.concatenate([[0], np.cumsum(counts)]).astype(int)
+
+    def __len__(self):
+        return int(self.starts[-1])
+
+    def slabs(self, start, stop):
+        """Returns (file index, first and last frame in the file,
+        first frame in the run) of the files with the frames.
+        """
+        slabs = []
+        index = int(np.searchsorted(self.starts, start, side='right')) - 1
+        while start < stop:
+            end = min(stop, int(self.starts[index + 1]))
+            first = int(self.starts[index])
+            slabs.append((index, start - first, end - first, start))
+            start = end
+            index += 1
+        return slabs
+
+    def read(self, start, stop, out):
+        """Reads the frames from start to stop into the (frames, modules,
+        ss, fs) array.
+        """
+        for index, first, last, position in self.slabs(start, stop):
+            dataset = open_file(self.files[index])[self.data_path]
+            target = out[position - start: position - start + last - first]
+            if dataset.ndim == 2:
+                target[:, 0] = dataset[()]
+            elif dataset.ndim == 3:
+                target[:, 0] = dataset[first:last]
+            else:
+                target[...] = dataset[first:last]
+
+
+class RunReader:
+    """All frames of a run as one (event, module, ss, fs) array.
+    The pool of open files of this process, see `h5pool`, is enlarged
+    to keep a file of each module open between the reads.
+
+    Attributes
+    ----------
+    files : list
+
+        Paths to all files of the run.
+    sections : list
+
+        The class:`Section` of each module number, in order
+        of the modules.
+    shape : tuple
+
+        Number of events, modules, slow scan and fast scan pixels.
+    dtype : The class:`numpy.dtype`
+
+        Type of the data.
+    """
+
+    def __init__(self, files, data_path=DATA_PATH,
+                 module_pattern=MODULE_PATTERN):
+        """
+        Parameters
+        ----------
+        files : list
+
+            Paths to the files of the run.
+        data_path : Python unicode str (on py3)
+
+            Path of the image dataset, `{module}` is replaced by number
+            of the module. Default: DATA_PATH.
+        module_pattern : Python unicode str (on py3)
+
+            Regular expression with the number of the module in the names
+            of the files as first group. Default: MODULE_PATTERN.
+
+        Raises
+        ------
+        ValueError
+
+            If there are no files or their frames have different shapes.
+        """
+        if not files:
+            raise ValueError("There are no files in the run")
+        self.files = sorted(files)
+        groups = {}
+        for filename in self.files:
+            match = re.search(module_pattern, os.path.basename(filename))
+            module = int(match.group(1)) if match else 0
+            groups.setdefault(module, []).append(filename)
+        # Each frame is read from a file of every module, all of them
+        # have to stay open in the pool.
+        configure(size=max(POOL.size, len(groups)))
+        self.sections = [Section(module, groups[module],
+                                 data_path.format(module=module))
+                         for module in sorted(groups)]
+        shapes = {section.frame_shape for section in self.sections}
+        if len(shapes) != 1:
+            raise ValueError("Modules have different frame shapes {}".format(
+                sorted(shapes)))
+        events = [len(section) for section in self.sections]
+        if len(set(events)) != 1:
+            LOGGER.warning("Modules have different numbers of frames %s,"
+                           " the run has %d", events, min(events))
+        self.shape = ((min(events), sum(section.modules
+                                        for section in self.sections)) +
+                      shapes.pop())
+        self.dtype = np.result_type(*[section.dtype
+                                      for section in self.sections])
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, event):
+        """Returns the (module, ss, fs) array of the event."""
+        if not -len(self) <= event < len(self):
+            raise IndexError("There is no event {} in the run of {}"
+                             " events".format(event, len(self)))
+        event = event % len(self)
+        return self.read(event, event + 1)[0]
+
+    def read(self, start, stop):
+        """Returns the (events, module, ss, fs) array of the events from
+        start to stop.
+        """
+        start = max(start, 0)
+        stop = min(stop, len(self))
+        out = np.empty((max(stop - start, 0),) + self.shape[1:],
+                       dtype=self.dtype)
+        module = 0
+        for section in self.sections:
+            section.read(start, stop,
+                         out[:, module: module + section.modules])
+            module += section.modules
+        return out
+
+    def iter_slabs(self, start=0, stop=None, size=SLAB_EVENTS):
+        """Yields (first event, (events, module, ss, fs) array) of the
+        slabs of up to `size` events from start to stop.
+        """
+        stop = len(self) if stop is None else min(stop, len(self))
+        for first in range(start, stop, size):
+            yield first, self.read(first, min(first + size, stop))
+
+    def frame(self, event):
+        """Returns the frame of the event with the modules stacked along
+        slow scan, as the panels of the geometry see it.
+        """
+        data = self[event]
+        return data.reshape(-1, data.shape[-1])
+
+    def locate(self, event):
+        """Returns the file of the first module with the event and index
+        of the frame in it, as the stream file names the frame.
+        """
+        section = self.sections[0]
+        index, first, _, _ = section.slabs(event, event + 1)[0]
+        return section.files[index], first
+
+    def get_diction_data(self, event=None):
+        """Returns the frame of the event as `data.get_diction_data`,
+        without peaks.
+        """
+        return {"Panels": self.frame(0 if event is None else event),
+                "Peaks": None, "Events": len(self)}
+
+    def write_virtual(self, filename, dataset=DATA_PATH):
+        """Writes the run as HDF5 virtual dataset, which reads the frames
+        from the files of the run.
+
+        Parameters
+        ----------
+        filename : Python unicode str (on py3)
+
+            Path to the new hdf5 file.
+        dataset : Python unicode str (on py3)
+
+            Path of the virtual dataset. Default: DATA_PATH.
+
+        Raises
+        ------
+        ImportError
+
+            If h5py doesn't have virtual datasets (before 2.9).
+        """
+        if not hasattr(h5py, 'VirtualLayout'):
+            raise ImportError("Virtual datasets need h5py 2.9 or newer.")
+        layout = h5py.VirtualLayout(shape=self.shape, dtype=self.dtype)
+        module = 0
+        for section in self.sections:
+            modules = slice(module, module + section.modules)
+            for index, first, last, position in section.slabs(0, len(self)):
+                source_file = os.path.abspath(section.files[index])
+                source_dataset = open_file(source_file)[section.data_path]
+                source = h5py.VirtualSource(source_file, section.data_path,
+                                            shape=source_dataset.shape)
+                events = slice(position, position + last - first)
+                if source_dataset.ndim == 2:
+                    layout[position, module] = source
+                elif source_dataset.ndim == 3:
+                    layout[events, module] = source[first:last]
+                else:
+                    layout[events, modules] = source[first:last]
+            module += section.modules
+        with h5py.File(filename, 'w') as file:
+            file.create_virtual_dataset(dataset, layout, fillvalue=0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Write the frames of a run split into many HDF5 files"
+        " as one virtual dataset.")
+    parser.add_argument('filenames', nargs='+', metavar='name.H5',
+                        help="Files of the run")
+    parser.add_argument('-o', '--output', required=True, metavar='FILE',
+                        help="The new HDF5 file with the virtual dataset" +
+                        " " + DATA_PATH)
+    parser.add_argument('-d', '--data', default=DATA_PATH, metavar='PATH',
+                        help="Path of the image dataset, {module} is number" +
+                        " of the module (default: %(default)s)")
+    parser.add_argument('--module-pattern', default=MODULE_PATTERN,
+                        metavar='REGEX',
+                        help="Number of the module in the names of the" +
+                        " files (default: %(default)s)")
+    parser.add_argument('--pool-size', type=int, metavar='N',
+                        help="Number of HDF5 files kept open, at least" +
+                        " the number of modules (default: {})".format(
+                            POOL_SIZE))
+    args = parser.parse_args(argv)
+    if args.pool_size:
+        configure(size=args.pool_size)
+    run = RunReader(args.filenames, args.data, args.module_pattern)
+    run.write_virtual(args.output)
+    LOGGER.info("Written run of shape %s to %s", run.shape, args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    main()
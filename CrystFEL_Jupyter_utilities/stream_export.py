@@ -0,0 +1,189 @@
+"""Module for writing the selected chunks of indexing stream file
+to a new stream file. The bytes of the chunks are copied as they are,
+by the kernel where possible, without parsing them.
+"""
+import errno
+import logging
+import os
+
+import numpy as np
+
+from .stream_read import index_chunks
+
+# remove all the handlers.
+for handler in logging.root.handlers[:]:
+    logging.root.removeHandler(handler)
+LOGGER = logging.getLogger(__name__)
+# create console handler with a higher log level
+ch = logging.StreamHandler()
+# create formatter and add it to the handlers
+formatter = logging.Formatter(
+    '%(levelname)s | %(filename)s | %(funcName)s | %(lineno)d | %(message)s\n')
+ch.setFormatter(formatter)
+# add the handlers to logger
+LOGGER.addHandler(ch)
+LOGGER.setLevel("INFO")
+
+# Errors of the system calls which are not supported
+# for these files, the next way of copying is tried.
+UNSUPPORTED_ERRORS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EBADF,
+                      errno.EOPNOTSUPP, errno.ENOTSUP}
+# Size of the blocks copied by read and write.
+BLOCK_SIZE = 1 << 20
+
+
+def _copy_file_range(source, destination, offset, count):
+    return os.copy_file_range(source.fileno(), destination.fileno(), count,
+                              offset)
+
+
+def _sendfile(source, destination, offset, count):
+    return os.sendfile(destination.fileno(), source.fileno(), offset, count)
+
+
+def _read_write(source, destination, offset, count):
+    source.seek(offset)
+    return destination.write(source.read(min(count, BLOCK_SIZE)))
+
+
+def copy_methods():
+    """Returns the ways of copying available on this system,
+    the fastest first.
+
+    Returns
+    -------
+    methods : list
+
+        Functions (source, destination, offset, count) returning
+        the number of copied bytes.
+    """
+    methods = []
+    if hasattr(os, 'copy_file_range'):
+        methods.append(_copy_file_range)
+    if hasattr(os, 'sendfile'):
+        methods.append(_sendfile)
+    methods.append(_read_write)
+    return methods
+
+
+def copy_range(source, destination, start, stop, methods=None):
+    """Appends the bytes [start, stop) of the source file
+    to the destination file.
+
+    Parameters
+    ----------
+    source : The class:`io.FileIO`
+
+        Unbuffered file opened for reading.
+    destination : The class:`io.FileIO`
+
+        Unbuffered file opened for writing.
+    start : int
+
+        First byte.
+    stop : int
+
+        Byte after the last one.
+    methods : list
+
+        Ways of copying which are tried in turn, the list is reduced
+        to the ones which work. Default: None, `copy_methods()`.
+
+    Returns
+    -------
+    copied : int
+
+        Number of copied bytes.
+    """
+    if methods is None:
+        methods = copy_methods()
+    offset = start
+    while offset < stop:
+        try:
+            copied = methods[0](source, destination, offset, stop - offset)
+        except OSError as err:
+            if err.errno not in UNSUPPORTED_ERRORS or len(methods) == 1:
+                raise
+            # The same files won't work next time either.
+            del methods[0]
+            continue
+        if copied == 0:
+            # End of the source file.
+            break
+        offset += copied
+    return offset - start
+
+
+def merge_ranges(ranges):
+    """Joins the byte ranges which follow each other.
+
+    Parameters
+    ----------
+    ranges : numpy.ndarray
+
+        The (N, 2) matrix with [start, stop) ranges, sorted.
+
+    Returns
+    -------
+    ranges : numpy.ndarray
+
+        The (M, 2) matrix with the joined ranges.
+    """
+    ranges = np.asarray(ranges, dtype=np.int64).reshape(-1, 2)
+    if len(ranges) == 0:
+        return ranges
+    # A new range begins where it doesn't continue the previous one.
+    begins = np.flatnonzero(np.concatenate(
+        ([True], ranges[1:, 0] != ranges[:-1, 1])))
+    ends = np.concatenate((begins[1:] - 1, [len(ranges) - 1]))
+    return np.column_stack((ranges[begins, 0], ranges[ends, 1]))
+
+
+def export_chunks(streamfile, filename, chunks, index=None):
+    """Writes the header and the given chunks of the stream file
+    to a new stream file.
+
+    Parameters
+    ----------
+    streamfile : Python unicode str (on py3)
+
+        Path to stream file.
+    filename : Python unicode str (on py3)
+
+        Path to the new stream file.
+    chunks : list
+
+        Indices of the chunks e.g. 'chunk' of the crystals.
+    index : numpy.ndarray
+
+        Byte offsets of the chunks from `stream_read.index_chunks`.
+        Default: None, the file is indexed.
+
+    Returns
+    -------
+    size : int
+
+        Number of bytes written.
+
+    Raises
+    ------
+    ValueError
+        If the new file is the stream file.
+    """
+    if os.path.exists(filename) and os.path.samefile(streamfile, filename):
+        raise ValueError("The stream file can't be overwritten.")
+    if index is None:
+        index = index_chunks(streamfile)
+    chunks = np.unique(np.asarray(chunks, dtype=np.intp))
+    header_end = index[0, 0] if len(index) else os.path.getsize(streamfile)
+    ranges = np.concatenate(([[0, header_end]], index[chunks]))
+    methods = copy_methods()
+    size = 0
+    with open(streamfile, 'rb', buffering=0) as source, \
+            open(filename, 'wb', buffering=0) as destination:
+        for start, stop in merge_ranges(ranges):
+            size += copy_range(source, destination, int(start), int(stop),
+                               methods)
+    LOGGER.info("Written {} of {} chunks to {}".format(
+        len(chunks), len(index), filename))
+    return size
@@ -1,10 +1,14 @@
 """Module for parsing indexing stream file produced by CrystFEL indexamajig.
 """
 import logging
+import mmap
+import os
 import sys
 
 import numpy as np
 
+from .profiling import file_size, timed
+
 # remove all the handlers.
 for handler in logging.root.handlers[:]:
     logging.root.removeHandler(handler)
@@ -19,6 +23,10 @@ ch.setFormatter(formatter)
 LOGGER.addHandler(ch)
 LOGGER.setLevel("INFO")
 
+# Lines around each chunk of the stream file.
+CHUNK_BEGIN = b"----- Begin chunk -----"
+CHUNK_END = b"----- End chunk -----"
+
 
 def cell_parameters(astar, bstar, cstar):
     """Calculates unit cell parameters.
@@ -87,6 +95,8 @@ def cell_parameters(astar, bstar, cstar):
     return a, b, c, alpha, beta, gamma
 
 
+@timed('parse', lambda crystals, file_name: (len(crystals),
+                                            file_size(file_name)))
 def search_crystals_parameters(file_name):
     """Searching crystals parameters in indexing stream file.
 
@@ -103,7 +113,9 @@ def search_crystals_parameters(file_name):
     crystals : list
 
         List of crystals dictionaries
-        containing  unit cell details.
+        containing  unit cell details,
+        the reciprocal vectors `astar`, `bstar`, `cstar`
+        and the index of the `chunk` in the file.
 
     Raises
     ------
@@ -200,7 +212,10 @@ def search_crystals_parameters(file_name):
                                    'alfa': alfa, 'beta': beta,
                                    'gamma': gamma, 'centering': centering,
                                    'lattice_type': lattice_type,
-                                   'unique_axis': unique_axis}
+                                   'unique_axis': unique_axis,
+                                   'astar': astar, 'bstar': bstar,
+                                   'cstar': cstar,
+                                   'chunk': chunks_counter - 1}
                         crystals.append(crystal)
                         # reset event_name
                         event_name = ""
@@ -221,7 +236,63 @@ def search_crystals_parameters(file_name):
     return crystals
 
 
-def search_peaks(file_stream, file_h5):
+def index_chunks(file_name):
+    """Finds byte offsets of the chunks in indexing stream file without
+    parsing them, the chunks are in the order of `search_crystals_parameters`.
+
+    Parameters
+    ----------
+    file_name : Python unicode str (on py3)
+
+        Path to stream file.
+
+    Returns
+    -------
+    chunks : numpy.ndarray
+
+        The (N, 2) matrix, the chunk i is in bytes
+        [chunks[i, 0], chunks[i, 1]) of the file. Bytes before
+        the first chunk are the header (geometry and unit cell).
+
+    Raises
+    ------
+    FileNotFoundError
+        If no such file.
+    """
+    starts = []
+    stops = []
+    with open(file_name, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        if size == 0:
+            return np.zeros((0, 2), dtype=np.int64)
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            start = data.find(CHUNK_BEGIN)
+            while start != -1:
+                following = data.find(CHUNK_BEGIN, start + len(CHUNK_BEGIN))
+                limit = size if following == -1 else following
+                end = data.find(CHUNK_END, start, limit)
+                if end == -1:
+                    # Truncated chunk ends where the next one begins.
+                    stop = limit
+                else:
+                    newline = data.find(b"\n", end, limit)
+                    stop = limit if newline == -1 else newline + 1
+                starts.append(start)
+                stops.append(stop)
+                start = following
+    return np.array([starts, stops], dtype=np.int64).T.reshape(-1, 2)
+
+
+def count_peaks(peaks, file_stream, *args):
+    """Returns number of the peaks from `search_peaks` and size
+    of the stream file, for the profiler.
+    """
+    return (sum(len(panel_peaks) for found in peaks
+                for panel_peaks in found.values()), file_size(file_stream))
+
+
+@timed('parse', count_peaks)
+def search_peaks(file_stream, file_h5, event=None):
     """Searching peaks in indexing stream file.
     The function parses the file.
 
@@ -233,6 +304,10 @@ def search_peaks(file_stream, file_h5):
     file_h5 : Python unicode str (on py3)
 
         Image filename.
+    event : int or Python unicode str (on py3)
+
+        Index of the frame in the file (event `//index`) or the event
+        as written in the stream file. Default: None, all frames.
 
     Returns
     -------
@@ -257,6 +332,8 @@ def search_peaks(file_stream, file_h5):
     peaks_reflection = {}
     reflections_measured_after_indexing_flag = False  # If this line was found
     # with data for near bragg
+    if isinstance(event, int):
+        event = "//{}".format(event)
     try:
         with open(file_stream) as file:
             for line in file:
@@ -274,6 +351,11 @@ def search_peaks(file_stream, file_h5):
                         found_h5_in_stream = True
                     else:
                         name_h5_flag = False
+                # Only the peaks of the frame of the event.
+                if (name_h5_flag and event is not None and
+                        line.startswith("Event:") and
+                        line.split(':', 1)[1].strip() != event):
+                    name_h5_flag = False
                 if name_h5_flag and line.startswith('End of peak list'):
                     #  Last line with the peaks.
                     peaks_from_peak_search = False
@@ -0,0 +1,333 @@
+"""Module for the statistics of the frames of indexing stream file:
+hits, indexed frames, peaks, crystals and resolution of each frame
+and of the whole run, computed in a single pass over parts of the file
+read in parallel.
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import logging
+import os
+
+import h5py
+import numpy as np
+
+from .stream_read import index_chunks
+from .stream_tables import chunk_tables, iter_chunks
+
+# remove all the handlers.
+for handler in logging.root.handlers[:]:
+    logging.root.removeHandler(handler)
+LOGGER = logging.getLogger(__name__)
+# create console handler with a higher log level
+ch = logging.StreamHandler()
+# create formatter and add it to the handlers
+formatter = logging.Formatter(
+    '%(levelname)s | %(filename)s | %(funcName)s | %(lineno)d | %(message)s\n')
+ch.setFormatter(formatter)
+# add the handlers to logger
+LOGGER.addHandler(ch)
+LOGGER.setLevel("INFO")
+
+# Statistics of each frame, resolutions in nm^-1 (NaN if not known),
+# hit is -1 if not known.
+FRAME_STATISTICS = np.dtype([('chunk', np.int64), ('hit', np.int8),
+                             ('indexed', np.int8), ('num_peaks', np.int64),
+                             ('crystals', np.int64),
+                             ('peak_resolution', np.float64),
+                             ('resolution', np.float64)])
+# Bins of the resolution of the indexed frames, in nm^-1,
+# for the median of the run.
+RESOLUTION_BINS = np.linspace(0, 20, 4001)
+
+
+def frame_statistics(tables):
+    """Returns statistics of each frame of the tables.
+
+    Parameters
+    ----------
+    tables : dict
+
+        Tables from `stream_tables.chunk_tables`.
+
+    Returns
+    -------
+    statistics : numpy.ndarray
+
+        Structured array with `FRAME_STATISTICS` for each frame.
+    """
+    frames = tables['frames']
+    crystals = tables['crystals']
+    statistics = np.zeros(len(frames['chunk']), dtype=FRAME_STATISTICS)
+    for name in ['chunk', 'hit', 'num_peaks', 'crystals', 'peak_resolution']:
+        statistics[name] = frames[name]
+    statistics['indexed'] = frames['crystals'] > 0
+    # The best resolution of the crystals of each frame.
+    resolution = np.full(len(statistics), -np.inf)
+    rows = np.searchsorted(frames['chunk'], crystals['chunk'])
+    np.fmax.at(resolution, rows, crystals['resolution'])
+    resolution[~np.isfinite(resolution)] = np.nan
+    statistics['resolution'] = resolution
+    return statistics
+
+
+class RunStatistics:
+    """Statistics of the whole run accumulated from parts of the frames,
+    the parts can be added in any order or merged from other processes.
+
+    Attributes
+    ----------
+    frames : int
+
+        Number of frames.
+    known_hits : int
+
+        Number of frames with known hit flag.
+    hits : int
+
+        Number of hits.
+    indexed : int
+
+        Number of frames with at least one crystal.
+    crystals : int
+
+        Number of crystals.
+    peak_sum : int
+
+        Sum of the number of peaks of all frames.
+    peak_square_sum : int
+
+        Sum of squares of the number of peaks.
+    resolution_counts : numpy.ndarray
+
+        Histogram of the resolution of the indexed frames
+        over `RESOLUTION_BINS`.
+    """
+
+    def __init__(self):
+        self.frames = 0
+        self.known_hits = 0
+        self.hits = 0
+        self.indexed = 0
+        self.crystals = 0
+        self.peak_sum = 0
+        self.peak_square_sum = 0
+        self.resolution_counts = np.zeros(len(RESOLUTION_BINS) - 1,
+                                          dtype=np.int64)
+
+    def add(self, statistics):
+        """Adds the frames.
+
+        Parameters
+        ----------
+        statistics : numpy.ndarray
+
+            Structured array from `frame_statistics`.
+        """
+        self.frames += len(statistics)
+        self.known_hits += int(np.count_nonzero(statistics['hit'] >= 0))
+        self.hits += int(np.count_nonzero(statistics['hit'] == 1))
+        self.indexed += int(np.count_nonzero(statistics['indexed']))
+        self.crystals += int(statistics['crystals'].sum())
+        peaks = statistics['num_peaks'].astype(np.int64)
+        self.peak_sum += int(peaks.sum())
+        self.peak_square_sum += int((peaks**2).sum())
+        resolution = statistics['resolution']
+        self.resolution_counts += np.histogram(
+            resolution[np.isfinite(resolution)], RESOLUTION_BINS)[0]
+
+    def merge(self, other):
+        """Adds the frames of the other statistics.
+
+        Parameters
+        ----------
+        other : The class:`RunStatistics`
+        """
+        for name in ['frames', 'known_hits', 'hits', 'indexed', 'crystals',
+                     'peak_sum', 'peak_square_sum', 'resolution_counts']:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    def summary(self):
+        """Returns the aggregates of the run.
+
+        Returns
+        -------
+        summary : dict
+
+            Counts, hit rate (of the frames with known hit flag),
+            indexing rate (of the hits, or of all frames when hits
+            are not known), mean and standard deviation of the number
+            of peaks, crystals per indexed frame and median resolution
+            of the indexed frames in nm^-1 and Angstroms.
+            Rates are NaN when there are no frames to divide by.
+        """
+        def ratio(numerator, denominator):
+            return numerator / denominator if denominator else np.nan
+
+        mean_peaks = ratio(self.peak_sum, self.frames)
+        variance = ratio(self.peak_square_sum, self.frames) - mean_peaks**2
+        median = np.nan
+        total = self.resolution_counts.sum()
+        if total:
+            cumulative = np.cumsum(self.resolution_counts)
+            index = int(np.searchsorted(cumulative, 0.5 * total))
+            median = RESOLUTION_BINS[index:index + 2].mean()
+        return {'frames': self.frames, 'hits': self.hits,
+                'hit_rate': ratio(self.hits, self.known_hits),
+                'indexed': self.indexed,
+                'indexing_rate': ratio(self.indexed, self.hits
+                                       if self.known_hits else self.frames),
+                'crystals': self.crystals,
+                'crystals_per_indexed_frame': ratio(self.crystals,
+                                                    self.indexed),
+                'mean_peaks': mean_peaks,
+                'std_peaks': np.sqrt(max(variance, 0.0)),
+                'median_resolution_nm^-1': median,
+                'median_resolution_A': ratio(10.0, median)}
+
+
+def part_statistics(streamfile, offset=0, count=None, first_chunk=0,
+                    block_size=10000):
+    """Returns statistics of the consecutive chunks of the stream file.
+
+    Parameters
+    ----------
+    streamfile : Python unicode str (on py3)
+
+        Path to stream file.
+    offset : int
+
+        Byte offset of the first chunk.
+    count : int
+
+        Number of chunks. Default: None, till the end.
+    first_chunk : int
+
+        Index of the first chunk in the file.
+    block_size : int
+
+        Number of chunks converted at once.
+
+    Returns
+    -------
+    statistics, run : tuple
+
+        statistics : Structured array with `FRAME_STATISTICS`.
+        run : The class:`RunStatistics` of these frames.
+    """
+    run = RunStatistics()
+    parts = []
+    block = []
+    for chunk in iter_chunks(streamfile, offset, count, first_chunk):
+        block.append(chunk)
+        if len(block) == block_size:
+            parts.append(frame_statistics(chunk_tables(block)))
+            run.add(parts[-1])
+            block = []
+    if block or not parts:
+        parts.append(frame_statistics(chunk_tables(block)))
+        run.add(parts[-1])
+    return np.concatenate(parts), run
+
+
+def stream_statistics(streamfile, processes=None, parts=None):
+    """Returns statistics of all frames of the stream file and of the run.
+    The chunks are found in the byte-offset index and split into parts
+    read by worker processes.
+
+    Parameters
+    ----------
+    streamfile : Python unicode str (on py3)
+
+        Path to stream file.
+    processes : int
+
+        Number of worker processes, 1 reads the file in this process.
+        Default: None, the number of CPUs.
+    parts : int
+
+        Number of parts of the file. Default: None, 4 per process.
+
+    Returns
+    -------
+    statistics, run : tuple
+
+        statistics : Structured array with `FRAME_STATISTICS`,
+        in the order of the chunks.
+        run : The class:`RunStatistics` of the whole file.
+    """
+    if processes == 1:
+        return part_statistics(streamfile)
+    index = index_chunks(streamfile)
+    if parts is None:
+        parts = 4 * (processes or os.cpu_count() or 1)
+    # First chunk of each part.
+    firsts = np.unique(np.linspace(0, len(index), parts + 1).astype(int))
+    arguments = [(streamfile, int(index[first, 0]), int(last - first),
+                  int(first)) for first, last in zip(firsts[:-1], firsts[1:])]
+    if len(arguments) < 2:
+        return part_statistics(streamfile)
+    run = RunStatistics()
+    frames = []
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        for statistics, part_run in executor.map(part_statistics,
+                                                 *zip(*arguments)):
+            frames.append(statistics)
+            run.merge(part_run)
+    return np.concatenate(frames), run
+
+
+def write_statistics(statistics, filename, summary=None):
+    """Writes the statistics of the frames to CSV file or, for
+    the .h5 extension, to HDF5 file with the run summary as attributes.
+
+    Parameters
+    ----------
+    statistics : numpy.ndarray
+
+        Structured array with `FRAME_STATISTICS`.
+    filename : Python unicode str (on py3)
+
+        Path to the file.
+    summary : dict
+
+        Summary of the run from `RunStatistics.summary`.
+    """
+    if os.path.splitext(filename)[1] in ('.h5', '.hdf5'):
+        with h5py.File(filename, 'w') as file:
+            group = file.create_group('frames')
+            for name in FRAME_STATISTICS.names:
+                group.create_dataset(name, data=statistics[name],
+                                     compression='gzip', shuffle=True)
+            for key, value in (summary or {}).items():
+                group.attrs[key] = value
+        return
+    formats = ['%.6g' if FRAME_STATISTICS[name].kind == 'f' else '%d'
+               for name in FRAME_STATISTICS.names]
+    np.savetxt(filename, statistics, fmt=formats, delimiter=',',
+               header=','.join(FRAME_STATISTICS.names), comments='')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Statistics of the frames of the stream file.")
+    parser.add_argument('filename', metavar="name.stream",
+                        help="Download data from this file")
+    parser.add_argument('-o', '--output', metavar='FILE',
+                        help="Per frame statistics, .csv or .h5" +
+                        " (default: name_stats.csv)")
+    parser.add_argument('-j', '--processes', type=int, default=None,
+                        help="Number of worker processes")
+    args = parser.parse_args(argv)
+    output = args.output
+    if output is None:
+        output = os.path.splitext(args.filename)[0] + '_stats.csv'
+    statistics, run = stream_statistics(args.filename, args.processes)
+    summary = run.summary()
+    write_statistics(statistics, output, summary)
+    for key, value in summary.items():
+        print("{}\t{}".format(key, value))
+    return 0
+
+
+if __name__ == '__main__':
+    main()
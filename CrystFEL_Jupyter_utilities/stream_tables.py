@@ -0,0 +1,591 @@
+"""Module for converting indexing stream file to columnar tables
+of frames, crystals, peaks and reflections, written block by block
+to compressed HDF5 (or Parquet and Feather files when pyarrow is
+installed), so they can be analysed without parsing the stream again.
+"""
+import argparse
+import logging
+import os
+
+import h5py
+import numpy as np
+
+from .reduction import cell_parameters, direct_vectors
+
+# remove all the handlers.
+for handler in logging.root.handlers[:]:
+    logging.root.removeHandler(handler)
+LOGGER = logging.getLogger(__name__)
+# create console handler with a higher log level
+ch = logging.StreamHandler()
+# create formatter and add it to the handlers
+formatter = logging.Formatter(
+    '%(levelname)s | %(filename)s | %(funcName)s | %(lineno)d | %(message)s\n')
+ch.setFormatter(formatter)
+# add the handlers to logger
+LOGGER.addHandler(ch)
+LOGGER.setLevel("INFO")
+
+# Names of the tables in the order they are written.
+TABLE_NAMES = ['frames', 'crystals', 'peaks', 'reflections']
+# Numeric columns of the peak and reflection lists, as in `search_peaks`.
+PEAK_COLUMNS = ['fs_px', 'ss_px', 'recip', 'intensity']
+REFLECTION_COLUMNS = ['h', 'k', 'l', 'I', 'sigmaI', 'peak', 'background',
+                      'fs_px', 'ss_px']
+VECTOR_NAMES = ['astar', 'bstar', 'cstar']
+# Types of the columns of the fields of the frames and the crystals,
+# the same for all blocks, also empty ones.
+FRAME_COLUMNS = {'chunk': np.int64, 'image': str, 'event': str,
+                 'serial': np.int64, 'hit': np.int8, 'indexed_by': str,
+                 'num_peaks': np.int64, 'peak_resolution': float,
+                 'photon_energy_eV': float, 'crystals': np.int64}
+CRYSTAL_COLUMNS = {'chunk': np.int64, 'crystal': np.int64, 'image': str,
+                   'event': str, 'centering': str, 'lattice_type': str,
+                   'unique_axis': str, 'resolution': float,
+                   'profile_radius': float, 'num_reflections': np.int64}
+TABLE_FORMATS = ['hdf5', 'parquet', 'feather']
+# Rows in a chunk of the HDF5 datasets.
+CHUNK_ROWS = 16384
+
+
+def split_field(line):
+    """Returns key and value of a line `key = value` or `key: value`.
+
+    Parameters
+    ----------
+    line : Python unicode str (on py3)
+
+        Line of the stream file.
+
+    Returns
+    -------
+    key, value : tuple
+
+        (None, None) if the line is not a field.
+    """
+    for separator in (' = ', ': '):
+        if separator in line:
+            key, value = line.split(separator, 1)
+            return key.strip(), value.strip()
+    return None, None
+
+
+def iter_chunks(file_name, offset=0, count=None, first_chunk=0):
+    """Reads the chunks of indexing stream file one by one in
+    a single pass, keeping the fields and the raw peak and reflection
+    lines of each chunk.
+
+    Parameters
+    ----------
+    file_name : Python unicode str (on py3)
+
+        Path to stream file.
+    offset : int
+
+        Byte offset where reading starts, e.g. the beginning of
+        a chunk from `stream_read.index_chunks`.
+    count : int
+
+        Number of chunks to read. Default: None, till the end.
+    first_chunk : int
+
+        Index of the first read chunk in the file.
+
+    Yields
+    ------
+    chunk : dict
+
+        'chunk' - index of the chunk in the file,
+        'fields' - dict with the fields of the chunk e.g. 'hit',
+        'peaks' - lines of the peak list,
+        'crystals' - list of dicts with 'fields' and 'reflections' lines.
+    """
+    chunk = None
+    crystal = None
+    section = None
+    index = first_chunk
+    if count is not None and count <= 0:
+        return
+    with open(file_name) as file:
+        # Chunks begin at the beginning of a line, where the decoder
+        # has no state, so the byte offset can be used.
+        file.seek(offset)
+        for line in file:
+            if line.startswith("----- Begin chunk"):
+                chunk = {'chunk': index, 'fields': {}, 'peaks': [],
+                         'crystals': []}
+                crystal = section = None
+            elif chunk is None:
+                # The header: geometry and unit cell.
+                continue
+            elif line.startswith("----- End chunk"):
+                yield chunk
+                index += 1
+                chunk = None
+                if count is not None and index - first_chunk == count:
+                    return
+            elif section == 'peaks':
+                if line.startswith("End of peak list"):
+                    section = None
+                elif not line.lstrip().startswith("fs/px"):
+                    chunk['peaks'].append(line)
+            elif section == 'reflections':
+                if line.startswith("End of reflections"):
+                    section = None
+                elif not line.lstrip().startswith("h "):
+                    crystal['reflections'].append(line)
+            elif line.startswith("Peaks from peak search"):
+                section = 'peaks'
+            elif line.startswith("--- Begin crystal"):
+                crystal = {'fields': {}, 'reflections': []}
+                chunk['crystals'].append(crystal)
+            elif line.startswith("--- End crystal"):
+                crystal = None
+            elif line.startswith("Reflections measured after indexing"):
+                if crystal is not None:
+                    section = 'reflections'
+            else:
+                key, value = split_field(line)
+                if key is not None:
+                    target = chunk if crystal is None else crystal
+                    target['fields'][key] = value
+    if chunk is not None:
+        LOGGER.warning("The last chunk is truncated.")
+        yield chunk
+
+
+def first_float(value):
+    """Returns the first number of the field value e.g. of
+    '2.5 nm^-1 or 4.00 A', NaN if there is none.
+    """
+    try:
+        return float(value.split()[0])
+    except (AttributeError, IndexError, ValueError):
+        return np.nan
+
+
+def first_int(value):
+    """Returns the first number of the field value as int,
+    -1 if there is none.
+    """
+    number = first_float(value)
+    return -1 if np.isnan(number) else int(number)
+
+
+def parse_rows(lines, numeric_columns):
+    """Converts the lines of a peak or reflection list to columns,
+    the last column of each line is the panel name.
+
+    Parameters
+    ----------
+    lines : list
+
+        Lines of the list.
+    numeric_columns : list
+
+        Names of the numeric columns before the panel name.
+
+    Returns
+    -------
+    columns : dict
+
+        key - column name, value - numpy.ndarray, and 'panel_name'.
+        Lines with a wrong number of columns are left out.
+    keep : numpy.ndarray
+
+        Boolean array, True for the lines which were converted.
+    """
+    width = len(numeric_columns) + 1
+    rows = [line.split() for line in lines]
+    keep = np.array([len(row) == width for row in rows], dtype=bool)
+    table = np.array([row for row in rows if len(row) == width],
+                     dtype=str).reshape(-1, width)
+    columns = {name: table[:, column].astype(float)
+               for column, name in enumerate(numeric_columns)}
+    columns['panel_name'] = table[:, -1]
+    return columns, keep
+
+
+def cells_from_vectors(reciprocal):
+    """Calculates unit cell parameters of the crystals, NaN when the
+    reciprocal vectors are missing or singular.
+
+    Parameters
+    ----------
+    reciprocal : numpy.ndarray
+
+        The (N, 3, 3) array with rows `astar`, `bstar`, `cstar`.
+
+    Returns
+    -------
+    parameters : numpy.ndarray
+
+        The (N, 6) matrix with a, b, c, alfa, beta, gamma.
+    """
+    parameters = np.full((len(reciprocal), 6), np.nan)
+    valid = np.isfinite(reciprocal).all(axis=(1, 2))
+    valid[valid] = np.linalg.det(reciprocal[valid]) != 0
+    if valid.any():
+        parameters[valid] = cell_parameters(direct_vectors(reciprocal[valid]))
+    return parameters
+
+
+def chunk_tables(chunks):
+    """Builds the tables of frames, crystals, peaks and reflections
+    of the chunks.
+
+    Parameters
+    ----------
+    chunks : list
+
+        Chunks from `iter_chunks`.
+
+    Returns
+    -------
+    tables : dict
+
+        key - table name from `TABLE_NAMES`,
+        value - dict of columns (numpy.ndarray) of the same length.
+    """
+    frames = {name: [] for name in FRAME_COLUMNS}
+    crystals = {name: [] for name in CRYSTAL_COLUMNS}
+    reciprocal = []
+    peak_lines, peak_chunks = [], []
+    reflection_lines, reflection_chunks, reflection_crystals = [], [], []
+    for chunk in chunks:
+        fields = chunk['fields']
+        image = fields.get('Image filename', '')
+        event = fields.get('Event', '')
+        frames['chunk'].append(chunk['chunk'])
+        frames['image'].append(image)
+        frames['event'].append(event)
+        frames['serial'].append(first_int(fields.get('Image serial number')))
+        frames['hit'].append(first_int(fields.get('hit')))
+        frames['indexed_by'].append(fields.get('indexed_by', ''))
+        num_peaks = first_int(fields.get('num_peaks'))
+        frames['num_peaks'].append(num_peaks if num_peaks >= 0
+                                   else len(chunk['peaks']))
+        frames['peak_resolution'].append(
+            first_float(fields.get('peak_resolution')))
+        frames['photon_energy_eV'].append(
+            first_float(fields.get('photon_energy_eV')))
+        frames['crystals'].append(len(chunk['crystals']))
+        peak_lines += chunk['peaks']
+        peak_chunks += [chunk['chunk']] * len(chunk['peaks'])
+        for crystal_index, crystal in enumerate(chunk['crystals']):
+            crystal_fields = crystal['fields']
+            crystals['chunk'].append(chunk['chunk'])
+            crystals['crystal'].append(crystal_index)
+            crystals['image'].append(image)
+            crystals['event'].append(event)
+            for name in ['centering', 'lattice_type', 'unique_axis']:
+                crystals[name].append(crystal_fields.get(name, ''))
+            crystals['resolution'].append(first_float(
+                crystal_fields.get('diffraction_resolution_limit')))
+            crystals['profile_radius'].append(first_float(
+                crystal_fields.get('profile_radius')))
+            crystals['num_reflections'].append(first_int(
+                crystal_fields.get('num_reflections')))
+            vectors = []
+            for name in VECTOR_NAMES:
+                try:
+                    vectors.append([float(number) for number in
+                                    crystal_fields[name].split()[:3]])
+                except (KeyError, ValueError):
+                    vectors.append([np.nan] * 3)
+            reciprocal.append(vectors)
+            reflection_lines += crystal['reflections']
+            reflection_chunks += [chunk['chunk']] * len(crystal['reflections'])
+            reflection_crystals += [crystal_index] * len(
+                crystal['reflections'])
+    frames = {name: np.array(values, dtype=FRAME_COLUMNS[name])
+              for name, values in frames.items()}
+    crystals = {name: np.array(values, dtype=CRYSTAL_COLUMNS[name])
+                for name, values in crystals.items()}
+    reciprocal = np.array(reciprocal, dtype=float).reshape(-1, 3, 3)
+    parameters = cells_from_vectors(reciprocal)
+    for column, name in enumerate(['a', 'b', 'c', 'alfa', 'beta', 'gamma']):
+        crystals[name] = parameters[:, column]
+    for row, name in enumerate(VECTOR_NAMES):
+        for column, axis in enumerate('xyz'):
+            crystals[name + '_' + axis] = reciprocal[:, row, column]
+    peaks, keep = parse_rows(peak_lines, PEAK_COLUMNS)
+    peaks['chunk'] = np.array(peak_chunks, dtype=np.int64)[keep]
+    reflections, keep = parse_rows(reflection_lines, REFLECTION_COLUMNS)
+    for name in ['h', 'k', 'l']:
+        reflections[name] = reflections[name].astype(np.int32)
+    reflections['chunk'] = np.array(reflection_chunks, dtype=np.int64)[keep]
+    reflections['crystal'] = np.array(reflection_crystals,
+                                      dtype=np.int64)[keep]
+    return {'frames': frames, 'crystals': crystals, 'peaks': peaks,
+            'reflections': reflections}
+
+
+def iter_table_blocks(file_name, block_size=10000):
+    """Reads the stream file in a single pass and yields the tables
+    of blocks of chunks, so the memory doesn't grow with the file.
+
+    Parameters
+    ----------
+    file_name : Python unicode str (on py3)
+
+        Path to stream file.
+    block_size : int
+
+        Number of chunks in a block.
+
+    Yields
+    ------
+    tables : dict
+
+        Tables of the block from `chunk_tables`.
+    """
+    block = []
+    for chunk in iter_chunks(file_name):
+        block.append(chunk)
+        if len(block) == block_size:
+            yield chunk_tables(block)
+            block = []
+    if block:
+        yield chunk_tables(block)
+
+
+class HDF5TableWriter:
+    """Appends the blocks of tables to the HDF5 file, one group per
+    table and one chunked, compressed dataset per column,
+    so single columns can be read without the others.
+
+    Attributes
+    ----------
+    file : The class:`h5py.File`
+
+        The open file.
+    compression : str
+
+        HDF5 compression filter e.g. 'gzip', None for no compression.
+    """
+
+    def __init__(self, filename, compression='gzip'):
+        """
+        Parameters
+        ----------
+        filename : Python unicode str (on py3)
+
+            Path to the HDF5 file.
+        compression : str
+
+            HDF5 compression filter e.g. 'gzip', 'lzf'.
+        """
+        self.file = h5py.File(filename, 'w')
+        self.compression = compression
+
+    def write(self, tables):
+        """Appends rows of the tables.
+
+        Parameters
+        ----------
+        tables : dict
+
+            Tables from `chunk_tables`.
+        """
+        for table_name, table in tables.items():
+            group = self.file.require_group(table_name)
+            for name, column in table.items():
+                if column.dtype.kind == 'U':
+                    dtype = h5py.string_dtype()
+                    column = column.astype(object)
+                else:
+                    dtype = column.dtype
+                if name not in group:
+                    group.create_dataset(
+                        name, shape=(0,), maxshape=(None,), dtype=dtype,
+                        chunks=(CHUNK_ROWS,), compression=self.compression,
+                        shuffle=self.compression is not None)
+                dataset = group[name]
+                size = len(dataset)
+                dataset.resize((size + len(column),))
+                if len(column):
+                    dataset[size:] = column
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ArrowTableWriter:
+    """Appends the blocks of tables to Parquet or Feather (Arrow IPC)
+    files, one file per table. Needs pyarrow.
+
+    Attributes
+    ----------
+    filenames : dict
+
+        key - table name, value - path to its file.
+    table_format : str
+
+        'parquet' or 'feather'.
+    compression : str
+
+        Compression codec e.g. 'zstd', None for no compression.
+    writers : dict
+
+        key - table name, value - the open writer.
+    """
+
+    def __init__(self, filename, table_format='parquet', compression='zstd'):
+        """
+        Parameters
+        ----------
+        filename : Python unicode str (on py3)
+
+            Path, the table name is added before the extension.
+        table_format : str
+
+            'parquet' or 'feather'.
+        compression : str
+
+            Compression codec e.g. 'zstd', 'lz4'.
+        """
+        try:
+            import pyarrow
+        except ImportError:
+            raise ImportError("Writing {} files needs pyarrow.".format(
+                table_format))
+        self.pyarrow = pyarrow
+        root, extension = os.path.splitext(filename)
+        self.filenames = {name: "{}_{}{}".format(root, name, extension)
+                          for name in TABLE_NAMES}
+        self.table_format = table_format
+        self.compression = compression
+        self.writers = {}
+
+    def write(self, tables):
+        """Appends rows of the tables.
+
+        Parameters
+        ----------
+        tables : dict
+
+            Tables from `chunk_tables`.
+        """
+        for table_name, table in tables.items():
+            arrow_table = self.pyarrow.table(table)
+            if table_name not in self.writers:
+                self.writers[table_name] = self.open_writer(
+                    self.filenames[table_name], arrow_table.schema)
+            self.writers[table_name].write_table(arrow_table)
+
+    def open_writer(self, filename, schema):
+        """Returns writer of the file of one table.
+        """
+        if self.table_format == 'parquet':
+            import pyarrow.parquet
+            return pyarrow.parquet.ParquetWriter(
+                filename, schema, compression=self.compression or 'none')
+        import pyarrow.ipc
+        options = pyarrow.ipc.IpcWriteOptions(compression=self.compression)
+        return pyarrow.ipc.new_file(filename, schema, options=options)
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def export_tables(streamfile, filename, table_format='hdf5', block_size=10000,
+                  compression=None):
+    """Writes the tables of frames, crystals, peaks and reflections
+    of the stream file.
+
+    Parameters
+    ----------
+    streamfile : Python unicode str (on py3)
+
+        Path to stream file.
+    filename : Python unicode str (on py3)
+
+        Path to the HDF5 file, or to the Parquet and Feather files
+        with the table name added before the extension.
+    table_format : str
+
+        One of `TABLE_FORMATS`.
+    block_size : int
+
+        Number of chunks parsed and written at once.
+    compression : str
+
+        Compression filter or codec.
+        Default: None, 'gzip' for HDF5 and 'zstd' for the others.
+
+    Returns
+    -------
+    rows : dict
+
+        Number of written rows of each table.
+
+    Raises
+    ------
+    ValueError
+        If the format is not known.
+    ImportError
+        If pyarrow is not installed for Parquet and Feather.
+    """
+    if table_format == 'hdf5':
+        writer = HDF5TableWriter(filename, compression or 'gzip')
+    elif table_format in TABLE_FORMATS:
+        writer = ArrowTableWriter(filename, table_format,
+                                  compression or 'zstd')
+    else:
+        raise ValueError("Unknown format {}".format(table_format))
+    rows = dict.fromkeys(TABLE_NAMES, 0)
+    with writer:
+        for tables in iter_table_blocks(streamfile, block_size):
+            writer.write(tables)
+            for name, table in tables.items():
+                rows[name] += len(next(iter(table.values())))
+    LOGGER.info("Written {} frames, {} crystals, {} peaks and {} "
+                "reflections".format(*[rows[name] for name in TABLE_NAMES]))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Write tables of frames, crystals, peaks and "
+                    "reflections of the stream file.")
+    parser.add_argument('filename', metavar="name.stream",
+                        help="Download data from this file")
+    parser.add_argument('-o', '--output', metavar='FILE',
+                        help="Output file (default: name.h5, name.parquet" +
+                        " or name.feather)")
+    parser.add_argument('-f', '--format', choices=TABLE_FORMATS,
+                        default='hdf5', help="Format of the tables")
+    parser.add_argument('-c', '--compression', default=None,
+                        help="Compression (default: gzip for hdf5, zstd)")
+    parser.add_argument('--block-size', type=int, default=10000,
+                        help="Number of chunks written at once")
+    args = parser.parse_args(argv)
+    output = args.output
+    if output is None:
+        extension = {'hdf5': '.h5'}.get(args.format, '.' + args.format)
+        output = os.path.splitext(args.filename)[0] + extension
+    try:
+        export_tables(args.filename, output, args.format, args.block_size,
+                      args.compression)
+    except ImportError as err:
+        parser.error("{} Install the tables extra: pip install "
+                     "'CrystFEL_Jupyter_utilities[tables]'".format(err))
+    return 0
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,795 @@
+"""Module for writing synthetic indexing stream files, multi-panel
+geometry files and HDF5 images of any size, deterministically from
+a seed, for load testing and measuring performance offline.
+
+Each chunk is generated from its own random generator seeded by
+(seed, chunk), so the stream file and the images agree on the peaks
+and any part of the data can be generated again alone.
+
+The chunks are the frames of `images` files of `events` events each.
+With more chunks than frames, as in all sizes of `SIZES`, the frames
+are reused in turn: the stream file lists the same file and event in
+several chunks with different peaks and crystals, which indexamajig
+never writes, and the peaks of the frame mix those of unrelated chunks.
+`unique_frames` gives each chunk a frame of its own.
+"""
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import logging
+import os
+
+import h5py
+import numpy as np
+
+from .reduction import cyclic_shift
+
+# remove all the handlers.
+for handler in logging.root.handlers[:]:
+    logging.root.removeHandler(handler)
+LOGGER = logging.getLogger(__name__)
+# create console handler with a higher log level
+ch = logging.StreamHandler()
+# create formatter and add it to the handlers
+formatter = logging.Formatter(
+    '%(levelname)s | %(filename)s | %(funcName)s | %(lineno)d | %(message)s\n')
+ch.setFormatter(formatter)
+# add the handlers to logger
+LOGGER.addHandler(ch)
+LOGGER.setLevel("INFO")
+
+# Cells of the crystals: lattice type, centering, unique axis and
+# a, b, c in Angstroms, alfa, beta, gamma in degrees, in the standard
+# setting, by name used in the mix of the size spec.
+CELLS = {
+    'triclinic-P': ('triclinic', 'P', '?',
+                    (40.0, 50.0, 60.0, 80.0, 85.0, 95.0)),
+    'monoclinic-P': ('monoclinic', 'P', 'b',
+                     (45.0, 65.0, 55.0, 90.0, 110.0, 90.0)),
+    'monoclinic-C': ('monoclinic', 'C', 'b',
+                     (120.0, 50.0, 70.0, 90.0, 105.0, 90.0)),
+    'orthorhombic-P': ('orthorhombic', 'P', '*',
+                       (60.0, 80.0, 100.0, 90.0, 90.0, 90.0)),
+    'orthorhombic-C': ('orthorhombic', 'C', '*',
+                       (70.0, 90.0, 110.0, 90.0, 90.0, 90.0)),
+    'orthorhombic-I': ('orthorhombic', 'I', '*',
+                       (55.0, 75.0, 95.0, 90.0, 90.0, 90.0)),
+    'orthorhombic-F': ('orthorhombic', 'F', '*',
+                       (85.0, 105.0, 125.0, 90.0, 90.0, 90.0)),
+    'tetragonal-P': ('tetragonal', 'P', 'c',
+                     (58.0, 58.0, 150.0, 90.0, 90.0, 90.0)),
+    'tetragonal-I': ('tetragonal', 'I', 'c',
+                     (80.0, 80.0, 40.0, 90.0, 90.0, 90.0)),
+    'rhombohedral-R': ('rhombohedral', 'R', '*',
+                       (75.0, 75.0, 75.0, 82.0, 82.0, 82.0)),
+    'hexagonal-P': ('hexagonal', 'P', 'c',
+                    (62.0, 62.0, 90.0, 90.0, 90.0, 120.0)),
+    'hexagonal-H': ('hexagonal', 'H', 'c',
+                    (100.0, 100.0, 60.0, 90.0, 90.0, 120.0)),
+    'cubic-P': ('cubic', 'P', '*', (50.0, 50.0, 50.0, 90.0, 90.0, 90.0)),
+    'cubic-I': ('cubic', 'I', '*', (95.0, 95.0, 95.0, 90.0, 90.0, 90.0)),
+    'cubic-F': ('cubic', 'F', '*', (120.0, 120.0, 120.0, 90.0, 90.0, 90.0)),
+}
+# Sizes of the data: number of chunks, image files and events
+# in each file, mean numbers of peaks of a hit, crystals of an indexed
+# frame and reflections of a crystal, and the detector. The sizes have
+# more chunks than frames (images * events), so the frames are reused,
+# see `unique_frames`.
+SIZES = {
+    'small': {'chunks': 100, 'images': 10, 'events': 1, 'peaks': 30,
+              'crystals': 1, 'reflections': 50, 'quadrants': 4,
+              'modules': 2, 'fs_size': 128, 'ss_size': 64},
+    'medium': {'chunks': 10000, 'images': 10, 'events': 100, 'peaks': 50,
+               'crystals': 1, 'reflections': 200, 'quadrants': 4,
+               'modules': 8, 'fs_size': 194, 'ss_size': 185},
+    'large': {'chunks': 1000000, 'images': 4, 'events': 250, 'peaks': 50,
+              'crystals': 1, 'reflections': 200, 'quadrants': 4,
+              'modules': 4, 'fs_size': 512, 'ss_size': 128},
+    'production': {'chunks': 5000000, 'images': 4, 'events': 250,
+                   'peaks': 80, 'crystals': 1.2, 'reflections': 400,
+                   'quadrants': 4, 'modules': 4, 'fs_size': 512,
+                   'ss_size': 128},
+}
+# Defaults of the spec which don't depend on the size.
+DEFAULT_SPEC = {'hit_rate': 0.8, 'indexing_rate': 0.6,
+                'mix': {'orthorhombic-P': 1.0}, 'spread': 0.005,
+                'permute': 0.0, 'clen': 0.1, 'res': 5000.0,
+                'photon_energy': 9000.0}
+PEAK_HEADER = "  fs/px   ss/px (1/d)/nm^-1   Intensity  Panel"
+PEAK_FORMAT = "{:7.2f} {:7.2f} {:10.2f} {:11.2f}   {}\n"
+REFLECTION_HEADER = ("   h    k    l          I   sigma(I)       peak "
+                     "background  fs/px  ss/px panel")
+REFLECTION_FORMAT = ("{:4d} {:4d} {:4d} {:10.2f} {:10.2f} {:10.2f} {:10.2f} "
+                     "{:6.1f} {:6.1f} {}\n")
+STREAM_NAME = 'run.stream'
+GEOMETRY_NAME = 'detector.geom'
+IMAGE_NAME = 'image_{:05d}.h5'
+# Number of chunks generated at once by a worker process.
+BLOCK_CHUNKS = 1000
+
+
+def size_spec(size='small', **overrides):
+    """Returns the spec of the synthetic data.
+
+    Parameters
+    ----------
+    size : str
+
+        Name of the size in `SIZES`.
+    overrides : dict
+
+        Values replacing the ones of the size or `DEFAULT_SPEC`.
+
+    Returns
+    -------
+    spec : dict
+
+        All values of the size and `DEFAULT_SPEC`.
+
+    Raises
+    ------
+    ValueError
+        If the size or a cell of the mix is not known.
+    """
+    if size not in SIZES:
+        raise ValueError("Unknown size {}, one of {}".format(
+            size, ', '.join(SIZES)))
+    spec = dict(DEFAULT_SPEC)
+    spec.update(SIZES[size])
+    spec.update({key: value for key, value in overrides.items()
+                 if value is not None})
+    unknown = set(spec['mix']) - set(CELLS)
+    if unknown:
+        raise ValueError("Unknown cells {}".format(', '.join(sorted(unknown))))
+    return spec
+
+
+def unique_frames(spec):
+    """Returns the spec with enough events in each image file for a
+    frame of each chunk, so no frame is listed in two chunks.
+    """
+    events = max(spec['events'], -(-spec['chunks'] // spec['images']))
+    return dict(spec, events=events)
+
+
+def parse_mix(text):
+    """Returns the weights of the cells from text
+    `orthorhombic-P:2,monoclinic-C:1`, the weight is 1 if not given.
+    """
+    mix = {}
+    for item in text.split(','):
+        name, _, weight = item.strip().partition(':')
+        mix[name] = float(weight) if weight else 1.0
+    return mix
+
+
+def direct_vectors(parameters):
+    """Returns the rows a, b, c of the cell in Angstroms.
+
+    Parameters
+    ----------
+    parameters : numpy.ndarray
+
+        a, b, c in Angstroms, alfa, beta, gamma in degrees.
+    """
+    a, b, c = parameters[:3]
+    alfa, beta, gamma = np.deg2rad(parameters[3:])
+    cx = c * np.cos(beta)
+    cy = c * (np.cos(alfa) - np.cos(beta) * np.cos(gamma)) / np.sin(gamma)
+    return np.array([[a, 0.0, 0.0],
+                     [b * np.cos(gamma), b * np.sin(gamma), 0.0],
+                     [cx, cy, np.sqrt(c**2 - cx**2 - cy**2)]])
+
+
+def panel_layout(quadrants=4, modules=4, fs_size=128, ss_size=64, gap=8):
+    """Returns the panels of a detector of quadrants rotated by 90 degrees
+    each, so all orientations handled by the panel arrangement occur.
+    The panels are stacked along the slow scan of the data.
+
+    Parameters
+    ----------
+    quadrants : int
+
+        Number of quadrants, up to 4.
+    modules : int
+
+        Number of panels of each quadrant.
+    fs_size : int
+
+        Fast scan size of a panel in pixels.
+    ss_size : int
+
+        Slow scan size of a panel in pixels.
+    gap : int
+
+        Gap between the panels and around the beam in pixels.
+
+    Returns
+    -------
+    panels : dict
+
+        Name of each panel with min_fs, max_fs, min_ss, max_ss
+        in the data, fs and ss directions and the corner.
+    """
+    panels = {}
+    for quadrant in range(quadrants):
+        angle = np.pi / 2 * quadrant
+        rotation = np.rint([[np.cos(angle), -np.sin(angle)],
+                            [np.sin(angle), np.cos(angle)]])
+        for module in range(modules):
+            index = quadrant * modules + module
+            corner = rotation @ [gap, gap + module * (ss_size + gap)]
+            panels["q{}a{}".format(quadrant, module)] = {
+                'min_fs': 0, 'max_fs': fs_size - 1,
+                'min_ss': index * ss_size, 'max_ss': (index + 1) * ss_size - 1,
+                'fs': rotation @ [1, 0], 'ss': rotation @ [0, 1],
+                'corner': corner}
+    return panels
+
+
+def data_shape(panels):
+    """Returns (ss, fs) shape of the data of the panels."""
+    return (max(panel['max_ss'] for panel in panels.values()) + 1,
+            max(panel['max_fs'] for panel in panels.values()) + 1)
+
+
+def write_geometry(filename, panels, spec=None):
+    """Writes the panels to CrystFEL geometry file.
+
+    Parameters
+    ----------
+    filename : Python unicode str (on py3)
+
+        Path to the geometry file.
+    panels : dict
+
+        Panels from `panel_layout`.
+    spec : dict
+
+        The spec with clen, res, photon_energy and events,
+        for more than 1 event the data are 3-D.
+        Default: None, `DEFAULT_SPEC` with 1 event.
+    """
+    spec = dict(DEFAULT_SPEC, **(spec or {}))
+    lines = ["clen = {}".format(spec['clen']),
+             "res = {}".format(spec['res']),
+             "adu_per_eV = 1",
+             "photon_energy = {}".format(spec['photon_energy']),
+             "data = /data/data"]
+    if spec.get('events', 1) > 1:
+        lines += ["dim0 = %", "dim1 = ss", "dim2 = fs"]
+    lines.append("")
+    for name, panel in panels.items():
+        lines += ["{}/min_fs = {}".format(name, panel['min_fs']),
+                  "{}/max_fs = {}".format(name, panel['max_fs']),
+                  "{}/min_ss = {}".format(name, panel['min_ss']),
+                  "{}/max_ss = {}".format(name, panel['max_ss']),
+                  "{}/fs = {:+.1f}x {:+.1f}y".format(name, *panel['fs']),
+                  "{}/ss = {:+.1f}x {:+.1f}y".format(name, *panel['ss']),
+                  "{}/corner_x = {:.1f}".format(name, panel['corner'][0]),
+                  "{}/corner_y = {:.1f}".format(name, panel['corner'][1]),
+                  ""]
+    lines += ["bad_beam/min_x = -4", "bad_beam/max_x = 4",
+              "bad_beam/min_y = -4", "bad_beam/max_y = 4"]
+    with open(filename, 'w') as file:
+        file.write("\n".join(lines) + "\n")
+
+
+def panel_table(panels):
+    """Returns the panels as arrays indexed by the number of the panel.
+
+    Parameters
+    ----------
+    panels : dict
+
+        Panels from `panel_layout`.
+
+    Returns
+    -------
+    table : dict
+
+        'names' and arrays of each key of the panels.
+    """
+    table = {'names': np.array(list(panels))}
+    for key in ['min_fs', 'max_fs', 'min_ss', 'max_ss', 'fs', 'ss',
+                'corner']:
+        table[key] = np.array([panel[key] for panel in panels.values()],
+                              dtype=float)
+    return table
+
+
+def lab_positions(table, index, fs_px, ss_px):
+    """Returns x, y in pixels from the beam of the positions
+    in the data of the panels `index` of the `panel_table`.
+    """
+    positions = (table['corner'][index] +
+                 (fs_px - table['min_fs'][index])[:, np.newaxis] *
+                 table['fs'][index] +
+                 (ss_px - table['min_ss'][index])[:, np.newaxis] *
+                 table['ss'][index])
+    return positions[:, 0], positions[:, 1]
+
+
+def one_over_d(x, y, spec):
+    """Returns 1/d in nm^-1 of the pixels at x, y from the beam."""
+    wavelength = 1239.84193 / spec['photon_energy']  # nm
+    radius = np.hypot(x, y) / spec['res']
+    two_theta = np.arctan2(radius, spec['clen'])
+    return 2 * np.sin(two_theta / 2) / wavelength
+
+
+def chunk_data(chunk, spec, table, seed=0):
+    """Returns the frame of the chunk.
+
+    Parameters
+    ----------
+    chunk : int
+
+        Index of the chunk.
+    spec : dict
+
+        The spec from `size_spec`.
+    table : dict
+
+        Panels from `panel_table`.
+    seed : int
+
+        Seed of the data.
+
+    Returns
+    -------
+    frame : dict
+
+        'hit', 'peaks' with arrays 'panel', 'panel_index', 'fs_px',
+        'ss_px', 'recip', 'intensity', and 'crystals' with dictionaries
+        'lattice_type', 'centering', 'unique_axis', 'reciprocal' (3, 3)
+        in nm^-1, 'resolution' and 'reflections'.
+    """
+    rng = np.random.default_rng([seed, chunk])
+    hit = rng.random() < spec['hit_rate']
+    count = rng.poisson(spec['peaks'] if hit else 2)
+    index = rng.integers(len(table['names']), size=count)
+    fs_px = table['min_fs'][index] + rng.random(count) * (
+        table['max_fs'][index] - table['min_fs'][index])
+    ss_px = table['min_ss'][index] + rng.random(count) * (
+        table['max_ss'][index] - table['min_ss'][index])
+    peaks = {'panel': table['names'][index], 'panel_index': index,
+             'fs_px': fs_px, 'ss_px': ss_px,
+             'recip': one_over_d(*lab_positions(table, index, fs_px, ss_px),
+                                 spec),
+             'intensity': rng.exponential(1000, count)}
+    crystals = []
+    if hit and rng.random() < spec['indexing_rate']:
+        number = max(1, rng.poisson(spec['crystals']))
+        cell_names = sorted(spec['mix'])
+        weights = np.array([spec['mix'][name] for name in cell_names])
+        for kind in rng.choice(len(cell_names), number,
+                               p=weights / weights.sum()):
+            crystals.append(crystal_data(rng, CELLS[cell_names[kind]], spec,
+                                         table['names']))
+    return {'hit': hit, 'peaks': peaks, 'crystals': crystals}
+
+
+def crystal_data(rng, cell, spec, names):
+    """Returns a crystal of the cell in random orientation, with the axes
+    renamed cyclically for the `permute` fraction of the crystals.
+    """
+    lattice_type, centering, unique_axis, parameters = cell
+    parameters = np.array(parameters) * rng.normal(1, spec['spread'], 6)
+    if lattice_type in ('tetragonal', 'cubic'):
+        # Keep the equal lengths and the right angles.
+        parameters[3:] = 90.0
+        parameters[1] = parameters[0]
+        if lattice_type == 'cubic':
+            parameters[2] = parameters[0]
+    elif lattice_type in ('hexagonal', 'rhombohedral'):
+        parameters[1] = parameters[0]
+        if lattice_type == 'hexagonal':
+            parameters[3:] = (90.0, 90.0, 120.0)
+        else:
+            parameters[2] = parameters[0]
+            parameters[3:] = parameters[3]
+    elif lattice_type != 'triclinic':
+        parameters[[3, 5]] = 90.0
+        if lattice_type == 'orthorhombic':
+            parameters[4] = 90.0
+    vectors = direct_vectors(parameters)
+    # Random orientation.
+    rotation, _ = np.linalg.qr(rng.normal(size=(3, 3)))
+    if np.linalg.det(rotation) < 0:
+        rotation[:, 0] *= -1
+    vectors = vectors @ rotation.T
+    centering = np.array([centering], dtype='<U2')
+    unique_axis = np.array([unique_axis], dtype='<U2')
+    if spec['permute'] and rng.random() < spec['permute']:
+        vectors = vectors[np.newaxis]
+        cyclic_shift(vectors, centering, unique_axis, np.array([0]),
+                     int(rng.integers(1, 3)))
+        vectors = vectors[0]
+    count = rng.poisson(spec['reflections'])
+    return {'lattice_type': lattice_type, 'centering': str(centering[0]),
+            'unique_axis': str(unique_axis[0]),
+            'reciprocal': np.linalg.inv(vectors / 10).T,
+            'resolution': rng.uniform(1.5, 6.0),
+            'reflections': {
+                'hkl': rng.integers(-30, 31, (count, 3)),
+                'values': rng.exponential(500, (count, 4)),
+                'fs_ss': rng.random((count, 2)) * 100,
+                'panel': names[rng.integers(len(names), size=count)]}}
+
+
+def crystal_text(crystal):
+    """Returns the lines of the crystal in the stream file."""
+    parameters = cell_parameters_nm(crystal['reciprocal'])
+    lines = ["--- Begin crystal\n",
+             "Cell parameters {:.5f} {:.5f} {:.5f} nm, "
+             "{:.5f} {:.5f} {:.5f} deg\n".format(*parameters)]
+    for name, vector in zip(['astar', 'bstar', 'cstar'],
+                            crystal['reciprocal']):
+        lines.append("{} = {:+.7f} {:+.7f} {:+.7f} nm^-1\n".format(name,
+                                                                   *vector))
+    reflections = crystal['reflections']
+    lines += ["lattice_type = {}\n".format(crystal['lattice_type']),
+              "centering = {}\n".format(crystal['centering']),
+              "unique_axis = {}\n".format(crystal['unique_axis']),
+              "profile_radius = 0.00150 nm^-1\n",
+              "diffraction_resolution_limit = {:.2f} nm^-1 or {:.2f} A\n"
+              .format(crystal['resolution'], 10 / crystal['resolution']),
+              "num_reflections = {}\n".format(len(reflections['panel'])),
+              "Reflections measured after indexing\n",
+              REFLECTION_HEADER + "\n"]
+    columns = (list(reflections['hkl'].T) + list(reflections['values'].T) +
+               list(reflections['fs_ss'].T) + [reflections['panel']])
+    rows = np.empty((len(reflections['panel']), 10), dtype=object)
+    for index, column in enumerate(columns):
+        rows[:, index] = column.tolist()
+    lines.append((REFLECTION_FORMAT * len(rows)).format(*rows.ravel()))
+    lines += ["End of reflections\n", "--- End crystal\n"]
+    return "".join(lines)
+
+
+def cell_parameters_nm(reciprocal):
+    """Returns a, b, c in nm and alfa, beta, gamma in degrees
+    of the reciprocal vectors.
+    """
+    vectors = np.linalg.inv(np.asarray(reciprocal).T)
+    lengths = np.linalg.norm(vectors, axis=1)
+    angles = [np.rad2deg(np.arccos(np.dot(vectors[first], vectors[second]) /
+                                   (lengths[first] * lengths[second])))
+              for first, second in [(1, 2), (0, 2), (0, 1)]]
+    return list(lengths) + angles
+
+
+def image_event(chunk, spec):
+    """Returns the image file name and the event of the chunk,
+    the event is None for files of single images. The frames are
+    reused in turn by the chunks after the `images` * `events` first.
+    """
+    events = spec['events']
+    name = IMAGE_NAME.format((chunk // events) % spec['images'])
+    return name, (chunk % events if events > 1 else None)
+
+
+def chunk_text(chunk, frame, spec):
+    """Returns the chunk of the frame in the stream file."""
+    name, event = image_event(chunk, spec)
+    peaks = frame['peaks']
+    crystals = frame['crystals']
+    lines = ["----- Begin chunk -----\n",
+             "Image filename: {}\n".format(name)]
+    if event is not None:
+        lines.append("Event: //{}\n".format(event))
+    resolution = peaks['recip'].max() if len(peaks['recip']) else 0.0
+    lines += ["Image serial number: {}\n".format(chunk + 1),
+              "hit = {}\n".format(int(frame['hit'])),
+              "indexed_by = {}\n".format("mosflm-nolatt-nocell"
+                                         if crystals else "none"),
+              "photon_energy_eV = {:.6f}\n".format(spec['photon_energy']),
+              "num_peaks = {}\n".format(len(peaks['panel'])),
+              "peak_resolution = {:.6f} nm^-1 or {:.6f} A\n".format(
+                  resolution, 10 / resolution if resolution else 0.0),
+              "Peaks from peak search\n", PEAK_HEADER + "\n"]
+    rows = np.empty((len(peaks['panel']), 5), dtype=object)
+    for column, key in enumerate(['fs_px', 'ss_px', 'recip', 'intensity',
+                                  'panel']):
+        rows[:, column] = peaks[key].tolist()
+    lines.append((PEAK_FORMAT * len(rows)).format(*rows.ravel()))
+    lines.append("End of peak list\n")
+    lines += [crystal_text(crystal) for crystal in crystals]
+    lines.append("----- End chunk -----\n")
+    return "".join(lines)
+
+
+def stream_text(first, count, spec, panels, seed=0):
+    """Returns the text of `count` chunks from the chunk `first`."""
+    table = panel_table(panels)
+    return "".join(chunk_text(chunk, chunk_data(chunk, spec, table, seed),
+                              spec)
+                   for chunk in range(first, first + count))
+
+
+def block_texts(blocks, spec, panels, seed=0, processes=1):
+    """Yields the texts of the blocks of chunks in order.
+
+    At most twice the number of workers blocks are generated ahead
+    of the block yielded, so the text waiting to be written stays
+    bounded.
+
+    Parameters
+    ----------
+    blocks : list
+
+        Pairs of the first chunk and the number of chunks.
+    spec : dict
+
+        The spec from `size_spec`.
+    panels : dict
+
+        Panels from `panel_layout`.
+    seed : int
+
+        Seed of the data.
+    processes : int
+
+        Number of worker processes, 1 generates the chunks in this
+        process. None is the number of CPUs.
+    """
+    if processes == 1 or len(blocks) < 2:
+        for first, count in blocks:
+            yield stream_text(first, count, spec, panels, seed)
+        return
+    workers = processes or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for first, count in blocks:
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+            pending.append(executor.submit(stream_text, first, count, spec,
+                                           panels, seed))
+        while pending:
+            yield pending.popleft().result()
+
+
+def write_stream(filename, spec, panels, seed=0, geometry=None,
+                 processes=1):
+    """Writes the indexing stream file of `spec['chunks']` chunks,
+    blocks of the chunks are generated by worker processes.
+
+    Parameters
+    ----------
+    filename : Python unicode str (on py3)
+
+        Path to the stream file.
+    spec : dict
+
+        The spec from `size_spec`.
+    panels : dict
+
+        Panels from `panel_layout`.
+    seed : int
+
+        Seed of the data.
+    geometry : Python unicode str (on py3)
+
+        Path to the geometry file copied to the header. Default: None.
+    processes : int
+
+        Number of worker processes, 1 generates the chunks in this
+        process. None is the number of CPUs.
+    """
+    header = ["CrystFEL stream format 2.3\n", "Generated by CrystFEL 0.8.0\n",
+              "Command line: indexamajig (synthetic, seed {})\n".format(seed),
+              "----- Begin geometry file -----\n"]
+    if geometry is not None:
+        with open(geometry) as file:
+            header.append(file.read())
+    header.append("----- End geometry file -----\n")
+    blocks = [(first, min(BLOCK_CHUNKS, spec['chunks'] - first))
+              for first in range(0, spec['chunks'], BLOCK_CHUNKS)]
+    texts = block_texts(blocks, spec, panels, seed, processes)
+    with open(filename, 'w') as file:
+        file.write("".join(header))
+        try:
+            for (first, count), text in zip(blocks, texts):
+                file.write(text)
+                LOGGER.debug("Written {} of {} chunks".format(
+                    first + count, spec['chunks']))
+        finally:
+            texts.close()
+
+
+def frame_image(peaks, shape, rng, background=10.0, width=1.5):
+    """Returns the data with Poisson background and gaussian spots
+    at the peaks.
+    """
+    data = rng.poisson(background, shape).astype(np.float32)
+    offsets = np.arange(-3, 4)
+    ss_offsets, fs_offsets = np.meshgrid(offsets, offsets, indexing='ij')
+    for fs_px, ss_px, intensity in zip(peaks['fs_px'], peaks['ss_px'],
+                                       peaks['intensity']):
+        fs_index = int(round(fs_px)) + fs_offsets
+        ss_index = int(round(ss_px)) + ss_offsets
+        inside = ((fs_index >= 0) & (fs_index < shape[1]) &
+                  (ss_index >= 0) & (ss_index < shape[0]))
+        spot = intensity * np.exp(-((fs_index - fs_px)**2 +
+                                    (ss_index - ss_px)**2) / (2 * width**2))
+        np.add.at(data, (ss_index[inside], fs_index[inside]), spot[inside])
+    return data
+
+
+def write_image(filename, index, spec, panels, seed=0):
+    """Writes the HDF5 file of the events of the image file `index`:
+    raw data of the panels in /data/data, 2-D or (events, ss, fs), and
+    the peaks of the first event in /processing/hitfinder/peakinfo-assembled
+    as x, y from the beam, intensity and 0.
+    """
+    shape = data_shape(panels)
+    table = panel_table(panels)
+    events = spec['events']
+    with h5py.File(filename, 'w') as file:
+        dataset = file.create_dataset(
+            '/data/data', shape=((events,) + shape if events > 1 else shape),
+            dtype=np.float32, chunks=(((1,) if events > 1 else ()) + shape),
+            compression='gzip', compression_opts=1)
+        for event in range(events):
+            chunk = index * events + event
+            peaks = chunk_data(chunk, spec, table, seed)['peaks']
+            data = frame_image(peaks, shape,
+                               np.random.default_rng([seed, chunk, 1]))
+            if events > 1:
+                dataset[event] = data
+            else:
+                dataset[...] = data
+            if event == 0:
+                x, y = lab_positions(table, peaks['panel_index'],
+                                     peaks['fs_px'], peaks['ss_px'])
+                file.create_dataset(
+                    '/processing/hitfinder/peakinfo-assembled',
+                    data=np.column_stack([x, y, peaks['intensity'],
+                                          np.zeros(len(x))]))
+
+
+def generate(directory, spec, seed=0, images=True, processes=1):
+    """Writes the geometry file, the stream file and the images
+    of the spec to the directory.
+
+    Parameters
+    ----------
+    directory : Python unicode str (on py3)
+
+        Output directory, created if needed.
+    spec : dict
+
+        The spec from `size_spec`.
+    seed : int
+
+        Seed of the data.
+    images : bool
+
+        Write the HDF5 files.
+    processes : int
+
+        Number of worker processes generating the stream file.
+
+    Returns
+    -------
+    files : dict
+
+        Paths of the 'geometry', the 'stream' and the 'images'.
+    """
+    os.makedirs(directory, exist_ok=True)
+    panels = panel_layout(spec['quadrants'], spec['modules'],
+                          spec['fs_size'], spec['ss_size'])
+    files = {'geometry': os.path.join(directory, GEOMETRY_NAME),
+             'stream': os.path.join(directory, STREAM_NAME), 'images': []}
+    write_geometry(files['geometry'], panels, spec)
+    write_stream(files['stream'], spec, panels, seed, files['geometry'],
+                 processes)
+    frames = spec['images'] * spec['events']
+    if spec['chunks'] > frames:
+        LOGGER.info("The {} chunks reuse the {} frames of the images".format(
+            spec['chunks'], frames))
+    if images:
+        for index in range(spec['images']):
+            files['images'].append(os.path.join(directory,
+                                                IMAGE_NAME.format(index)))
+            write_image(files['images'][-1], index, spec, panels, seed)
+    LOGGER.info("Written {} chunks and {} images to {}".format(
+        spec['chunks'], len(files['images']), directory))
+    return files
+
+
+def crystal_list(count=100000, mix=None, spread=0.01, seed=0):
+    """Returns crystals dictionaries as from `search_crystals_parameters`
+    with cells of `CELLS`, without writing a file.
+
+    Parameters
+    ----------
+    count : int
+
+        Number of crystals.
+    mix : dict
+
+        Weights of the cells. Default: None, all cells equally.
+    spread : float
+
+        Relative spread of the cell parameters.
+    seed : int
+
+        Seed of the data.
+    """
+    rng = np.random.default_rng(seed)
+    names = sorted(mix if mix else CELLS)
+    weights = np.array([mix[name] if mix else 1.0 for name in names])
+    kinds = rng.choice(len(names), count, p=weights / weights.sum())
+    values = (np.array([CELLS[name][3] for name in names])[kinds] *
+              rng.normal(1, spread, (count, 6)))
+    crystals = []
+    for index, (kind, row) in enumerate(zip(kinds, values.tolist())):
+        lattice_type, centering, unique_axis, _ = CELLS[names[kind]]
+        crystal = dict(zip(['a', 'b', 'c', 'alfa', 'beta', 'gamma'], row))
+        crystal.update({'name': "Image filename: {}Event: //{}".format(
+                            IMAGE_NAME.format(0), index),
+                        'lattice_type': lattice_type, 'centering': centering,
+                        'unique_axis': unique_axis})
+        crystals.append(crystal)
+    return crystals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Write synthetic stream, geometry and HDF5 files.")
+    parser.add_argument('directory', help="Output directory")
+    parser.add_argument('-s', '--size', choices=list(SIZES), default='small',
+                        help="Size of the data (default: small)")
+    parser.add_argument('--seed', type=int, default=0,
+                        help="Seed of the data (default: 0)")
+    parser.add_argument('-n', '--chunks', type=int,
+                        help="Number of chunks")
+    parser.add_argument('--images', type=int,
+                        help="Number of image files")
+    parser.add_argument('--events', type=int,
+                        help="Number of events in each image file")
+    parser.add_argument('--peaks', type=float,
+                        help="Mean number of peaks of a hit")
+    parser.add_argument('--crystals', type=float,
+                        help="Mean number of crystals of an indexed frame")
+    parser.add_argument('--reflections', type=float,
+                        help="Mean number of reflections of a crystal")
+    parser.add_argument('--hit-rate', type=float, help="Fraction of hits")
+    parser.add_argument('--indexing-rate', type=float,
+                        help="Fraction of the hits which are indexed")
+    parser.add_argument('--mix', type=parse_mix,
+                        help="Weights of the cells e.g. orthorhombic-P:2,"
+                        "monoclinic-C:1, of " + ', '.join(CELLS))
+    parser.add_argument('--permute', type=float,
+                        help="Fraction of crystals with renamed axes")
+    parser.add_argument('--modules', type=int,
+                        help="Number of panels of each quadrant")
+    parser.add_argument('--unique-frames', action='store_true',
+                        help="Add events to the image files until each "
+                        "chunk has its own frame")
+    parser.add_argument('--no-images', action='store_true',
+                        help="Don't write the HDF5 files")
+    parser.add_argument('-j', '--processes', type=int, default=None,
+                        help="Number of worker processes")
+    args = parser.parse_args(argv)
+    try:
+        spec = size_spec(args.size, chunks=args.chunks, images=args.images,
+                         events=args.events, peaks=args.peaks,
+                         crystals=args.crystals,
+                         reflections=args.reflections,
+                         hit_rate=args.hit_rate,
+                         indexing_rate=args.indexing_rate, mix=args.mix,
+                         permute=args.permute, modules=args.modules)
+    except ValueError as err:
+        parser.error(str(err))
+    if args.unique_frames:
+        spec = unique_frames(spec)
+    generate(args.directory, spec, args.seed, not args.no_images,
+             args.processes)
+    return 0
+
+
+if __name__ == '__main__':
+    main()
@@ -1,50 +1,41 @@
+import argparse
 import matplotlib.pyplot
 import unittest
 from unittest.mock import patch, Mock
 
-from CrystFEL_Jupyter_utilities.GUI_tools import CellExplorer
+from CrystFEL_Jupyter_utilities.GUI_tools import (CellExplorer, density_pair,
+                                                  main)
 
 
 class TestCellExplorer(unittest.TestCase):
-    @patch('CrystFEL_Jupyter_utilities.GUI_tools.search_crystals_parameters')
-    @patch('CrystFEL_Jupyter_utilities.GUI_tools.stats')
+    @patch('CrystFEL_Jupyter_utilities.cell_engine.search_crystals_parameters')
     @patch('CrystFEL_Jupyter_utilities.GUI_tools.CenteringButton')
     @patch('CrystFEL_Jupyter_utilities.GUI_tools.ButtonBins')
     @patch('CrystFEL_Jupyter_utilities.GUI_tools.Button')
     @patch('CrystFEL_Jupyter_utilities.GUI_tools.Span')
-    @patch('CrystFEL_Jupyter_utilities.GUI_tools.np')
     @patch('CrystFEL_Jupyter_utilities.GUI_tools.Histogram')
-    @patch('CrystFEL_Jupyter_utilities.GUI_tools.histograms_data')
     @patch('matplotlib.axes.Axes')
     @patch('CrystFEL_Jupyter_utilities.GUI_tools.plt')
-    def setUp(self, mock_plt, mock_ax, mock_histograms_data, mock_histogram,
-              mock_numpy, mock_span, mock_button_bins, mock_button,
-              mock_centering_button, mock_stats,
-              mock_search_crystals_parameters):
+    def setUp(self, mock_plt, mock_ax, mock_histogram,
+              mock_span, mock_button_bins, mock_button,
+              mock_centering_button, mock_search_crystals_parameters):
         self.mock_plt = mock_plt
-        self.mock_histograms_data = mock_histograms_data
         self.mock_histogram = mock_histogram
-        self.mock_numpy = mock_numpy
         self.mock_span = mock_span
         self.mock_button_bins = mock_button_bins
         self.mock_button = mock_button
         self.mock_centering_button = mock_centering_button
-        self.mock_stats = mock_stats
         self.mock_search_crystals_parameters = mock_search_crystals_parameters
         self.figure = mock_plt.figure
         self.mock_ax = mock_ax
         self.mock_plt.subplots.return_value = (self.figure, self.mock_ax)
-        self.mock_histograms_data.crystals_list.return_value = [1, 2, 3, 4]
-        self.mock_stats.norm.fit.return_value = (1, 2)
-        self.mock_numpy.linspace.return_value = [0, 1, 2, 3, 4, 5, 6, 7]
-        self.mock_stats.norm.pdf.return_value = [1, 2, 2, 4, 2, 2, 1]
         self.cell = CellExplorer("test_file")
 
     def test_init(self):
         assert self.mock_plt.subplots.called
         assert self.mock_ax.ravel.called
         assert self.mock_plt.show.called
-        assert self.mock_histograms_data.called
+        self.assertEqual(len(self.cell.cross_filter), 0)
         assert self.mock_search_crystals_parameters.called
         self.mock_search_crystals_parameters.called_with("test_file")
         self.assertEqual(self.mock_histogram.call_count, 6)
@@ -54,16 +45,14 @@ class TestCellExplorer(unittest.TestCase):
 
     def test_gauss_draw(self):
         self.assertEqual(self.mock_histogram().update.call_count, 6)
-        self.assertEqual(self.mock_stats.norm.fit.call_count, 6)
-        self.mock_stats.norm.pdf.assert_called_with([0, 1, 2, 3, 4, 5, 6, 7],
-                                                    1, 2)
-        self.mock_histogram().axs.plot.assert_called_with([0, 1, 2, 3, 4, 5,
-                                                           6, 7],
-                                                          [1, 2, 2, 4, 2, 2,
-                                                           1])
-        assert self.mock_histogram().axs.get_ylim.called
-        assert self.mock_histogram().axs.text.called
-        self.mock_numpy.round.assert_called_with(2, 2)
+        self.assertEqual(self.mock_histogram().draw_fit.call_count, 6)
+        # No crystals in the stream.
+        mu, sigma = self.mock_histogram().draw_fit.call_args[0]
+        self.assertNotEqual(mu, mu)
+        self.mock_histogram.reset_mock()
+        self.cell.gauss_draw()
+        self.assertEqual(self.mock_histogram().draw_fit.call_count, 6)
+        assert not self.mock_histogram().axs.plot.called
 
     @patch('matplotlib.backend_bases.MouseEvent')
     def test_remember_pos_panel(self, mock_event):
@@ -96,10 +85,33 @@ class TestCellExplorer(unittest.TestCase):
     @patch('matplotlib.backend_bases.MouseEvent')
     def test_save_file(self, mock_event):
         self.mock_histogram.reset_mock()
+        self.cell.engine.save_unit_cell = Mock()
+        self.mock_histogram().was_clicked_before = False
+        self.cell.save_file(mock_event)
+        assert not self.cell.engine.save_unit_cell.called
         self.mock_histogram().was_clicked_before = True
         self.cell.save_file(mock_event)
         self.assertEqual(self.cell.was_all_hist_selected(), True)
-        self.assertEqual(self.mock_stats.norm.fit.call_count, 6)
+        self.cell.engine.save_unit_cell.assert_called_once_with()
+        self.cell.engine.save_unit_cell.side_effect = ValueError("Fit")
+        self.cell.save_file(mock_event)
+
+    @patch('matplotlib.backend_bases.MouseEvent')
+    def test_export_stream(self, mock_event):
+        self.cell.engine.export_stream = Mock(return_value=3)
+        self.cell.export_stream(mock_event)
+        self.cell.engine.export_stream.assert_called_once_with(
+            "test_file_selected")
+        self.cell.engine.export_stream.side_effect = OSError("Disk full")
+        self.cell.export_stream(mock_event)
+
+    def test_density_pair(self):
+        self.assertEqual(density_pair('a:gamma'), ('a', 'gamma'))
+        for text in ['a', 'a:b:c', 'a:x']:
+            with self.assertRaises(argparse.ArgumentTypeError):
+                density_pair(text)
+        with self.assertRaises(SystemExit):
+            main(['test_file', '--density', 'a:x'])
 
 
 if __name__ == '__main__':
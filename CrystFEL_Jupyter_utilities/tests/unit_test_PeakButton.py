@@ -9,7 +9,6 @@ from CrystFEL_Jupyter_utilities.widget import PeakButtons
 
 class TestPeakButtons(unittest.TestCase):
     @patch('CrystFEL_Jupyter_utilities.widget.Button')
-    @patch('CrystFEL_Jupyter_utilities.peak_h5.Peak')
     @patch('CrystFEL_Jupyter_utilities.panel.Detector')
     @patch('CrystFEL_Jupyter_utilities.widget.ContrastSlider')
     @patch('CrystFEL_Jupyter_utilities.widget.Radio')
@@ -17,24 +16,23 @@ class TestPeakButtons(unittest.TestCase):
     @patch('matplotlib.axes.Axes')
     @patch('matplotlib.pyplot.axes')
     def setUp(self, mock_axes, mock_ax, mock_plt, mock_radio, mock_slider,
-              mock_detector, mock_peak, mock_button):
+              mock_detector, mock_button):
         self.mock_axes = mock_axes
         self.mock_ax = mock_ax
         self.mock_plt = mock_plt
         self.mock_radio = mock_radio
         self.mock_slider = mock_slider
         self.mock_detector = mock_detector
-        self.mock_peak = mock_peak
         self.mock_button = mock_button
         self.mock_fig = self.mock_plt.figure
         self.title = "test.title"
         self.mock_detectors = {"det1": self.mock_detector, "det2":
                                self.mock_detector}
-        self.mock_peaks = [self.mock_peak, self.mock_peak,
-                           self.mock_peak]
+        self.peaks = {'position': numpy.array([[1., 2.], [3., 4.], [5., 6.]]),
+                      'intensity': numpy.ones(3), 'offset': numpy.zeros(3)}
         self.matrix = numpy.ones((2, 3))
         self.bttn = PeakButtons(fig=self.mock_fig, ax=self.mock_ax,
-                                matrix=self.matrix, peaks=self.mock_peaks,
+                                matrix=self.matrix, peaks=self.peaks,
                                 panels=self.mock_detectors,
                                 number_peaks_button=3, title=self.title,
                                 radio=self.mock_radio, slider=self.mock_slider)
@@ -70,16 +68,20 @@ class TestPeakButtons(unittest.TestCase):
         self.assertEqual(self.mock_ax.add_artist.call_count, 4)
         self.assertEqual(self.bttn.list_active_peak, [False, True, False])
 
-    @patch('CrystFEL_Jupyter_utilities.widget.plt.Circle')
-    def test_visual_peaks(self, mock_circle):
-        self.mock_peak.get_position.return_value = (1, 2)
+    def test_visual_peaks(self):
         self.bttn.visual_peaks()
-        self.assertEqual(self.mock_peak.get_position.call_count, 3)
-        self.assertEqual(self.mock_ax.add_artist.call_count, 3)
-        mock_circle.assert_called_with((1, 2), color='y', fill=False, radius=5)
-        self.mock_ax.add_artist.assert_called_with(mock_circle())
-        self.assertEqual(self.mock_ax.add_artist.call_count, 3)
+        self.assertEqual(self.mock_ax.add_artist.call_count, 1)
+        circles = self.mock_ax.add_artist.call_args[0][0]
+        vertices = circles.get_path().vertices.reshape(3, -1, 2)
+        numpy.testing.assert_allclose(vertices.mean(axis=1),
+                                      self.peaks['position'], atol=0.5)
+        numpy.testing.assert_allclose(
+            numpy.hypot(*(vertices[1, 0] - [3., 4.])), 5)
+        self.assertFalse(circles.get_fill())
         self.assertEqual(self.bttn.list_active_peak, [False, False, False])
+        self.bttn.peaks = None
+        self.bttn.visual_peaks()
+        self.assertEqual(self.mock_ax.add_artist.call_count, 1)
 
     @patch('matplotlib.backend_bases.Event')
     def test_peaks_on_of(self, mock_event):
@@ -0,0 +1,92 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from CrystFEL_Jupyter_utilities import cell_batch
+
+
+def crystals(centering):
+    all_crystals_list = []
+    for a in [10.0, 10.1, 10.2, 9.9, 10.05]:
+        all_crystals_list.append(
+            {'a': a, 'b': a, 'c': 2 * a, 'alfa': 90.0, 'beta': 90.0,
+             'gamma': 90.0, 'centering': centering})
+    # Far away from the others, outside of the proposed ranges.
+    all_crystals_list.append(
+        {'a': 30.0, 'b': 30.0, 'c': 30.0, 'alfa': 90.0, 'beta': 90.0,
+         'gamma': 90.0, 'centering': 'P'})
+    return all_crystals_list
+
+
+class TestCellBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.streamfile = os.path.join(self.directory.name, 'run_1.stream')
+        open(self.streamfile, 'w').close()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_cell_file_name(self):
+        self.assertEqual(cell_batch.cell_file_name('/a/run_1.stream'),
+                         '/a/run_1.cell')
+        self.assertEqual(cell_batch.cell_file_name('/a/run_1.stream', '/b'),
+                         '/b/run_1.cell')
+
+    @patch('CrystFEL_Jupyter_utilities.cell_engine.'
+           'search_crystals_parameters')
+    def test_process_stream(self, mock_search_crystals_parameters):
+        mock_search_crystals_parameters.return_value = crystals('C')
+        row = cell_batch.process_stream(self.streamfile)
+        self.assertEqual(row['error'], '')
+        self.assertEqual(row['crystals'], 6)
+        self.assertEqual(row['selected'], 5)
+        self.assertEqual(row['lattice_type'], 'TETRAGONAL')
+        self.assertEqual(row['centering'], 'C')
+        self.assertEqual(row['cell_file'],
+                         os.path.join(self.directory.name, 'run_1.cell'))
+        self.assertTrue(os.path.isfile(row['cell_file']))
+
+    @patch('CrystFEL_Jupyter_utilities.cell_engine.'
+           'search_crystals_parameters')
+    def test_process_stream_ranges(self, mock_search_crystals_parameters):
+        mock_search_crystals_parameters.return_value = crystals('C')
+        row = cell_batch.process_stream(self.streamfile,
+                                        ranges={'a': (25, 35)})
+        self.assertEqual(row['selected'], 1)
+        self.assertEqual(row['centering'], 'P')
+        self.assertEqual(row['a'], 30.0)
+        row = cell_batch.process_stream(self.streamfile,
+                                        ranges={'a': (25, 35)}, auto=False)
+        self.assertEqual(row['error'], "Fit all six parameters first.")
+        self.assertEqual(row['cell_file'], '')
+
+    def test_process_stream_missing(self):
+        row = cell_batch.process_stream(
+            os.path.join(self.directory.name, 'missing.stream'))
+        self.assertNotEqual(row['error'], '')
+
+    @patch('CrystFEL_Jupyter_utilities.cell_engine.'
+           'search_crystals_parameters')
+    def test_main(self, mock_search_crystals_parameters):
+        mock_search_crystals_parameters.return_value = crystals('I')
+        summary = os.path.join(self.directory.name, 'summary.tsv')
+        output_dir = os.path.join(self.directory.name, 'cells')
+        status = cell_batch.main([self.streamfile, '-j', '1', '-o',
+                                  output_dir, '-s', summary, '--c', '15',
+                                  '25'])
+        self.assertEqual(status, 0)
+        self.assertTrue(os.path.isfile(
+            os.path.join(output_dir, 'run_1.cell')))
+        with open(summary) as file:
+            lines = file.read().splitlines()
+        self.assertEqual(lines[0].split('\t'), cell_batch.SUMMARY_COLUMNS)
+        row = dict(zip(cell_batch.SUMMARY_COLUMNS, lines[1].split('\t')))
+        self.assertEqual(row['centering'], 'I')
+        self.assertEqual(row['c'], '20.1')
+
+
+if __name__ == '__main__':
+    unittest.main()
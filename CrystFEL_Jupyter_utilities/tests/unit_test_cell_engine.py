@@ -0,0 +1,182 @@
+import numpy
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from CrystFEL_Jupyter_utilities.cell_engine import CellEngine
+
+
+class TestCellEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.all_crystals_list = []
+        for a, centering in [(10.0, 'C'), (10.1, 'C'), (10.2, 'C'),
+                             (9.9, 'C'), (20.0, 'P'), (20.1, 'I')]:
+            self.all_crystals_list.append(
+                {'a': a, 'b': a, 'c': 2 * a, 'alfa': 90.0, 'beta': 90.0,
+                 'gamma': 90.0, 'centering': centering})
+        self.engine = CellEngine(self.all_crystals_list)
+
+    def select_all(self):
+        self.engine.set_ranges({'a': (9, 11), 'b': (9, 11), 'c': (19, 21),
+                                'alfa': (89, 91), 'beta': (89, 91),
+                                'gamma': (89, 91)})
+
+    @patch('CrystFEL_Jupyter_utilities.cell_engine.'
+           'search_crystals_parameters')
+    def test_from_stream(self, mock_search_crystals_parameters):
+        mock_search_crystals_parameters.return_value = self.all_crystals_list
+        engine = CellEngine.from_stream("test_file")
+        mock_search_crystals_parameters.assert_called_with("test_file")
+        self.assertEqual(len(engine.cross_filter), 6)
+
+    def test_canonical(self):
+        # The same cell with swapped a and b.
+        crystals = []
+        for astar, bstar in [([0.1, 0, 0], [0, 0.05, 0]),
+                             ([0.05, 0, 0], [0, 0.1, 0])]:
+            crystals.append({'a': 0, 'b': 0, 'c': 0, 'alfa': 0, 'beta': 0,
+                             'gamma': 0, 'centering': 'P',
+                             'lattice_type': 'orthorhombic',
+                             'unique_axis': '*', 'astar': astar,
+                             'bstar': bstar, 'cstar': [0, 0, 0.04]})
+        engine = CellEngine(crystals, canonical=True)
+        numpy.testing.assert_array_almost_equal(
+            engine.crystals_table.parameters,
+            [[100, 200, 250, 90, 90, 90]] * 2)
+        # Without reciprocal vectors the values are kept.
+        engine = CellEngine(self.all_crystals_list, canonical=True)
+        self.assertEqual(engine.crystals_table.parameters[0, 2], 20.0)
+
+    def test_export_stream(self):
+        for chunk, crystal in enumerate(self.all_crystals_list):
+            crystal['chunk'] = chunk // 2
+        engine = CellEngine(self.all_crystals_list)
+        engine.set_range('a', 15, 25)
+        numpy.testing.assert_array_equal(engine.selected_chunks(), [2])
+        with self.assertRaises(ValueError):
+            engine.export_stream("selected.stream")
+        engine.streamfile = "test.stream"
+        with patch('CrystFEL_Jupyter_utilities.cell_engine.'
+                   'export_chunks') as mock_export_chunks:
+            self.assertEqual(engine.export_stream("selected.stream"), 1)
+            args = mock_export_chunks.call_args[0]
+            self.assertEqual(args[:2], ("test.stream", "selected.stream"))
+            numpy.testing.assert_array_equal(args[2], [2])
+
+    def test_set_range(self):
+        self.engine.set_range('c', 19, 21)
+        self.assertEqual(self.engine.ranges['c'], (19, 21))
+        self.assertEqual(self.engine.cross_filter.last_dimension, 2)
+        self.assertEqual(self.engine.cross_filter.included_count(), 4)
+        self.assertFalse(self.engine.all_selected())
+        self.select_all()
+        self.assertTrue(self.engine.all_selected())
+        self.engine.reset()
+        self.assertEqual(self.engine.ranges['c'], (None, None))
+
+    def test_select_clusters(self):
+        ranges = self.engine.select_clusters(['a', 'alfa'])
+        self.assertListEqual(list(ranges), ['a', 'alfa'])
+        left, right = ranges['a']
+        self.assertTrue(9.5 < left <= 9.9)
+        self.assertTrue(10.2 <= right < 11)
+        self.assertEqual(self.engine.ranges['a'], ranges['a'])
+        self.assertEqual(self.engine.ranges['b'], (None, None))
+        self.assertEqual(self.engine.cross_filter.included_count(), 4)
+        self.assertEqual(self.engine.group_centering(), 'C')
+
+    def test_histogram_counts(self):
+        self.engine.set_range('a', 15, 25)
+        counts, edges = self.engine.histogram_counts('a', 2)
+        numpy.testing.assert_array_almost_equal(edges, [9.9, 15.0, 20.1])
+        numpy.testing.assert_array_equal(counts[0], [0, 1])
+        numpy.testing.assert_array_equal(counts[3], [0, 0])
+        numpy.testing.assert_array_equal(counts[4], [0, 1])
+        numpy.testing.assert_array_equal(counts[-1], [4, 0])
+
+    def test_density_counts(self):
+        self.engine.set_range('a', 15, 25)
+        counts, x_edges, y_edges = self.engine.density_counts('a', 'c', 2)
+        numpy.testing.assert_array_almost_equal(x_edges, [9.9, 15.0, 20.1])
+        numpy.testing.assert_array_almost_equal(y_edges, [19.8, 30.0, 40.2])
+        numpy.testing.assert_array_equal(counts, [[0, 0], [0, 2]])
+        self.engine.reset()
+        numpy.testing.assert_array_equal(counts, [[4, 0], [0, 2]])
+
+    def test_fit(self):
+        self.select_all()
+        mu, sigma = self.engine.fit('a')
+        values = [10.0, 10.1, 10.2, 9.9]
+        self.assertAlmostEqual(mu, numpy.mean(values))
+        self.assertAlmostEqual(sigma, numpy.std(values))
+        self.assertEqual(len(self.engine.fits()), 6)
+        mu, sigma = self.engine.fit('a', robust=True)
+        # Median of the fine bins: one of the two middle values.
+        self.assertTrue(9.99 < mu < 10.11)
+        self.engine.set_range('a', 30, 40)
+        mu, sigma = self.engine.fit('a')
+        self.assertTrue(numpy.isnan(mu))
+
+    def test_fit_cache(self):
+        self.select_all()
+        with patch.object(self.engine.cross_filter, 'moments',
+                          return_value=(1, 2)) as mock_moments:
+            self.engine.fit('a')
+            self.engine.fit('a')
+            self.assertEqual(mock_moments.call_count, 1)
+            # A new selection computes the fit again.
+            self.engine.set_range('b', 9, 11)
+            self.engine.fit('a')
+            self.assertEqual(mock_moments.call_count, 2)
+
+    def test_group_centering(self):
+        self.assertIsNone(self.engine.group_centering())
+        self.engine.set_range('a', 9, 11)
+        self.assertEqual(self.engine.group_centering(), 'C')
+        self.engine.set_range('a', 19.9, 20.05)
+        self.assertEqual(self.engine.group_centering(), 'P')
+        self.engine.set_range('a', 19, 21)
+        self.assertIsNone(self.engine.group_centering())
+        self.engine.set_range('a', 30, 40)
+        self.assertIsNone(self.engine.group_centering())
+
+    def test_lattice_type(self):
+        self.assertEqual(CellEngine.lattice_type([10, 10, 10, 90, 90, 90]),
+                         ('CUBIC', '*'))
+        self.assertEqual(CellEngine.lattice_type([10, 10, 20, 90, 90, 90]),
+                         ('TETRAGONAL', 'c'))
+        self.assertEqual(CellEngine.lattice_type([10, 10, 20, 90, 90, 120]),
+                         ('HEXAGONAL', 'c'))
+        self.assertEqual(CellEngine.lattice_type([10, 15, 20, 90, 100, 90]),
+                         ('MONOCLINIC', 'b'))
+        self.assertEqual(CellEngine.lattice_type([10, 15, 20, 70, 80, 100]),
+                         ('TRICLINIC', '*'))
+
+    def test_unit_cell(self):
+        with self.assertRaises(ValueError):
+            self.engine.unit_cell()
+        self.select_all()
+        output = self.engine.unit_cell()
+        self.assertIn("lattice_type = TETRAGONAL", output)
+        self.assertIn("unique_axis = c", output)
+        self.assertIn("centering = C", output)
+        self.assertIn("c = 20.1 A", output)
+        self.engine.set_range('a', 5, 25)
+        self.engine.set_range('b', 5, 25)
+        self.engine.set_range('c', 15, 45)
+        with self.assertRaises(ValueError):
+            self.engine.unit_cell()
+
+    def test_save_unit_cell(self):
+        self.select_all()
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "test.cell")
+            self.engine.save_unit_cell(filename)
+            with open(filename) as file:
+                self.assertEqual(file.read(), self.engine.unit_cell())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -26,11 +26,21 @@ class TestCenteringButton(unittest.TestCase):
     def test_on_check(self, mock_event):
         self.bttn.on_check(mock_event)
         self.assertEqual(self.mock_hist.update_colors.call_count, 3)
-        assert self.fig.canvas.draw.called
+        self.assertEqual(self.mock_hist.axs.redraw_in_frame.call_count, 3)
+        self.fig.canvas.blit.assert_called_once_with(self.fig.bbox)
+        self.assertFalse(self.fig.canvas.draw.called)
+        self.assertFalse(self.mock_hist.update.called)
         self.assertEqual("green", self.bttn.color)
         self.bttn.on_check(mock_event)
         self.assertEqual("red", self.bttn.color)
 
+    @patch('matplotlib.backend_bases.Event')
+    def test_on_check_without_blit(self, mock_event):
+        self.fig.canvas.supports_blit = False
+        self.bttn.on_check(mock_event)
+        assert self.fig.canvas.draw_idle.called
+        self.assertFalse(self.fig.canvas.blit.called)
+
     @patch('CrystFEL_Jupyter_utilities.widget.itertools')
     def test_reset_color(self, mock_itertools):
         self.bttn.reset_color()
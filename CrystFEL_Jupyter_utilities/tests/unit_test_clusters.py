@@ -0,0 +1,73 @@
+import numpy
+import unittest
+
+from CrystFEL_Jupyter_utilities import clusters
+from CrystFEL_Jupyter_utilities.crystlib import FINE_BINS
+
+
+class TestClusters(unittest.TestCase):
+
+    def setUp(self):
+        rng = numpy.random.default_rng(0)
+        # Two clusters, the larger one around 60, the smaller around 80.
+        values = numpy.concatenate([rng.normal(60, 0.5, 7000),
+                                    rng.normal(80, 0.5, 3000)])
+        self.value_range = (values.min(), values.max())
+        index = ((values - self.value_range[0]) /
+                 (self.value_range[1] - self.value_range[0]) * FINE_BINS)
+        self.counts = numpy.bincount(
+            numpy.clip(index.astype(int), 0, FINE_BINS - 1),
+            minlength=FINE_BINS)
+
+    def test_bandwidth(self):
+        counts = numpy.zeros((2, 100))
+        counts[0, 50] = 10
+        counts[1, 40:60] = 5
+        width = clusters.bandwidth(counts)
+        self.assertEqual(width[0], 1.0)
+        self.assertGreater(width[1], 1.0)
+
+    def test_find_peaks(self):
+        density = numpy.array([0, 1, 3, 1, 0, 0.1, 0, 2, 2, 1.0])
+        numpy.testing.assert_array_equal(clusters.find_peaks(density),
+                                         [2, 7])
+        numpy.testing.assert_array_equal(
+            clusters.find_peaks(density, min_height=0.01), [2, 5, 7])
+        self.assertEqual(len(clusters.find_peaks(numpy.zeros(5))), 0)
+
+    def test_merge_peaks(self):
+        density = numpy.array([0, 3, 2.5, 2.8, 0, 1, 0.0])
+        numpy.testing.assert_array_equal(
+            clusters.merge_peaks(density, [1, 3, 5]), [1, 5])
+        numpy.testing.assert_array_equal(
+            clusters.merge_peaks(density, [1, 3, 5], depth=0.9), [1, 3, 5])
+
+    def test_peak_bounds(self):
+        density = numpy.array([0, 1, 3, 1, 0.5, 1, 4, 2, 0, 0.0])
+        peaks = clusters.find_peaks(density)
+        # The cluster ends in the valley between the peaks.
+        self.assertEqual(clusters.peak_bounds(density, peaks, 6), (4, 8))
+        self.assertEqual(clusters.peak_bounds(density, peaks, 2, 0.3),
+                         (1, 4))
+
+    def test_find_clusters(self):
+        found = clusters.find_clusters(self.counts[numpy.newaxis])[0]
+        self.assertEqual(len(found), 2)
+        # Sorted from the largest.
+        self.assertGreater(found[0][2], 6500)
+        self.assertGreater(found[1][2], 2800)
+        self.assertLess(found[0][1], found[1][0])
+
+    def test_propose_ranges(self):
+        counts = numpy.vstack([self.counts,
+                               numpy.zeros(FINE_BINS, dtype=int)])
+        ranges = clusters.propose_ranges(counts,
+                                         [self.value_range, (0, 1)])
+        left, right = ranges[0]
+        self.assertTrue(58 < left < 59)
+        self.assertTrue(61 < right < 62)
+        self.assertEqual(ranges[1], (None, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import numpy
+import unittest
+
+from CrystFEL_Jupyter_utilities.crossfilter import CrossFilter, EXCLUDED
+from CrystFEL_Jupyter_utilities.crystlib import CrystalsTable
+
+
+class TestCrossFilter(unittest.TestCase):
+
+    def setUp(self):
+        self.all_crystals_list = []
+        for a, alfa, centering in [(10, 90, 'P'), (20, 90, 'C'),
+                                   (30, 120, 'P'), (40, 120, 'I'),
+                                   (50, 90, '?')]:
+            self.all_crystals_list.append(
+                {'a': a, 'b': a, 'c': a, 'alfa': alfa, 'beta': 90,
+                 'gamma': 90, 'centering': centering})
+        self.table = CrystalsTable(self.all_crystals_list)
+        self.cross_filter = CrossFilter(self.table)
+
+    def assert_counts_match_mask(self):
+        mask = self.cross_filter.included
+        for dimension in range(6):
+            counts = self.cross_filter.fine_counts[dimension]
+            fine_index = self.cross_filter.fine_index[:, dimension]
+            for row in range(EXCLUDED):
+                expected = numpy.bincount(
+                    fine_index[mask & (self.table.centering == row)],
+                    minlength=counts.shape[1])
+                numpy.testing.assert_array_equal(counts[row], expected)
+            numpy.testing.assert_array_equal(
+                counts[EXCLUDED],
+                numpy.bincount(fine_index[~mask], minlength=counts.shape[1]))
+
+    def test_init(self):
+        self.assertEqual(len(self.cross_filter), 5)
+        self.assertEqual(self.cross_filter.value_ranges[0], (10, 50))
+        self.assertEqual(self.cross_filter.fine_counts.shape[:2], (6, 9))
+        self.assertIsNone(self.cross_filter.last_dimension)
+        self.assertEqual(self.cross_filter.included_count(), 5)
+        # The crystal with unknown centering is counted only when excluded.
+        self.assertEqual(self.cross_filter.fine_counts[0].sum(), 4)
+        self.assert_counts_match_mask()
+
+    def test_set_range(self):
+        entering, leaving = self.cross_filter.set_range(0, 15, 35)
+        numpy.testing.assert_array_equal(sorted(leaving), [0, 3, 4])
+        self.assertEqual(len(entering), 0)
+        numpy.testing.assert_array_equal(self.cross_filter.included,
+                                         [False, True, True, False, False])
+        self.assertEqual(self.cross_filter.last_dimension, 0)
+        self.assert_counts_match_mask()
+        # Only crystals entering or leaving the new range are moved.
+        entering, leaving = self.cross_filter.set_range(0, 35, 60)
+        numpy.testing.assert_array_equal(sorted(entering), [3, 4])
+        numpy.testing.assert_array_equal(sorted(leaving), [1, 2])
+        self.assert_counts_match_mask()
+
+    def test_several_ranges(self):
+        self.cross_filter.set_range(0, 15, 45)
+        self.cross_filter.set_range(3, 100, 130)
+        numpy.testing.assert_array_equal(self.cross_filter.included,
+                                         [False, False, True, True, False])
+        numpy.testing.assert_array_equal(
+            self.cross_filter.included_values(0), [30, 40])
+        numpy.testing.assert_array_equal(
+            self.cross_filter.centering_counts(), [1, 0, 0, 0, 1, 0, 0, 0])
+        self.assert_counts_match_mask()
+        # Clearing one range leaves the other one.
+        self.cross_filter.set_range(0, None, None)
+        numpy.testing.assert_array_equal(self.cross_filter.included,
+                                         [False, False, True, True, False])
+        self.assertEqual(self.cross_filter.ranges[0], (None, None))
+        self.assert_counts_match_mask()
+
+    def test_same_as_selection_mask(self):
+        ranges = [(None, None)] * 6
+        for dimension, left, right in [(1, 5, 45), (3, 80, 100), (1, 25, 55),
+                                       (3, None, None), (2, 10, 10)]:
+            self.cross_filter.set_range(dimension, left, right)
+            ranges[dimension] = (left, right)
+            numpy.testing.assert_array_equal(
+                self.cross_filter.included,
+                self.table.selection_mask(ranges))
+        self.assert_counts_match_mask()
+
+    def test_moments(self):
+        self.cross_filter.set_range(0, 15, 45)
+        self.cross_filter.set_range(3, 80, 100)
+        self.cross_filter.set_range(0, 5, 35)
+        # Crystals 10 and 20, the one with unknown centering is not used.
+        self.cross_filter.set_range(0, 5, 55)
+        mean, std = self.cross_filter.moments(1)
+        self.assertAlmostEqual(mean, 15)
+        self.assertAlmostEqual(std, 5)
+        self.cross_filter.set_range(0, 100, 200)
+        self.assertTrue(numpy.isnan(self.cross_filter.moments(0)[0]))
+
+    def test_version(self):
+        version = self.cross_filter.version
+        self.cross_filter.set_range(0, 15, 35)
+        self.assertGreater(self.cross_filter.version, version)
+        version = self.cross_filter.version
+        self.cross_filter.reset()
+        self.assertGreater(self.cross_filter.version, version)
+
+    def test_reset(self):
+        self.cross_filter.set_range(0, 15, 35)
+        self.cross_filter.reset()
+        self.assertEqual(self.cross_filter.included_count(), 5)
+        self.assertIsNone(self.cross_filter.last_dimension)
+        self.assertEqual(self.cross_filter.ranges, [(None, None)] * 6)
+        self.assert_counts_match_mask()
+
+    def test_pair_counts(self):
+        counts = self.cross_filter.pair_counts(0, 3, bins=4)
+        self.assertEqual(counts.shape, (4, 4))
+        self.assertEqual(counts.sum(), 5)
+        # The same view is kept up to date.
+        self.cross_filter.set_range(0, 15, 35)
+        self.cross_filter.set_range(3, 100, 130)
+        self.assertIs(self.cross_filter.pair_counts(0, 3, bins=4), counts)
+        included = self.cross_filter.included
+        expected, _, _ = numpy.histogram2d(
+            self.table.parameters[included, 0],
+            self.table.parameters[included, 3],
+            bins=4, range=[(10, 50), (90, 120)])
+        numpy.testing.assert_array_equal(counts, expected)
+        self.cross_filter.reset()
+        self.assertEqual(counts.sum(), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import numpy
+import unittest
+from unittest.mock import Mock
+
+import CrystFEL_Jupyter_utilities.density as density
+
+
+class TestDensityPanel(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_ax = Mock()
+        self.counts = numpy.zeros((4, 4), dtype=numpy.int64)
+        self.counts[1, 2] = 3
+        self.panel = density.DensityPanel(
+            self.mock_ax, 'a', 'b', self.counts,
+            numpy.linspace(0, 4, 5), numpy.linspace(10, 14, 5))
+
+    def test_init(self):
+        self.mock_ax.imshow.assert_called_once()
+        args, kwargs = self.mock_ax.imshow.call_args
+        self.assertEqual(kwargs['extent'], (0, 4, 10, 14))
+        self.assertEqual(kwargs['origin'], 'lower')
+        # y along the rows of the image.
+        self.assertAlmostEqual(args[0][2, 1], numpy.log1p(3))
+        self.mock_ax.set_xlabel.assert_called_with('a')
+        self.mock_ax.set_ylabel.assert_called_with('b')
+
+    def test_update(self):
+        self.counts[0, 0] = 10
+        self.panel.update()
+        data = self.panel.image.set_data.call_args[0][0]
+        self.assertAlmostEqual(data[0, 0], numpy.log1p(10))
+        self.panel.image.set_clim.assert_called_with(0, numpy.log1p(10))
+        self.counts[:] = 0
+        self.panel.update()
+        self.panel.image.set_clim.assert_called_with(0, 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
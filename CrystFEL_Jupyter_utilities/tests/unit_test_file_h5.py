@@ -1,5 +1,6 @@
 import h5py
 import numpy
+import os
 import unittest
 import tempfile
 
@@ -90,5 +91,52 @@ class TestH5(unittest.TestCase):
         numpy.testing.assert_array_equal(data1["Peaks"], data_test["Peaks"])
 
 
+class TestDatasetPaths(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'image.h5')
+        with h5py.File(self.path, 'w') as h5file:
+            h5file['/entry/data/image'] = numpy.arange(12).reshape(3, 4)
+            h5file['/entry/peaks'] = numpy.ones((2, 4))
+            h5file['/processing/hitfinder/peakinfo-assembled'] = \
+                numpy.zeros((1, 4))
+        self.geomfile = os.path.join(self.directory.name, 'test.geom')
+        with open(self.geomfile, 'w') as file:
+            file.write("; data = /commented\nclen = 0.1\n"
+                       "peak_list = /entry/peaks ; comment\n\n"
+                       "p0/min_fs = 0\np0/data = /entry/data/image\n"
+                       "p1/data = /entry/data/other\n")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_geometry_paths(self):
+        self.assertEqual(data.geometry_paths(self.geomfile),
+                         {'data': '/entry/data/image',
+                          'peaks': '/entry/peaks'})
+
+    def test_direct_paths(self):
+        data_test = data.get_diction_data(self.path, '/entry/data/image',
+                                          '/entry/peaks')
+        numpy.testing.assert_array_equal(data_test["Panels"],
+                                         numpy.arange(12).reshape(3, 4))
+        numpy.testing.assert_array_equal(data_test["Peaks"],
+                                         numpy.ones((2, 4)))
+        with self.assertLogs(data.LOGGER, 'WARNING'):
+            data_test = data.get_diction_data(self.path, '/entry/data/image',
+                                              '/missing')
+        self.assertIsNone(data_test["Peaks"])
+
+    def test_search(self):
+        with self.assertRaises(SystemExit), \
+                self.assertLogs(data.LOGGER, 'CRITICAL'):
+            data.get_diction_data(self.path)
+        data_test = data.get_diction_data(self.path, search=True)
+        numpy.testing.assert_array_equal(data_test["Panels"],
+                                         numpy.arange(12).reshape(3, 4))
+        numpy.testing.assert_array_equal(data_test["Peaks"],
+                                         numpy.zeros((1, 4)))
+
+
 if __name__ == '__main__':
     unittest.main()
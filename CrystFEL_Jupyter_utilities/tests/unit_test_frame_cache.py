@@ -0,0 +1,94 @@
+import numpy
+import os
+import tempfile
+import unittest
+
+import CrystFEL_Jupyter_utilities.frame_cache as frame_cache
+
+
+class Panel:
+    def __init__(self, array):
+        self.array = array
+
+
+class TestFrameCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.geomfile = os.path.join(self.directory.name, 'test.geom')
+        with open(self.geomfile, 'w') as file:
+            file.write("clen = 0.1\n")
+        self.h5file = os.path.join(self.directory.name, 'image.h5')
+        open(self.h5file, 'w').close()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def frame(self, value):
+        return {'matrix': numpy.full((10, 10), value, dtype=numpy.float64),
+                'peaks': None, 'detectors': None, 'events': 1}
+
+    def test_lru_bytes(self):
+        cache = frame_cache.FrameCache(max_bytes=2000)
+        cache.put('a', self.frame(1))
+        cache.put('b', self.frame(2))
+        self.assertEqual(cache.nbytes, 1600)
+        self.assertEqual(cache.get('a')['matrix'][0, 0], 1)
+        cache.put('c', self.frame(3))
+        self.assertEqual(list(cache.frames), ['a', 'c'])
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        # Larger than the bound, not kept.
+        big = {'matrix': numpy.zeros((30, 30))}
+        self.assertIs(cache.put('d', big), big)
+        self.assertNotIn('d', cache)
+        cache.put('a', self.frame(4))
+        self.assertEqual(cache.nbytes, 1600)
+        cache.clear()
+        self.assertEqual((len(cache), cache.nbytes), (0, 0))
+
+    def test_compact(self):
+        cache = frame_cache.FrameCache(compact='uint16')
+        frame = self.frame(-3.)
+        frame['matrix'][0, :2] = [70000.0, 2.6]
+        kept = cache.put('a', frame)
+        self.assertEqual(kept['matrix'].dtype, numpy.uint16)
+        self.assertEqual(list(kept['matrix'][0, :3]), [65535, 3, 0])
+        self.assertEqual(cache.nbytes, 200)
+        cache = frame_cache.FrameCache(compact='float32')
+        self.assertEqual(cache.put('a', frame)['matrix'].dtype,
+                         numpy.float32)
+        with self.assertRaises(ValueError):
+            frame_cache.FrameCache(compact='int8')
+
+    def test_nbytes(self):
+        data = numpy.zeros((4, 8))
+        frame = {'matrix': data[::-1], 'peaks': {'position': data[:, :2]},
+                 'detectors': {'p0': Panel(numpy.zeros(5))}}
+        self.assertEqual(frame_cache.frame_nbytes(frame), 256 + 40)
+
+    def test_frame_key(self):
+        key = frame_cache.frame_key(self.h5file, '/data/data', 1,
+                                    self.geomfile)
+        self.assertEqual(key, frame_cache.frame_key(
+            self.h5file, '/data/data', 1, self.geomfile))
+        self.assertNotEqual(key, frame_cache.frame_key(
+            self.h5file, '/data/data', 2, self.geomfile))
+        # The peaks of the frame are read from the peaks dataset.
+        self.assertNotEqual(key, frame_cache.frame_key(
+            self.h5file, '/data/data', 1, self.geomfile,
+            peaks_path='/processing/peaks'))
+        self.assertNotEqual(key, frame_cache.frame_key(
+            self.h5file, '/data/data', 1, self.geomfile, search=True))
+        with open(self.geomfile, 'a') as file:
+            file.write("res = 5000\n")
+        os.utime(self.geomfile, ns=(10**9, 10**9))
+        self.assertNotEqual(key, frame_cache.frame_key(
+            self.h5file, '/data/data', 1, self.geomfile))
+        self.assertIsNone(frame_cache.frame_key(self.h5file, None, None)[3])
+        self.assertEqual(
+            frame_cache.frame_key([self.h5file, self.geomfile], None, 0),
+            frame_cache.frame_key([self.geomfile, self.h5file], None, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import h5py
+import numpy
+import os
+import tempfile
+import unittest
+
+import CrystFEL_Jupyter_utilities.h5pool as h5pool
+
+
+class TestFilePool(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.files = []
+        for index in range(3):
+            filename = os.path.join(self.directory.name,
+                                    'run_{}.h5'.format(index))
+            with h5py.File(filename, 'w') as h5file:
+                h5file['/data/data'] = numpy.full((2, 3), index)
+            self.files.append(filename)
+        self.pool = h5pool.FilePool(size=2, rdcc_nbytes=2**20)
+
+    def tearDown(self):
+        self.pool.close()
+        self.directory.cleanup()
+
+    def test_lru(self):
+        first = self.pool.open(self.files[0])
+        self.assertIs(self.pool.open(self.files[0]), first)
+        self.assertEqual((self.pool.hits, self.pool.misses), (1, 1))
+        self.pool.open(self.files[1])
+        # The first file was used more recently than the second one.
+        self.pool.open(self.files[0])
+        self.pool.open(self.files[2])
+        self.assertEqual(len(self.pool), 2)
+        self.assertIn(self.files[0], self.pool)
+        self.assertNotIn(self.files[1], self.pool)
+        self.assertEqual(self.pool.open(self.files[2])['/data/data'][0, 0],
+                         2)
+        self.pool.configure(size=1)
+        self.assertEqual(len(self.pool), 1)
+        self.assertFalse(first.id.valid)
+
+    def test_reopen(self):
+        first = self.pool.open(self.files[0])
+        first.close()
+        second = self.pool.open(self.files[0])
+        self.assertTrue(second.id.valid)
+        self.pool.close(self.files[0])
+        self.assertEqual(len(self.pool), 0)
+        with h5py.File(self.files[0], 'w') as h5file:
+            h5file['/data/data'] = numpy.full((2, 3), 7)
+        os.utime(self.files[0], ns=(0, 0))
+        self.assertEqual(self.pool.open(self.files[0])['/data/data'][0, 0],
+                         7)
+        # The file changed while it was open.
+        os.utime(self.files[0], ns=(10**9, 10**9))
+        self.assertIsNot(self.pool.open(self.files[0]), second)
+        self.assertEqual(self.pool.misses, 4)
+        with self.assertRaises(OSError):
+            self.pool.open(os.path.join(self.directory.name, 'missing.h5'))
+
+
+if __name__ == '__main__':
+    unittest.main()
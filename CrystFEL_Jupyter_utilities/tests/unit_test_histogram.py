@@ -42,18 +42,47 @@ class TestHistogram(unittest.TestCase):
         self.fig.reset_mock()
 
     def test_hist(self):
-        assert self.mock_ax.hist.called
-        self.mock_ax.hist.assert_called_with(
-            alpha=0.9, bins=10, density=1,
-            color=['gray', 'cyan', 'darkblue', 'royalblue', 'lime',
-                   'magenta', 'firebrick', 'olive', 'lightgray'],
-            histtype='stepfilled', range=(1, 10),
-            stacked=True, x=[[1, 2, 3, 4, 5, 10], [1, 1, 1, 1],
-                             [2, 2, 3, 4, 4, 4], [], [6, 6, 5, 4, 5, 3],
-                             [], [], [], []])
-        self.assertEqual(self.patch, self.hist.patches)
+        self.assertEqual(self.mock_ax.add_patch.call_count, 9)
+        self.assertEqual(len(self.hist.patches), 9)
+        self.assertEqual(self.hist.counts.shape, (9, 10))
+        numpy.testing.assert_array_equal(
+            self.hist.counts[0],
+            numpy.histogram([1, 2, 3, 4, 5, 10], bins=10, range=(1, 10))[0])
+        numpy.testing.assert_array_equal(self.hist.counts[3],
+                                         numpy.zeros(10))
+        self.assertEqual((self.hist.min, self.hist.max), (1, 10))
+        # The top of the stack is normalized as density,
+        # 10 bins have 409 or 410 fine bins, the highest one has 409.
+        top = self.hist.patches[-1].get_xy()
+        width = 409 / histogram.FINE_BINS * 9
+        self.assertAlmostEqual(top[:, 1].max(), 5 / (22 * width))
         assert self.mock_ax.get_xlim.called
 
+    def test_rebin(self):
+        fine_counts = self.hist.fine_counts
+        self.assertEqual(fine_counts.shape, (9, histogram.FINE_BINS))
+        self.hist.bins = 16
+        self.hist.update()
+        self.assertIs(self.hist.fine_counts, fine_counts)
+        numpy.testing.assert_array_equal(
+            self.hist.counts[2],
+            numpy.histogram([2, 2, 3, 4, 4, 4], bins=16, range=(1, 10))[0])
+        self.assertEqual(len(self.hist.bin_edges()), 17)
+
+    def test_range_counts(self):
+        counts = self.hist.range_counts(1.5, 4.5)
+        self.assertEqual(counts[0], 3)
+        self.assertEqual(counts[1], 0)
+        self.assertEqual(counts[2], 6)
+        self.assertEqual(counts[4], 2)
+        self.assertEqual(counts.sum(), 11)
+
+    def test_update_colors(self):
+        self.hist.list_colors = dict(self.dict_color, P='lightgrey')
+        self.hist.update_colors()
+        self.assertEqual(self.hist.patches[0].get_facecolor(),
+                         matplotlib.colors.to_rgba('lightgrey', 0.9))
+
     def test_bool_crystal_exluded_green_space(self):
         self.assertEqual(self.hist.bool_crystal_exluded_green_space(1111),
                          False)
@@ -72,6 +101,11 @@ class TestHistogram(unittest.TestCase):
         assert self.mock_ax.axvspan.called
         self.mock_ax.axvspan.assert_called_with(1, 3, facecolor='#2ca02c',
                                                 alpha=0.5)
+        green_space = self.hist.green_space
+        self.hist.range_green_space = None, None
+        self.hist.draw_green_space()
+        assert green_space.remove.called
+        self.assertIsNone(self.hist.green_space)
 
     def test_set_was_clicked_before(self):
         self.assertEqual(self.hist.was_clicked_before, False)
@@ -94,6 +128,7 @@ class TestHistogram(unittest.TestCase):
 
     def test_update(self):
         self.mock_ax.reset_mock()
+        patches = list(self.hist.patches)
         self.data = {'P': [2, 3, 4, 5], 'A': [3, 4, 5, 6, 6]}
         self.data_excluded = [1, 1, 2, 3, 2]
         self.hist.update(self.data, self.data_excluded)
@@ -101,13 +136,62 @@ class TestHistogram(unittest.TestCase):
         self.assertListEqual(self.hist.list_data[1], [3, 4, 5, 6, 6])
         self.assertListEqual(self.hist.list_data[-2], [])
         self.assertListEqual(self.hist.data_excluded, [1, 1, 2, 3, 2])
-        assert self.mock_ax.clear.called
-        assert self.mock_ax.set_title.called
-        self.mock_ax.set_title.assert_called_with("Histogram of " +
-                                                  self.hist.name)
-        assert self.mock_ax.set_xlabel.called
-        self.mock_ax.set_xlabel.assert_called_with(self.xlabel)
-        assert self.mock_ax.hist.called
+        numpy.testing.assert_array_equal(
+            self.hist.counts[-1],
+            numpy.histogram([1, 1, 2, 3, 2], bins=10, range=(1, 10))[0])
+        # The same polygons with new vertices, the subplot is not cleared.
+        self.assertListEqual(self.hist.patches, patches)
+        self.assertFalse(self.mock_ax.clear.called)
+        self.assertFalse(self.mock_ax.hist.called)
+        self.mock_ax.set_xlim.assert_called_with('current_xlim')
+
+    def test_draw_fit(self):
+        self.mock_ax.get_xlim.return_value = (0, 10)
+        self.hist.update_current_xlim()
+        self.mock_ax.plot.return_value = [Mock()]
+        self.mock_ax.get_ylim.return_value = (0, 4)
+        self.hist.draw_fit(5, 2)
+        x, y = self.mock_ax.plot.call_args[0]
+        self.assertEqual(len(x), 80)
+        numpy.testing.assert_array_almost_equal(
+            y, numpy.exp(-0.5 * ((x - 5) / 2)**2) / (2 * numpy.sqrt(2 *
+                                                                  numpy.pi)))
+        self.mock_ax.text.assert_called_with(
+            x=0, y=3.0, s=r"$\mu = 5\ \sigma = 2$", fontsize=10)
+        # The second fit changes the same artists.
+        self.mock_ax.reset_mock()
+        self.hist.draw_fit(4, 1)
+        assert not self.mock_ax.plot.called
+        assert not self.mock_ax.text.called
+        self.hist.fit_line.set_data.assert_called()
+        self.hist.fit_text.set_text.assert_called_with(
+            r"$\mu = 4\ \sigma = 1$")
+
+    def test_update_clear_fit(self):
+        self.mock_ax.get_xlim.return_value = (0, 10)
+        self.hist.update_current_xlim()
+        self.mock_ax.plot.return_value = [Mock()]
+        self.hist.draw_fit(5, 2)
+        self.hist.update()
+        self.hist.fit_line.set_visible.assert_called_with(False)
+        self.hist.fit_text.set_visible.assert_called_with(False)
+        assert not self.hist.fit_line.remove.called
+
+    def test_shared_fine_counts(self):
+        fine_counts = numpy.zeros((9, histogram.FINE_BINS), dtype=int)
+        hist = histogram.Histogram(axs=self.mock_ax, xlabel=self.xlabel,
+                                   data_to_histogram=None,
+                                   colors=self.dict_color, bins=4,
+                                   name=self.title, fine_counts=fine_counts,
+                                   value_range=(0, 8))
+        self.assertIsNone(hist.data_included)
+        self.assertEqual((hist.min, hist.max), (0, 8))
+        # Counts changed in place by the owner are shown after update.
+        fine_counts[2, 0] = 3
+        fine_counts[8, -1] = 1
+        hist.update()
+        numpy.testing.assert_array_equal(hist.counts[2], [3, 0, 0, 0])
+        numpy.testing.assert_array_equal(hist.counts[8], [0, 0, 0, 1])
 
     def test_set_color(self):
         self.dict_color = {'P': 'magenta', 'A': 'magenta', 'B': 'magenta',
@@ -0,0 +1,54 @@
+import subprocess
+import sys
+import unittest
+
+import CrystFEL_Jupyter_utilities
+
+# Modules which batch jobs import.
+BATCH_MODULES = ['stream_read', 'stream_tables', 'stream_stats',
+                 'cell_engine', 'cell_batch', 'synthetic', 'run_reader',
+                 'powder']
+# Heavy modules of the graphical interface.
+HEAVY_MODULES = ['matplotlib', 'scipy', 'cfelpyutils']
+
+
+def imported_modules(statement):
+    """Returns the top-level modules imported by the statement
+    in a new interpreter, without those imported at its start.
+    """
+    code = ("import sys\n{}\n"
+            "print(' '.join(sorted({{name.split('.')[0] "
+            "for name in sys.modules}})))".format(statement))
+    output = subprocess.run([sys.executable, '-c', code], check=True,
+                            stdout=subprocess.PIPE,
+                            universal_newlines=True).stdout
+    modules = set(output.split())
+    if statement:
+        modules -= imported_modules('')
+    return modules
+
+
+class TestImport(unittest.TestCase):
+
+    def test_batch_modules(self):
+        statement = "\n".join("import CrystFEL_Jupyter_utilities." + name
+                              for name in BATCH_MODULES)
+        modules = imported_modules(statement)
+        for name in HEAVY_MODULES:
+            self.assertNotIn(name, modules)
+
+    def test_lazy_attributes(self):
+        modules = imported_modules("import CrystFEL_Jupyter_utilities")
+        self.assertNotIn('numpy', modules)
+        modules = imported_modules(
+            "from CrystFEL_Jupyter_utilities import CellEngine")
+        self.assertNotIn('matplotlib', modules)
+        self.assertIn('CellEngine', dir(CrystFEL_Jupyter_utilities))
+        from CrystFEL_Jupyter_utilities.cell_engine import CellEngine
+        self.assertIs(CrystFEL_Jupyter_utilities.CellEngine, CellEngine)
+        with self.assertRaises(AttributeError):
+            CrystFEL_Jupyter_utilities.Missing
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -103,6 +103,57 @@ class TestPanel(unittest.TestCase):
         self.assertListEqual([1, 2, 3], panels['q0a0'].peaks_search)
         self.assertListEqual([3, 3, 3], panels['q1a1'].peaks_reflection)
 
+    def test_assembled_position(self):
+        directions = [(1, 0, 0, 1), (-1, 0, 0, -1), (0, -1, 1, 0),
+                      (0, 1, -1, 0)]
+        for xfs, yfs, xss, yss in directions:
+            detector = panel.Detector(self.size_image, 'q0a0', 10, 20, 203,
+                                      204, xfs, yfs, xss, yss, 450.5, -26.1,
+                                      self.Raw_data)
+            detector.peaks_search = [{'fs_px': 10.0, 'ss_px': 20.0},
+                                     {'fs_px': 42.5, 'ss_px': 100.25}]
+            detector.type_rotation(3, -4)
+            posx, posy = detector.assembled_position([10.0, 42.5],
+                                                     [20.0, 100.25])
+            self.assertListEqual(list(zip(posx, posy)),
+                                 [peak['position']
+                                  for peak in detector.peaks_search])
+
+    def test_assembled_positions(self):
+        names = numpy.array(['q1a1', 'q0a0', 'q1a1', 'unknown'])
+        posx, posy = panel.assembled_positions(
+            self.geom, names, [200.0, 5.0, 300.0, 1.0],
+            [190.0, 6.0, 200.0, 1.0])
+        columns, rows, center_x, center_y = panel.image_size(self.geom)
+        panels = panel.get_detectors(self.Raw_data, (columns, rows),
+                                     self.geom, {}, {})
+        for name in ['q0a0', 'q1a1']:
+            panels[name].type_rotation(center_x, center_y)
+        self.assertEqual((posx[1], posy[1]),
+                         panels['q0a0'].assembled_position(5.0, 6.0))
+        self.assertEqual((posx[2], posy[2]),
+                         panels['q1a1'].assembled_position(300.0, 200.0))
+        self.assertTrue(numpy.isnan(posx[3]) and numpy.isnan(posy[3]))
+
+    def test_assemble(self):
+        # Two panels of 3x6 pixels above and below the beam.
+        geom = {"panels": {name: {"cnx": -3, "cny": cny, "min_fs": 0,
+                                  "max_fs": 5, "min_ss": min_ss,
+                                  "max_ss": min_ss + 2, "xfs": 1, "xss": 0,
+                                  "yfs": 0, "yss": 1}
+                           for name, cny, min_ss in [('a', 0, 0),
+                                                     ('b', -3, 3)]},
+                "bad": {"corner": {"min_x": -3, "max_x": -2, "min_y": 2,
+                                   "max_y": 3}}}
+        raw_data = numpy.arange(1, 37).reshape(6, 6)
+        self.assertTupleEqual(panel.image_size(geom), (6, 6, 0, 0))
+        matrix = panel.assemble(raw_data, geom)
+        # Slow scan goes up, the first row of the image is the top.
+        numpy.testing.assert_array_equal(matrix[1:3], raw_data[1::-1])
+        numpy.testing.assert_array_equal(matrix[3:], raw_data[:2:-1])
+        # The bad region in the top left corner.
+        numpy.testing.assert_array_equal(matrix[0], [0] + list(range(14, 19)))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -23,6 +23,18 @@ class TestPeak(unittest.TestCase):
                          -18.792268753051758+self.size_image[0]/2.0)
         self.assertEqual(test_list[2].intensive, 659.25634765625)
 
+    def test_peaks_array(self):
+        peaks = peak_h5.get_peaks_array(self.array, self.size_image)
+        numpy.testing.assert_allclose(
+            peaks['position'],
+            [peak.get_position() for peak in
+             peak_h5.get_list_peaks(self.array, self.size_image)])
+        numpy.testing.assert_array_equal(peaks['intensity'], self.array[:, 2])
+        numpy.testing.assert_array_equal(peaks['offset'], [3., 4., 3.])
+        with self.assertLogs(peak_h5.LOGGER, 'WARNING'):
+            self.assertIsNone(peak_h5.get_peaks_array(numpy.copy(None),
+                                                      self.size_image))
+
 
 if __name__ == '__main__':
     unittest.main()
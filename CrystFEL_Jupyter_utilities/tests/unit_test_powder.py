@@ -0,0 +1,123 @@
+import h5py
+import numpy
+import os
+import tempfile
+import unittest
+
+from cfelpyutils.crystfel_utils import load_crystfel_geometry
+
+from CrystFEL_Jupyter_utilities.h5pool import POOL
+from CrystFEL_Jupyter_utilities.stream_tables import chunk_tables, iter_chunks
+import CrystFEL_Jupyter_utilities.powder as powder
+import CrystFEL_Jupyter_utilities.synthetic as synthetic
+
+
+class TestFrameAccumulator(unittest.TestCase):
+
+    def test_reductions(self):
+        frames = numpy.arange(24, dtype=numpy.float32).reshape(4, 2, 3)
+        for reduction, expected in [('sum', frames.sum(axis=0)),
+                                    ('max', frames.max(axis=0)),
+                                    ('mean', frames.mean(axis=0))]:
+            accumulator = powder.FrameAccumulator(reduction)
+            other = powder.FrameAccumulator(reduction)
+            accumulator.add(frames[:1])
+            other.add(frames[1:])
+            accumulator.merge(other)
+            self.assertEqual(accumulator.frames, 4)
+            numpy.testing.assert_allclose(accumulator.result(), expected)
+        # Modules are stacked along slow scan.
+        accumulator = powder.FrameAccumulator()
+        accumulator.add(frames.reshape(2, 2, 2, 3))
+        self.assertEqual(accumulator.result().shape, (4, 3))
+        with self.assertRaises(ValueError):
+            accumulator.add(frames)
+        with self.assertRaises(ValueError):
+            powder.FrameAccumulator('median')
+        self.assertIsNone(powder.FrameAccumulator().result())
+
+
+class TestPowder(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.spec = synthetic.size_spec(
+            'small', chunks=12, images=2, events=6, modules=1, fs_size=16,
+            ss_size=8)
+        self.files = synthetic.generate(self.directory.name, self.spec)
+
+    def tearDown(self):
+        POOL.close()
+        self.directory.cleanup()
+
+    def frames(self):
+        """Returns all frames of the images."""
+        frames = []
+        for filename in self.files['images']:
+            with h5py.File(filename, 'r') as h5file:
+                frames.append(h5file['/data/data'][()])
+        return numpy.concatenate(frames)
+
+    def test_run_powder(self):
+        frames = self.frames()
+        for processes in [1, 2]:
+            accumulator = powder.run_powder(self.files['images'],
+                                            reduction='max',
+                                            processes=processes, slab=4)
+            self.assertEqual(accumulator.frames, 12)
+            numpy.testing.assert_array_equal(accumulator.result(),
+                                             frames.max(axis=0))
+
+    def test_stream_powder(self):
+        hits = chunk_tables(iter_chunks(self.files['stream']))[
+            'frames']['hit'] == 1
+        expected = self.frames()[hits].sum(axis=0, dtype=numpy.float64)
+        accumulator = powder.stream_powder(self.files['stream'], processes=1,
+                                           parts=2, slab=2)
+        self.assertEqual(accumulator.frames, hits.sum())
+        numpy.testing.assert_allclose(accumulator.result(), expected)
+        frames = powder.stream_frames(self.files['stream'], hits_only=False)
+        self.assertEqual(frames[self.files['images'][1]], list(range(6)))
+        with self.assertRaises(ValueError):
+            powder.stream_powder(self.files['stream'], '/det/{module}/data')
+        with self.assertRaises(SystemExit):
+            powder.main(['-s', self.files['stream'], '-d', '/{module}/data'])
+
+    def test_write_powder(self):
+        accumulator = powder.run_powder(self.files['images'],
+                                        reduction='mean', processes=1)
+        geom = load_crystfel_geometry(self.files['geometry'])
+        filename = os.path.join(self.directory.name, 'powder.h5')
+        powder.write_powder(filename, accumulator, geom)
+        with h5py.File(filename, 'r') as h5file:
+            numpy.testing.assert_allclose(h5file['/data/data'][()],
+                                          accumulator.result(), rtol=1e-6)
+            self.assertEqual(h5file['/data/data'].attrs['frames'], 12)
+            self.assertEqual(h5file[powder.ASSEMBLED_PATH].attrs['reduction'],
+                             'mean')
+            self.assertEqual(h5file[powder.ASSEMBLED_PATH].ndim, 2)
+        with self.assertRaises(ValueError):
+            powder.write_powder(filename, powder.FrameAccumulator())
+
+    def test_peak_powder(self):
+        geom = load_crystfel_geometry(self.files['geometry'])
+        tables = chunk_tables(iter_chunks(self.files['stream']))
+        histograms = powder.peak_powder(self.files['stream'], geom,
+                                        reflections=True, block_size=5)
+        image = powder.assemble(numpy.zeros(self.frames().shape[1:]), geom)
+        self.assertEqual(histograms['peaks'].shape, image.shape)
+        # The peaks are on the panels.
+        self.assertEqual(histograms['peaks'].sum(),
+                         len(tables['peaks']['fs_px']))
+        self.assertEqual(histograms['peaks'][image == 1].sum(), 0)
+        filename = os.path.join(self.directory.name, 'peaks.h5')
+        powder.write_peak_powder(filename, histograms)
+        with h5py.File(filename, 'r') as h5file:
+            numpy.testing.assert_array_equal(
+                h5file[powder.PEAK_POWDER_PATHS['peaks']][()],
+                histograms['peaks'])
+            self.assertIn(powder.PEAK_POWDER_PATHS['reflections'], h5file)
+
+
+if __name__ == '__main__':
+    unittest.main()
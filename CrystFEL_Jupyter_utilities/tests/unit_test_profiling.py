@@ -0,0 +1,96 @@
+import json
+import os
+import tempfile
+import unittest
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+import CrystFEL_Jupyter_utilities.profiling as profiling
+
+
+class TestProfiling(unittest.TestCase):
+
+    def setUp(self):
+        self.profiler = profiling.Profiler()
+
+    def tearDown(self):
+        profiling.PROFILER.disable()
+        profiling.PROFILER.reset()
+
+    def test_disabled(self):
+        with self.profiler.phase('parse') as timing:
+            timing.records = 10
+        self.assertEqual(self.profiler.totals, {})
+        self.assertEqual(self.profiler.report()['phases'], {})
+
+    def test_nested(self):
+        self.profiler.enable()
+        with self.profiler.phase('assembly', records=2, nbytes=8):
+            with self.profiler.phase('hdf5_read', nbytes=100):
+                pass
+            with self.profiler.phase('hdf5_read', nbytes=50):
+                pass
+        with self.profiler.phase('hdf5_read') as timing:
+            timing.records = 3
+        self.assertEqual(self.profiler.stack, [])
+        self.assertEqual(self.profiler.totals[('assembly',)][::2], [1, 2])
+        self.assertEqual(
+            self.profiler.totals[('assembly', 'hdf5_read')][::3], [2, 150])
+        report = self.profiler.report()
+        self.assertEqual(report['phases']['hdf5_read']['calls'], 3)
+        self.assertEqual(report['phases']['hdf5_read']['records'], 3)
+        self.assertEqual(report['phases']['hdf5_read']['bytes'], 150)
+        self.assertEqual(report['phases']['assembly']['records'], 2)
+        stacks = {stack['stack']: stack for stack in report['stacks']}
+        self.assertEqual(set(stacks),
+                         {'assembly', 'assembly;hdf5_read', 'hdf5_read'})
+        self.assertLessEqual(stacks['assembly']['self_seconds'],
+                             stacks['assembly']['seconds'])
+        folded = self.profiler.folded()
+        self.assertEqual([line.split(' ')[0] for line in folded],
+                         ['assembly', 'assembly;hdf5_read', 'hdf5_read'])
+
+    def test_timed(self):
+        @profiling.timed('parse', lambda result, items: (len(result), 7))
+        def parse(items):
+            return list(items)
+
+        self.assertEqual(parse('abc'), ['a', 'b', 'c'])
+        self.assertEqual(profiling.PROFILER.totals, {})
+        profiling.enable()
+        self.assertEqual(parse('abcd'), ['a', 'b', 'c', 'd'])
+        self.assertEqual(profiling.PROFILER.totals[('parse',)][::2], [1, 4])
+        self.assertEqual(profiling.PROFILER.totals[('parse',)][3], 7)
+
+    def test_write_report(self):
+        self.profiler.enable()
+        with self.profiler.phase('parse', records=5):
+            pass
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'profile.json')
+            self.profiler.write_report(filename)
+            with open(filename) as file:
+                report = json.load(file)
+            self.assertEqual(report['phases']['parse']['records'], 5)
+            filename = os.path.join(directory, 'profile.folded')
+            self.profiler.write_report(filename)
+            with open(filename) as file:
+                self.assertTrue(file.read().startswith('parse '))
+
+    def test_instrument_figure(self):
+        fig = plt.figure()
+        profiling.instrument_figure(fig)
+        fig.canvas.draw()
+        self.assertEqual(profiling.PROFILER.totals, {})
+        profiling.enable()
+        profiling.instrument_figure(fig)
+        profiling.instrument_figure(fig)
+        fig.canvas.draw()
+        self.assertEqual(profiling.PROFILER.totals[('canvas_draw',)][0], 1)
+        plt.close(fig)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import numpy
+import unittest
+
+import CrystFEL_Jupyter_utilities.reduction as reduction
+import CrystFEL_Jupyter_utilities.stream_read as stream_read
+
+
+def reciprocal(vectors):
+    """Reciprocal vectors in nm^-1 of the direct ones in Angstroms."""
+    return numpy.swapaxes(numpy.linalg.inv(numpy.asarray(vectors) / 10),
+                          1, 2)
+
+
+class TestReduction(unittest.TestCase):
+
+    def setUp(self):
+        self.triclinic = numpy.array([[50.0, 0, 0], [10, 60, 0], [5, 8, 70]])
+        # beta = 104 deg, unique axis b.
+        self.monoclinic = numpy.array([[40.0, 0, 0], [0, 50, 0],
+                                       [-15, 0, 60]])
+        self.orthorhombic = numpy.diag([70.0, 50, 60])
+
+    def test_cell_parameters(self):
+        rng = numpy.random.default_rng(0)
+        astars = numpy.eye(3) * 0.1 + rng.normal(0, 0.02, (4, 3, 3))
+        parameters = reduction.cell_parameters(
+            reduction.direct_vectors(astars))
+        for astar, expected in zip(astars, parameters):
+            numpy.testing.assert_array_almost_equal(
+                stream_read.cell_parameters(*astar), expected)
+
+    def test_buerger_reduce(self):
+        transforms = numpy.array([numpy.eye(3),
+                                  [[1, 1, 0], [0, 1, 0], [0, 0, 1]],
+                                  [[0, 1, 0], [0, 0, 1], [1, 0, 0]],
+                                  [[1, 0, 0], [2, 1, -1], [-1, 0, 1]],
+                                  [[-1, 0, 0], [0, -1, 0], [3, 2, 1]]])
+        reduced = reduction.buerger_reduce(transforms @ self.triclinic)
+        parameters = reduction.cell_parameters(reduced)
+        numpy.testing.assert_array_almost_equal(
+            parameters - parameters[0], numpy.zeros((5, 6)))
+        # a <= b <= c and the angles are all acute or all not acute.
+        self.assertTrue(numpy.all(numpy.diff(parameters[0, :3]) >= 0))
+        acute = parameters[0, 3:] < 90
+        self.assertTrue(acute.all() or not acute.any())
+        self.assertTrue(numpy.all(numpy.linalg.det(reduced) > 0))
+
+    def test_monoclinic(self):
+        # The same cell with unique axis c and A centering.
+        unique_c = numpy.roll(self.monoclinic, 1, axis=0)
+        parameters, centering, unique_axis = reduction.canonical_cells(
+            reciprocal([self.monoclinic, unique_c,
+                        self.monoclinic * [[1], [1], [-1]]]),
+            ['monoclinic'] * 3, ['C', 'A', 'C'], ['b', 'c', 'b'])
+        numpy.testing.assert_array_almost_equal(
+            parameters, numpy.tile(parameters[0], (3, 1)))
+        self.assertGreater(parameters[0, 4], 90)
+        numpy.testing.assert_array_equal(centering, ['C', 'C', 'C'])
+        numpy.testing.assert_array_equal(unique_axis, ['b', 'b', 'b'])
+
+    def test_orthorhombic(self):
+        parameters, centering, _ = reduction.canonical_cells(
+            reciprocal([self.orthorhombic, self.orthorhombic]),
+            ['orthorhombic'] * 2, ['P', 'A'], ['*', '*'])
+        numpy.testing.assert_array_almost_equal(parameters[0],
+                                                [50, 60, 70, 90, 90, 90])
+        # The A face (b, c) becomes the C face (a, b) with a <= b.
+        numpy.testing.assert_array_almost_equal(parameters[1],
+                                                [50, 60, 70, 90, 90, 90])
+        numpy.testing.assert_array_equal(centering, ['P', 'C'])
+
+    def test_other_lattices_kept(self):
+        parameters, centering, unique_axis = reduction.canonical_cells(
+            reciprocal([self.orthorhombic]), ['cubic'], ['F'], ['*'])
+        numpy.testing.assert_array_almost_equal(parameters[0],
+                                                [70, 50, 60, 90, 90, 90])
+        numpy.testing.assert_array_equal(centering, ['F'])
+
+
+if __name__ == '__main__':
+    unittest.main()
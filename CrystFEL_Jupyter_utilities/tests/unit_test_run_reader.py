@@ -0,0 +1,106 @@
+import h5py
+import numpy
+import os
+import tempfile
+import unittest
+
+from CrystFEL_Jupyter_utilities.data import get_diction_data
+from CrystFEL_Jupyter_utilities.h5pool import POOL, POOL_SIZE, configure
+import CrystFEL_Jupyter_utilities.run_reader as run_reader
+
+
+class TestRunReader(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        # 2 modules, each in sequence files of 3 and 2 frames of 4x5.
+        self.data = numpy.arange(5 * 2 * 4 * 5, dtype=numpy.float32).reshape(
+            5, 2, 4, 5)
+        self.files = []
+        for module in range(2):
+            for sequence, frames in enumerate([slice(0, 3), slice(3, 5)]):
+                filename = os.path.join(
+                    self.directory.name,
+                    'RAW-AGIPD{:02d}-S{:05d}.h5'.format(module, sequence))
+                with h5py.File(filename, 'w') as h5file:
+                    h5file['/data/data'] = self.data[frames, module]
+                self.files.append(filename)
+        self.run = run_reader.RunReader(self.files[::-1])
+
+    def tearDown(self):
+        POOL.close()
+        configure(size=POOL_SIZE)
+        self.directory.cleanup()
+
+    def test_shape(self):
+        self.assertEqual(self.run.shape, (5, 2, 4, 5))
+        self.assertEqual(len(self.run), 5)
+        self.assertEqual([section.module for section in self.run.sections],
+                         [0, 1])
+        self.assertEqual(list(self.run.sections[0].starts), [0, 3, 5])
+
+    def test_read(self):
+        numpy.testing.assert_array_equal(self.run.read(1, 5),
+                                         self.data[1:5])
+        numpy.testing.assert_array_equal(self.run[-1], self.data[4])
+        with self.assertRaises(IndexError):
+            self.run[5]
+        slabs = list(self.run.iter_slabs(size=2))
+        self.assertEqual([first for first, _ in slabs], [0, 2, 4])
+        numpy.testing.assert_array_equal(
+            numpy.concatenate([slab for _, slab in slabs]), self.data)
+
+    def test_frame(self):
+        frame = self.run.get_diction_data(3)
+        self.assertEqual(frame["Events"], 5)
+        numpy.testing.assert_array_equal(
+            frame["Panels"], self.data[3].reshape(8, 5))
+        filename, event = self.run.locate(3)
+        self.assertEqual(os.path.basename(filename),
+                         'RAW-AGIPD00-S00001.h5')
+        self.assertEqual(event, 0)
+
+    def test_write_virtual(self):
+        filename = os.path.join(self.directory.name, 'run.h5')
+        run_reader.main(self.files + ['-o', filename])
+        with h5py.File(filename, 'r') as h5file:
+            self.assertTrue(h5file['/data/data'].is_virtual)
+            numpy.testing.assert_array_equal(h5file['/data/data'][()],
+                                             self.data)
+        # The virtual dataset is read as 4-D image dataset.
+        numpy.testing.assert_array_equal(
+            get_diction_data(filename, event=2)["Panels"],
+            self.data[2].reshape(8, 5))
+
+    def test_pool_size(self):
+        # More modules than the files kept open by default.
+        files = []
+        for module in range(POOL_SIZE + 2):
+            filename = os.path.join(self.directory.name,
+                                    'RAW-AGIPD{:02d}-S00000.h5'.format(
+                                        module + 10))
+            with h5py.File(filename, 'w') as h5file:
+                h5file['/data/data'] = numpy.zeros((4, 2, 3))
+            files.append(filename)
+        POOL.close()
+        run = run_reader.RunReader(files)
+        self.assertGreaterEqual(POOL.size, len(files))
+        misses = POOL.misses
+        for event in range(4):
+            run.frame(event)
+        # The files opened for the index stay open for the frames.
+        self.assertEqual(POOL.misses, misses)
+
+    def test_module_path(self):
+        # The pool keeps the files open for reading.
+        POOL.close()
+        for module, filename in enumerate(self.files[::2]):
+            with h5py.File(filename, 'a') as h5file:
+                h5file['/det/{}/data'.format(module)] = numpy.zeros(
+                    (3, 4, 5))
+        run = run_reader.RunReader(self.files[::2], '/det/{module}/data')
+        self.assertEqual(run.shape, (3, 2, 4, 5))
+        self.assertEqual(run.read(0, 3).sum(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,10 @@
 import matplotlib.pyplot
+import numpy
 import unittest
 from unittest.mock import patch, Mock
 
+from CrystFEL_Jupyter_utilities.crossfilter import CrossFilter
+from CrystFEL_Jupyter_utilities.crystlib import CrystalsTable
 from CrystFEL_Jupyter_utilities.widget import Span
 
 
@@ -22,7 +25,7 @@ class TestSpan(unittest.TestCase):
                                    'beta': 120, 'gamma': 120,
                                    'lattice_type': "triclinic",
                                    'centering': "P", "unique_axis": "b"}]
-        self.crystals_excluded = []
+        self.cross_filter = CrossFilter(CrystalsTable(self.all_crystals_list))
         self.index = 1
         self.name = "test_name"
         self.mock_hist = mock_hist
@@ -31,43 +34,35 @@ class TestSpan(unittest.TestCase):
                                self.mock_hist, self.mock_hist, self.mock_hist]
         self.span = Span(fig=self.fig, histogram_list=self.histogram_list,
                          index=self.index, name=self.name,
-                         all_crystals_list=self.all_crystals_list,
-                         crystals_excluded=self.crystals_excluded)
+                         cross_filter=self.cross_filter)
 
     def test_onselect(self):
         self.span.onselect(20, 100)
         self.assertEqual(
             self.mock_hist.was_clicked_before, True)
         self.assertEqual(self.mock_hist.range_green_space, (20, 100))
-        self.assertEqual(len(self.crystals_excluded), 2)
+        self.assertEqual(self.cross_filter.ranges[self.index], (20, 100))
+        self.assertEqual(self.cross_filter.last_dimension, self.index)
+        self.assertEqual(self.cross_filter.included_count(), 1)
         self.span.onselect(20, 20)
         self.assertEqual(self.mock_hist.was_clicked_before, False)
         self.assertEqual(self.mock_hist.range_green_space, (None, None))
+        self.assertEqual(self.cross_filter.included_count(), 2)
 
-    @patch('CrystFEL_Jupyter_utilities.widget.histograms_data')
-    def test_data_update(self, mock_histograms_data):
+    def test_data_update(self):
         self.mock_hist.reset_mock()
         self.span.data_update()
-        assert mock_histograms_data.called
-        mock_histograms_data.assert_called_once_with(
-            Span.get_crystals_included_list())
         self.assertEqual(self.mock_hist.update.call_count, 6)
+        self.mock_hist.update.assert_called_with()
 
-    def test_is_exluded(self):
-        crystal = {'name': 'Image filename: db2.cxi',
-                   'a': 40, 'b': 40,
-                   'c': 40, 'alfa': 120,
-                   'beta': 120, 'gamma': 120,
-                   'lattice_type': "triclinic",
-                   'centering': "P", "unique_axis": "b"}
-        self.mock_hist.reset_mock()
-        self.mock_hist.bool_crystal_exluded_green_space.return_value = False
-        self.span.is_exluded(crystal)
-        self.assertEqual(
-            self.mock_hist.bool_crystal_exluded_green_space.call_count, 6)
-        self.mock_hist.bool_crystal_exluded_green_space.return_value = True
-        self.assertEqual(self.span.is_exluded(crystal), True)
-
+    def test_onselect_moves_counts(self):
+        self.span.onselect(0, 10)
+        numpy.testing.assert_array_equal(self.cross_filter.included,
+                                         [True, False])
+        self.assertEqual(self.mock_hist.update.call_count, 6)
+        # 'C' crystal stays, 'P' crystal moves to the excluded row.
+        counts = self.cross_filter.fine_counts[self.index].sum(axis=1)
+        numpy.testing.assert_array_equal(counts, [0, 0, 0, 1, 0, 0, 0, 0, 1])
 
 if __name__ == '__main__':
     unittest.main()
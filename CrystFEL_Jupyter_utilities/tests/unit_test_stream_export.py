@@ -0,0 +1,70 @@
+import errno
+import numpy
+import os
+import tempfile
+import unittest
+from unittest.mock import Mock
+
+import CrystFEL_Jupyter_utilities.stream_export as stream_export
+from CrystFEL_Jupyter_utilities.stream_read import index_chunks
+
+
+class TestStreamExport(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.header = ("CrystFEL stream format 2.3\n"
+                       "----- Begin geometry file -----\n"
+                       "----- End geometry file -----\n")
+        self.chunks = []
+        for index in range(4):
+            self.chunks.append("----- Begin chunk -----\n"
+                               "Image filename: img{}.h5\n"
+                               "----- End chunk -----\n".format(index))
+        self.streamfile = os.path.join(self.directory.name, "test.stream")
+        with open(self.streamfile, 'w') as file:
+            file.write(self.header + ''.join(self.chunks))
+        self.filename = os.path.join(self.directory.name, "selected.stream")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_index_chunks(self):
+        index = index_chunks(self.streamfile)
+        self.assertEqual(index.shape, (4, 2))
+        self.assertEqual(index[0, 0], len(self.header))
+        self.assertEqual(index[-1, 1], os.path.getsize(self.streamfile))
+        numpy.testing.assert_array_equal(index[1:, 0], index[:-1, 1])
+
+    def test_merge_ranges(self):
+        numpy.testing.assert_array_equal(
+            stream_export.merge_ranges([[0, 5], [5, 8], [10, 12], [12, 13]]),
+            [[0, 8], [10, 13]])
+        self.assertEqual(len(stream_export.merge_ranges([])), 0)
+
+    def test_export_chunks(self):
+        size = stream_export.export_chunks(self.streamfile, self.filename,
+                                           [3, 0, 1, 0])
+        expected = self.header + ''.join(self.chunks[index]
+                                         for index in [0, 1, 3])
+        with open(self.filename) as file:
+            self.assertEqual(file.read(), expected)
+        self.assertEqual(size, len(expected))
+        with self.assertRaises(ValueError):
+            stream_export.export_chunks(self.streamfile, self.streamfile, [])
+
+    def test_copy_fallback(self):
+        unsupported = Mock(side_effect=OSError(errno.EXDEV, "Cross-device"))
+        methods = [unsupported, stream_export._read_write]
+        with open(self.streamfile, 'rb', buffering=0) as source, \
+                open(self.filename, 'wb', buffering=0) as destination:
+            copied = stream_export.copy_range(source, destination, 5, 20,
+                                              methods)
+        self.assertEqual(copied, 15)
+        self.assertEqual(methods, [stream_export._read_write])
+        with open(self.filename) as file:
+            self.assertEqual(file.read(), self.header[5:20])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,11 @@
 import numpy as np
+import os
+import tempfile
 import unittest
 from unittest.mock import mock_open, patch
 
 import CrystFEL_Jupyter_utilities.stream_read as stream_read
+import CrystFEL_Jupyter_utilities.synthetic as synthetic
 
 
 class TestStreamRead(unittest.TestCase):
@@ -69,7 +72,9 @@ class TestStreamRead(unittest.TestCase):
                        'c': self.c, 'alfa': self.alfa,
                        'beta': self.beta, 'gamma': self.gamma,
                        'lattice_type': "monoclinic",
-                       'centering': "C", "unique_axis": "b"}]
+                       'centering': "C", "unique_axis": "b",
+                       'astar': self.astar, 'bstar': self.bstar,
+                       'cstar': self.cstar, 'chunk': 0}]
         self.peak_list = ['q0a1', 'q1a0', 'q0a2']
         self.peak_reflections_list = ['q2a6', 'q2a4', 'q1a13']
 
@@ -101,6 +106,24 @@ class TestStreamRead(unittest.TestCase):
             self.assertEqual(list(s[1].keys()).sort(),
                              self.peak_reflections_list.sort())
 
+    def test_search_peaks_event(self):
+        spec = synthetic.size_spec('small', chunks=6, images=2, events=3,
+                                   peaks=5, hit_rate=1.0)
+        with tempfile.TemporaryDirectory() as directory:
+            streamfile = os.path.join(directory, 'run.stream')
+            synthetic.write_stream(streamfile, spec,
+                                   synthetic.panel_layout(), seed=1)
+            counts = []
+            for event in [None, 0, 1, '//2']:
+                peaks = stream_read.search_peaks(streamfile, 'image_00001.h5',
+                                                 event)[0]
+                counts.append(sum(len(found) for found in peaks.values()))
+        table = synthetic.panel_table(synthetic.panel_layout())
+        expected = [len(synthetic.chunk_data(chunk, spec, table,
+                                             seed=1)['peaks']['intensity'])
+                    for chunk in range(3, 6)]
+        self.assertEqual(counts, [sum(expected)] + expected)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,94 @@
+import h5py
+import numpy
+import os
+import tempfile
+import unittest
+
+import CrystFEL_Jupyter_utilities.stream_stats as stream_stats
+
+
+class TestStreamStats(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        lines = ["CrystFEL stream format 2.3"]
+        # hit, peaks, resolutions of the crystals
+        self.frames = [(1, 5, [2.0]), (0, 1, []), (1, 7, [1.0, 3.0]),
+                       (1, 6, [])]
+        for index, (hit, peaks, resolutions) in enumerate(self.frames):
+            lines += ["----- Begin chunk -----",
+                      "Image filename: /data/img.h5",
+                      "Event: //{}".format(index),
+                      "hit = {}".format(hit),
+                      "num_peaks = {}".format(peaks)]
+            for resolution in resolutions:
+                lines += ["--- Begin crystal",
+                          "diffraction_resolution_limit = "
+                          "{} nm^-1 or 5.00 A".format(resolution),
+                          "--- End crystal"]
+            lines.append("----- End chunk -----")
+        self.streamfile = os.path.join(self.directory.name, "test.stream")
+        with open(self.streamfile, 'w') as file:
+            file.write('\n'.join(lines) + '\n')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_part_statistics(self):
+        statistics, run = stream_stats.part_statistics(self.streamfile,
+                                                       block_size=3)
+        numpy.testing.assert_array_equal(statistics['chunk'], [0, 1, 2, 3])
+        numpy.testing.assert_array_equal(statistics['hit'], [1, 0, 1, 1])
+        numpy.testing.assert_array_equal(statistics['indexed'], [1, 0, 1, 0])
+        numpy.testing.assert_array_equal(statistics['crystals'], [1, 0, 2, 0])
+        numpy.testing.assert_array_equal(statistics['resolution'],
+                                         [2.0, numpy.nan, 3.0, numpy.nan])
+        summary = run.summary()
+        self.assertEqual(summary['frames'], 4)
+        self.assertEqual(summary['hit_rate'], 0.75)
+        self.assertAlmostEqual(summary['indexing_rate'], 2 / 3)
+        self.assertEqual(summary['crystals_per_indexed_frame'], 1.5)
+        self.assertAlmostEqual(summary['mean_peaks'], 4.75)
+        self.assertAlmostEqual(summary['std_peaks'],
+                               numpy.std([5, 1, 7, 6]))
+        self.assertAlmostEqual(summary['median_resolution_nm^-1'], 2.0,
+                               places=2)
+
+    def test_merge(self):
+        statistics, run = stream_stats.part_statistics(self.streamfile)
+        first = stream_stats.RunStatistics()
+        first.add(statistics[:1])
+        second = stream_stats.RunStatistics()
+        second.add(statistics[1:])
+        first.merge(second)
+        self.assertEqual(first.summary(), run.summary())
+        self.assertTrue(numpy.isnan(
+            stream_stats.RunStatistics().summary()['hit_rate']))
+
+    def test_stream_statistics(self):
+        statistics, run = stream_stats.stream_statistics(self.streamfile, 1)
+        parallel, parallel_run = stream_stats.stream_statistics(
+            self.streamfile, processes=2, parts=3)
+        for name in stream_stats.FRAME_STATISTICS.names:
+            numpy.testing.assert_array_equal(parallel[name], statistics[name])
+        self.assertEqual(parallel_run.summary(), run.summary())
+
+    def test_write_statistics(self):
+        statistics, run = stream_stats.part_statistics(self.streamfile)
+        filename = os.path.join(self.directory.name, "stats.csv")
+        stream_stats.write_statistics(statistics, filename)
+        with open(filename) as file:
+            lines = file.read().splitlines()
+        self.assertEqual(lines[0], ','.join(
+            stream_stats.FRAME_STATISTICS.names))
+        self.assertEqual(len(lines), 5)
+        filename = os.path.join(self.directory.name, "stats.h5")
+        stream_stats.write_statistics(statistics, filename, run.summary())
+        with h5py.File(filename, 'r') as file:
+            numpy.testing.assert_array_equal(file['frames/num_peaks'][:],
+                                             [5, 1, 7, 6])
+            self.assertEqual(file['frames'].attrs['frames'], 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
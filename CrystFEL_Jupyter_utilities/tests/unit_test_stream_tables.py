@@ -0,0 +1,147 @@
+import h5py
+import numpy
+import os
+import tempfile
+import unittest
+
+import CrystFEL_Jupyter_utilities.stream_tables as stream_tables
+from CrystFEL_Jupyter_utilities.stream_read import (cell_parameters,
+                                                    index_chunks)
+
+
+class TestStreamTables(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.astar = [+0.1628118, -0.0234613, +0.0047666]
+        self.bstar = [+0.0115679, +0.0777724, -0.0235210]
+        self.cstar = [+0.0019407, +0.0171354, +0.0576783]
+        lines = ["CrystFEL stream format 2.3",
+                 "----- Begin geometry file -----",
+                 "clen = 0.1",
+                 "----- End geometry file -----",
+                 "----- Begin chunk -----",
+                 "Image filename: /data/db.h5",
+                 "Event: //3",
+                 "hit = 1",
+                 "indexed_by = mosflm",
+                 "num_peaks = 2",
+                 "Peaks from peak search",
+                 "  fs/px   ss/px (1/d)/nm^-1   Intensity  Panel",
+                 " 248.50  103.17       2.20     1440.39   q0a1",
+                 " 519.07   72.50       2.08      878.44   q1a0",
+                 "End of peak list",
+                 "--- Begin crystal",
+                 "astar = +0.1628118 -0.0234613 +0.0047666 nm^-1",
+                 "bstar = +0.0115679 +0.0777724 -0.0235210 nm^-1",
+                 "cstar = +0.0019407 +0.0171354 +0.0576783 nm^-1",
+                 "lattice_type = monoclinic", "centering = C",
+                 "unique_axis = b",
+                 "diffraction_resolution_limit = 1.92 nm^-1 or 5.20 A",
+                 "num_reflections = 2",
+                 "Reflections measured after indexing",
+                 "   h    k    l          I   sigma(I)       peak background"
+                 "  fs/px  ss/px panel",
+                 " -24   -2  -18     -27.69      46.98      37.00      16.47"
+                 "  802.3  734.6 q2a6",
+                 " -23   -5  -18     -36.17      48.68      55.00      16.83"
+                 "  838.4  680.9 q2a6",
+                 "End of reflections",
+                 "--- End crystal",
+                 "----- End chunk -----",
+                 "----- Begin chunk -----",
+                 "Image filename: /data/db.h5",
+                 "Event: //4",
+                 "hit = 0",
+                 "num_peaks = 0",
+                 "Peaks from peak search",
+                 "  fs/px   ss/px (1/d)/nm^-1   Intensity  Panel",
+                 "End of peak list",
+                 "----- End chunk -----"]
+        self.streamfile = os.path.join(self.directory.name, "test.stream")
+        with open(self.streamfile, 'w') as file:
+            file.write('\n'.join(lines) + '\n')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_iter_chunks(self):
+        chunks = list(stream_tables.iter_chunks(self.streamfile))
+        self.assertEqual(len(chunks), 2)
+        self.assertEqual(chunks[0]['fields']['Event'], '//3')
+        self.assertEqual(len(chunks[0]['peaks']), 2)
+        self.assertEqual(len(chunks[0]['crystals']), 1)
+        crystal = chunks[0]['crystals'][0]
+        self.assertEqual(crystal['fields']['centering'], 'C')
+        self.assertEqual(len(crystal['reflections']), 2)
+        self.assertEqual(chunks[1]['crystals'], [])
+        # Fields of the geometry file are not in the chunks.
+        self.assertNotIn('clen', chunks[0]['fields'])
+
+    def test_iter_chunks_part(self):
+        offset = index_chunks(self.streamfile)[1, 0]
+        chunks = list(stream_tables.iter_chunks(self.streamfile, offset,
+                                                count=1, first_chunk=1))
+        self.assertEqual(len(chunks), 1)
+        self.assertEqual(chunks[0]['chunk'], 1)
+        self.assertEqual(chunks[0]['fields']['Event'], '//4')
+        chunks = list(stream_tables.iter_chunks(self.streamfile, count=1))
+        self.assertEqual(chunks[0]['fields']['Event'], '//3')
+
+    def test_chunk_tables(self):
+        tables = stream_tables.chunk_tables(
+            stream_tables.iter_chunks(self.streamfile))
+        frames = tables['frames']
+        numpy.testing.assert_array_equal(frames['hit'], [1, 0])
+        numpy.testing.assert_array_equal(frames['crystals'], [1, 0])
+        numpy.testing.assert_array_equal(frames['event'], ['//3', '//4'])
+        crystals = tables['crystals']
+        numpy.testing.assert_array_almost_equal(
+            [crystals[name][0] for name in
+             ['a', 'b', 'c', 'alfa', 'beta', 'gamma']],
+            cell_parameters(self.astar, self.bstar, self.cstar))
+        self.assertEqual(crystals['bstar_y'][0], 0.0777724)
+        self.assertEqual(crystals['resolution'][0], 1.92)
+        numpy.testing.assert_array_equal(tables['peaks']['panel_name'],
+                                         ['q0a1', 'q1a0'])
+        numpy.testing.assert_array_equal(tables['reflections']['h'],
+                                         [-24, -23])
+        numpy.testing.assert_array_equal(tables['reflections']['chunk'],
+                                         [0, 0])
+
+    def test_empty_block(self):
+        tables = stream_tables.chunk_tables([])
+        self.assertEqual(tables['frames']['chunk'].dtype, numpy.int64)
+        self.assertEqual(tables['crystals']['image'].dtype.kind, 'U')
+        self.assertEqual(len(tables['reflections']['h']), 0)
+
+    def test_export_hdf5(self):
+        filename = os.path.join(self.directory.name, "test.h5")
+        rows = stream_tables.export_tables(self.streamfile, filename,
+                                           block_size=1)
+        self.assertEqual(rows, {'frames': 2, 'crystals': 1, 'peaks': 2,
+                                'reflections': 2})
+        with h5py.File(filename, 'r') as file:
+            numpy.testing.assert_array_equal(file['frames/num_peaks'][:],
+                                             [2, 0])
+            self.assertEqual(file['crystals/centering'][0], b'C')
+            numpy.testing.assert_array_equal(file['reflections/k'][:],
+                                             [-2, -5])
+            self.assertEqual(file['peaks/fs_px'].compression, 'gzip')
+
+    def test_export_errors(self):
+        filename = os.path.join(self.directory.name, "test.parquet")
+        with self.assertRaises(ValueError):
+            stream_tables.export_tables(self.streamfile, filename, 'csv')
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            with self.assertRaises(ImportError):
+                stream_tables.export_tables(self.streamfile, filename,
+                                            'parquet')
+            with self.assertRaises(SystemExit):
+                stream_tables.main([self.streamfile, '-f', 'parquet'])
+
+
+if __name__ == '__main__':
+    unittest.main()
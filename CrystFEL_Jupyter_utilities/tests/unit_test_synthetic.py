@@ -0,0 +1,105 @@
+import h5py
+import numpy
+import os
+import tempfile
+import unittest
+
+from cfelpyutils.crystfel_utils import load_crystfel_geometry
+
+from CrystFEL_Jupyter_utilities.stream_read import search_crystals_parameters
+from CrystFEL_Jupyter_utilities.stream_tables import chunk_tables, iter_chunks
+import CrystFEL_Jupyter_utilities.synthetic as synthetic
+
+
+class TestSynthetic(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.spec = synthetic.size_spec(
+            'small', chunks=30, images=2, events=3, crystals=0.5,
+            peaks=10, reflections=5, modules=1, fs_size=32, ss_size=16,
+            mix={'monoclinic-C': 1, 'cubic-F': 1}, permute=0.5)
+        self.files = synthetic.generate(self.directory.name, self.spec,
+                                        seed=3)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_size_spec(self):
+        self.assertEqual(self.spec['chunks'], 30)
+        self.assertEqual(self.spec['hit_rate'],
+                         synthetic.DEFAULT_SPEC['hit_rate'])
+        with self.assertRaises(ValueError):
+            synthetic.size_spec('huge')
+        with self.assertRaises(ValueError):
+            synthetic.size_spec(mix={'cubic-C': 1})
+        # 30 chunks of 6 frames reuse them, with 15 events they don't.
+        spec = synthetic.unique_frames(self.spec)
+        self.assertEqual(spec['events'], 15)
+        self.assertEqual(
+            len({synthetic.image_event(chunk, spec) for chunk in range(30)}),
+            30)
+        self.assertEqual(synthetic.unique_frames(spec), spec)
+        self.assertEqual(synthetic.parse_mix("cubic-P:2, triclinic-P"),
+                         {'cubic-P': 2.0, 'triclinic-P': 1.0})
+
+    def test_geometry(self):
+        geom = load_crystfel_geometry(self.files['geometry'])
+        self.assertEqual(list(geom['panels']),
+                         ['q0a0', 'q1a0', 'q2a0', 'q3a0'])
+        self.assertEqual(geom['panels']['q1a0']['min_ss'], 16)
+        self.assertEqual(geom['panels']['q1a0']['fsy'], 1.0)
+        self.assertEqual(geom['panels']['q1a0']['ssx'], -1.0)
+
+    def test_stream(self):
+        tables = chunk_tables(list(iter_chunks(self.files['stream'])))
+        frames = tables['frames']
+        numpy.testing.assert_array_equal(frames['chunk'], numpy.arange(30))
+        self.assertEqual(frames['image'][4], 'image_00001.h5')
+        self.assertEqual(frames['event'][4], '//1')
+        self.assertEqual(len(tables['peaks']['chunk']),
+                         frames['num_peaks'].sum())
+        self.assertEqual(len(tables['crystals']['chunk']),
+                         frames['crystals'].sum())
+        self.assertEqual(set(tables['crystals']['lattice_type']),
+                         {'monoclinic', 'cubic'})
+        # Cubic cells keep the equal lengths.
+        crystals = search_crystals_parameters(self.files['stream'])
+        for crystal in crystals:
+            if crystal['lattice_type'] == 'cubic':
+                self.assertAlmostEqual(crystal['a'], crystal['c'], places=3)
+
+    def test_deterministic(self):
+        with open(self.files['stream']) as file:
+            text = file.read()
+        panels = synthetic.panel_layout(4, 1, 32, 16)
+        chunk = synthetic.chunk_text(7, synthetic.chunk_data(
+            7, self.spec, synthetic.panel_table(panels), seed=3), self.spec)
+        self.assertIn(chunk, text)
+        other = os.path.join(self.directory.name, 'other.stream')
+        synthetic.write_stream(other, self.spec, panels, seed=4)
+        with open(other) as file:
+            self.assertNotIn(chunk, file.read())
+
+    def test_block_texts(self):
+        panels = synthetic.panel_layout(4, 1, 32, 16)
+        blocks = [(first, 1) for first in range(6)]
+        texts = list(synthetic.block_texts(blocks, self.spec, panels, seed=3,
+                                           processes=2))
+        self.assertEqual(texts, list(synthetic.block_texts(
+            blocks, self.spec, panels, seed=3)))
+        with open(self.files['stream']) as file:
+            self.assertIn("".join(texts), file.read())
+
+    def test_image(self):
+        self.assertEqual(len(self.files['images']), 2)
+        with h5py.File(self.files['images'][1], 'r') as file:
+            self.assertEqual(file['/data/data'].shape, (3, 64, 32))
+            peaks = file['/processing/hitfinder/peakinfo-assembled'][:]
+        table = synthetic.panel_table(synthetic.panel_layout(4, 1, 32, 16))
+        first = synthetic.chunk_data(3, self.spec, table, seed=3)['peaks']
+        numpy.testing.assert_allclose(peaks[:, 2], first['intensity'])
+
+
+if __name__ == '__main__':
+    unittest.main()
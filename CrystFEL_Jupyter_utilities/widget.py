@@ -1,12 +1,16 @@
 """Module for centering switches and handling mouse events.
 """
+import inspect
 import logging
 import itertools
 
+from matplotlib.patches import PathPatch
+from matplotlib.path import Path
 from matplotlib.widgets import Button, RadioButtons, SpanSelector, Slider
 import matplotlib.pyplot as plt
+import numpy as np
 
-from .crystlib import histograms_data
+from .profiling import timed
 
 # remove all the handlers.
 for handler in logging.root.handlers[:]:
@@ -22,6 +26,84 @@ ch.setFormatter(formatter)
 LOGGER.addHandler(ch)
 LOGGER.setLevel("INFO")
 
+# matplotlib 3.5 renamed `rectprops` of the SpanSelector to `props`
+# and 3.7 removed the old name.
+SPAN_PROPS = ('props' if 'props' in inspect.signature(
+    SpanSelector).parameters else 'rectprops')
+
+
+def circles_path(positions, radius):
+    """Returns one path with circles around all positions,
+    drawn as a single patch instead of a patch for each circle.
+
+    Parameters
+    ----------
+    positions : numpy.ndarray
+
+        The (N, 2) array of the centers.
+    radius : float
+
+        Radius of the circles.
+
+    Returns
+    -------
+    path : The class:`matplotlib.path.Path`
+    """
+    circle = Path.unit_circle()
+    positions = np.asarray(positions, dtype=float).reshape(-1, 1, 2)
+    vertices = positions + radius * circle.vertices
+    codes = np.tile(circle.codes, len(positions))
+    return Path(vertices.reshape(-1, 2), codes)
+
+
+def blit_axes(fig, axes_list):
+    """Repaints only the given subplots and copies them to the screen
+    with a single blit. Falls back to a full (idle) redraw when
+    the canvas can not blit.
+
+    Parameters
+    ----------
+    fig : The class:`matplotlib.figure.Figure`.
+
+        The Figure which will be refreshed.
+    axes_list : list
+
+        The class:`matplotlib.axes.Axes` objects to repaint.
+    """
+    canvas = fig.canvas
+    if not canvas.supports_blit:
+        canvas.draw_idle()
+        return
+    try:
+        for axs in axes_list:
+            # Contents of the subplot without ticks and labels
+            # which are outside of the frame.
+            axs.redraw_in_frame()
+            for line in axs.get_xgridlines() + axs.get_ygridlines():
+                axs.draw_artist(line)
+        # Tick labels of one subplot may lie in the frame of another one,
+        # only their part inside the repainted frame is drawn again.
+        for axs in axes_list:
+            for label in axs.get_xticklabels() + axs.get_yticklabels():
+                if not label.get_visible() or not label.get_text():
+                    continue
+                extent = label.get_window_extent()
+                for other in axes_list:
+                    if other is axs or not extent.overlaps(other.bbox):
+                        continue
+                    clip_box, clip_on = label.get_clip_box(), \
+                        label.get_clip_on()
+                    label.set_clip_box(other.bbox)
+                    label.set_clip_on(True)
+                    fig.draw_artist(label)
+                    label.set_clip_box(clip_box)
+                    label.set_clip_on(clip_on)
+    except AttributeError:
+        # The canvas was not drawn before.
+        canvas.draw_idle()
+        return
+    canvas.blit(fig.bbox)
+
 
 class PeakButtons:
     """A GUI buttons used to visible others peaks in image
@@ -43,9 +125,9 @@ class PeakButtons:
     panels : dict
 
         Object class Panel with peaks.
-    peaks -  list
+    peaks : dict
 
-        Objects Peak (form h5 file).
+        Positions of the peaks from h5 file, see `peak_h5.get_peaks_array`.
     title : Python unicode str (on py3)
 
         Title image.
@@ -81,9 +163,10 @@ class PeakButtons:
         panels : dict
 
             Objects class Detector with peaks.
-        peaks -  list
+        peaks : dict
 
-            Objects class Peak form h5 file.
+            Positions of the peaks from h5 file,
+            see `peak_h5.get_peaks_array`.
         number_peaks_button : int
 
             Number of buttons.
@@ -137,6 +220,7 @@ class PeakButtons:
             button.label.set_fontstretch(200)
             button.label.set_linespacing(2)
 
+    @timed('peak_overlay_build')
     def visual_peaks_reflection(self):
         """Draw peaks from line `reflections measured after indexing`
         from stream file. Like as script near_bragg.
@@ -152,6 +236,7 @@ class PeakButtons:
                 # draw red circle
                 self.ax.add_artist(circle)
 
+    @timed('peak_overlay_build')
     def visual_peaks_search(self):
         """Draw peaks from `peaks search` from stream file.
         Like check_peak_detection script.
@@ -167,19 +252,65 @@ class PeakButtons:
                 # draw red circle
                 self.ax.add_artist(circle)
 
+    @timed('peak_overlay_build')
     def visual_peaks(self):
         """Draw peaks form dataset in h5 file 'cheetah peakinfo-assembled'.
         """
-        try:
-            # loop through all peaks list
-            for peak in self.peaks:
-                circle = plt.Circle(peak.get_position(), radius=5,
-                                    color='y', fill=False)
-                # draw yellow circle
-                self.ax.add_artist(circle)
-        except TypeError:
-            # exception when we can find peak in dataset
+        # no peaks in dataset
+        if self.peaks is None or not len(self.peaks['position']):
             return None
+        # draw yellow circles as one patch
+        circles = PathPatch(circles_path(self.peaks['position'], radius=5),
+                            color='y', fill=False)
+        self.ax.add_artist(circles)
+
+    def set_frame(self, matrix, peaks, panels, title):
+        """Shows other frame with the peaks which are switched on,
+        keeping the colour map, the contrast and the zoom.
+
+        Parameters
+        ----------
+        matrix : numpy.array object
+
+            Data with pixels.
+        peaks : dict
+
+            Positions of the peaks from h5 file,
+            see `peak_h5.get_peaks_array`.
+        panels : dict
+
+            Objects class Detector with peaks.
+        title : Python unicode str (on py3)
+
+            Title image.
+        """
+        # the same zoom for frames of the same size
+        limits = None
+        if np.shape(matrix) == np.shape(self.matrix):
+            limits = self.ax.get_xlim(), self.ax.get_ylim()
+        self.matrix = matrix
+        self.peaks = peaks
+        self.panels = panels
+        self.title = title
+        # clear subplot
+        self.ax.cla()
+        image = self.ax.imshow(self.matrix, cmap=self.radio.get_cmap(),
+                               vmax=self.slider.get_vmax(),
+                               vmin=self.slider.get_vmin(), animated=True)
+        if self.list_active_peak[0]:
+            self.visual_peaks()
+        if self.list_active_peak[1]:
+            self.visual_peaks_search()
+        if self.list_active_peak[2]:
+            self.visual_peaks_reflection()
+        if limits is not None:
+            self.ax.set_xlim(limits[0])
+            self.ax.set_ylim(limits[1])
+        self.ax.set_title(self.title)
+        # set a new reference in the widgets
+        self.radio.set_image(image)
+        self.slider.set_image(image)
+        self.fig.canvas.draw()
 
     def peaks_on_of(self, event):
         """React at the click of buttons.
@@ -596,9 +727,10 @@ class CenteringButton(Button):
         for hist in self.histogram_list:  # Loop for each histogram.
             hist.list_colors = self.histogram_colors  # Setting new colour
             # in a given histogram.
-            # Refresh each histogram (clear image and draw again)
+            # Only the colour of the polygons, the data is not touched.
             hist.update_colors()
-        self.fig.canvas.draw()  # Redraw the current figure.
+        # Repaint only the histograms with a single blit.
+        blit_axes(self.fig, [hist.axs for hist in self.histogram_list])
 
     def reset_color(self):
         """Restore the initial settings.
@@ -609,7 +741,6 @@ class CenteringButton(Button):
         for hist in self.histogram_list:  # Loop for each histogram.
             hist.list_colors = self.histogram_colors  # Setting new colour
             # in a given histogram.
-            # Refresh each histogram (clear image and draw again)
             hist.update_colors()
 
 
@@ -621,12 +752,9 @@ class Span:
     fig : The class:`matplotlib.figure.Figure`.
 
         The Figure which will be redraw.
-    crystals_excluded : list
-
-        Crystals excluded.
-    all_crystals_list : list
+    cross_filter : The class:`crossfilter.CrossFilter`
 
-        All crystals.
+        Selection of the crystals shared by all Spans.
     histogram_list : list
 
         Contains objects the class:`histogram.Histogram`.
@@ -636,26 +764,24 @@ class Span:
     name : str
 
         Name of the histogram.
+    density_list : list
+
+        Contains objects the class:`density.DensityPanel`
+        linked to the same selection.
     """
-    # list of flags for showing what was selected last, where.
-    __which_was_used_last = [False, False, False, False, False, False]
-    __crystals_included = []
-    # crystals in green space
 
-    def __init__(self, fig, crystals_excluded,
-                 all_crystals_list, histogram_list, name, index):
+    def __init__(self, fig, cross_filter, histogram_list, name, index,
+                 density_list=None):
         """
         Parameters
         ----------
         fig : The class:`matplotlib.figure.Figure`.
 
             The Figure which will be redraw.
-        crystals_excluded : list
-
-            Crystals excluded.
-        all_crystals_list : list
+        cross_filter : The class:`crossfilter.CrossFilter`
 
-            All crystals.
+            Selection of the crystals shared by all Spans,
+            its counts are shown by the histograms.
         histogram_list : list
 
             Contains objects the class:`histogram.Histogram`.
@@ -665,47 +791,30 @@ class Span:
         index : int
 
             Index number in the histogram_list.
+        density_list : list
+
+            Contains objects the class:`density.DensityPanel`.
+            Default: None, no 2-D density panels.
         """
         self.fig = fig
-        # Excluded crystals.
-        self.crystals_excluded = crystals_excluded
-        # all crystals found in stream file
-        self.all_crystals_list = all_crystals_list
+        self.cross_filter = cross_filter
         self.index = index  # Which histogram is used.
         self.name = name  # Histogram name.
         self.histogram_list = histogram_list  # List with all histograms. Works
         # as a active surface for selecting.
+        self.density_list = density_list if density_list is not None else []
         self.span = SpanSelector(self.histogram_list[index].axs, self.onselect,
                                  'horizontal', useblit=True,
-                                 rectprops=dict(alpha=0.5, facecolor='red'))
-
-    @staticmethod
-    def set_all_false():
-        """List of flags to show what was selected were set to false.
-        """
-        Span.__which_was_used_last = [False, False, False, False, False, False]
-
-    @staticmethod
-    def get_all_used():
-        """Get a list of flags to show what was selected were.
-        """
-        return Span.__which_was_used_last
+                                 **{SPAN_PROPS: dict(alpha=0.5,
+                                                     facecolor='red')})
 
     def onselect(self, xmin, xmax):
-        """Selects the list of crystals whose parameter
-        is in the region of interest (xmin, xmax),
-        sets new data for histograms and draws the region of interest
+        """Changes the range of interest of this histogram, the crossfilter
+        moves only the crystals entering or leaving it, refreshes the
+        histograms and draws the region of interest
 
         One click reset clear the region of interest.
         """
-        Span.set_all_false()
-        Span.__which_was_used_last[self.index] = True
-
-        # Always search every crystal whose parameter
-        # is in the region of interest and exclude the rest.
-        # We clear list and search again
-        Span.__crystals_included.clear()
-        self.crystals_excluded.clear()
         left_posx = min(xmin, xmax)  # Left selection point.
         right_posx = max(xmin, xmax)  # Right selection point.
         if left_posx == right_posx:  # Clicking resets the selection.
@@ -718,56 +827,24 @@ class Span:
             # set range green space
             self.histogram_list[self.index].range_green_space = (left_posx,
                                                                  right_posx)
-        for crystal in self.all_crystals_list:
-            # Loop for each histogram checking if it belongs to the selection.
-            if not self.is_exluded(crystal):
-                # If the crystal meets all conditions it is added.
-                Span.__crystals_included.append(crystal)
-        LOGGER.info(
-            "Selected {} of {} cells".format(len(Span.__crystals_included),
-                                             len(self.all_crystals_list)))
+        self.cross_filter.set_range(
+            self.index, *self.histogram_list[self.index].range_green_space)
+        LOGGER.info("Selected {} of {} cells".format(
+            self.cross_filter.included_count(), len(self.cross_filter)))
 
         self.data_update()
         for hist in self.histogram_list:
             # Loop for changing the colour to green on the selected part.
             hist.draw_green_space()
 
-    def is_exluded(self, crystal):
-        """Checks whether a given crystal is in the region of interest.
-
-        Parameters
-        ----------
-
-        crystal : dict
-
-            Crystal details.
-
-        Returns
-        -------
-        True : if crystal is in the region of interest.
-        """
-        for hist in self.histogram_list:
-            if hist.bool_crystal_exluded_green_space(crystal[hist.name]):
-                self.crystals_excluded.append(crystal)
-                return True
-
-    @staticmethod
-    def get_crystals_included_list():
-        """ Returns all crystals found in the region of interest.
-        """
-        return Span.__crystals_included
-
     def data_update(self):
-        """Method for updating data in
-        the histograms with regard to the selection.
+        """Method for refreshing the histograms and the density panels,
+        their counts were already changed by the crossfilter.
         """
-        data_included = histograms_data(Span.__crystals_included)
-        data_excluded = {'a': [], 'b': [], 'c': [],
-                         'alfa': [], 'beta': [], 'gamma': []}
-        for crystal in self.crystals_excluded:
-            for hist in self.histogram_list:
-                data_excluded[hist.name].append(crystal[hist.name])
-        # set data and refresh hist
         for hist in self.histogram_list:
-            hist.update(data_excluded=data_excluded[hist.name],
-                        data_to_histogram=data_included[hist.name])
+            hist.update()
+        for panel in self.density_list:
+            panel.update()
+        # The density panels may be in other figures.
+        for fig in {panel.axs.figure for panel in self.density_list}:
+            fig.canvas.draw_idle()
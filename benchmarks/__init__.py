@@ -0,0 +1,4 @@
+"""Benchmarks of the stream parsing, the image assembly and the
+update of the cell explorer, in the style of asv: classes with `setup`,
+`teardown` and `time_*` methods, run by `python -m benchmarks.run`.
+"""
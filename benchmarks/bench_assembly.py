@@ -0,0 +1,49 @@
+"""Benchmarks of reading the image and arranging the panels."""
+import os
+import shutil
+import tempfile
+
+from cfelpyutils.crystfel_utils import load_crystfel_geometry
+
+from CrystFEL_Jupyter_utilities.data import get_diction_data
+from CrystFEL_Jupyter_utilities.panel import (assemble, get_detectors,
+                                              image_size)
+from CrystFEL_Jupyter_utilities.synthetic import (panel_layout, size_spec,
+                                                  write_geometry, write_image)
+
+
+class ImageAssembly:
+    """Reading the HDF5 image and arranging the panels of a detector
+    of 4 quadrants with `modules` panels of `fs_size` x `ss_size` pixels.
+    """
+    modules = 16
+    fs_size = 192
+    ss_size = 96
+    items = 4 * modules * fs_size * ss_size
+    unit = 'pixels'
+
+    def setup(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'image.h5')
+        geomfile = os.path.join(self.directory, 'bench.geom')
+        panels = panel_layout(modules=self.modules, fs_size=self.fs_size,
+                              ss_size=self.ss_size)
+        spec = size_spec('small', peaks=500)
+        write_geometry(geomfile, panels, spec)
+        write_image(self.path, 0, spec, panels)
+        self.geom = load_crystfel_geometry(geomfile)
+        self.data = get_diction_data(self.path)
+        self.size = image_size(self.geom)
+
+    def teardown(self):
+        shutil.rmtree(self.directory)
+
+    def time_get_diction_data(self):
+        get_diction_data(self.path)
+
+    def time_arrangement_panels(self):
+        columns, rows, _, _ = self.size
+        # The panels are rotated in place, new ones are needed each time.
+        detectors = get_detectors(self.data["Panels"], (columns, rows),
+                                  self.geom, {}, {})
+        assemble(self.data["Panels"], self.geom, detectors)
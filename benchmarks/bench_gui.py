@@ -0,0 +1,60 @@
+"""Benchmarks of refreshing the histograms of the cell explorer
+with the Agg backend.
+"""
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt  # noqa: E402
+
+from CrystFEL_Jupyter_utilities.cell_engine import CellEngine  # noqa: E402
+from CrystFEL_Jupyter_utilities.histogram import Histogram  # noqa: E402
+from CrystFEL_Jupyter_utilities.synthetic import crystal_list  # noqa: E402
+from CrystFEL_Jupyter_utilities.widget import Span  # noqa: E402
+
+COLORS = {'P': 'gray', 'A': 'cyan', 'B': 'darkblue', 'C': 'royalblue',
+          'H': "firebrick", 'F': "magenta", 'I': 'lime', 'R': 'olive'}
+
+
+class HistogramUpdate:
+    """Selecting ranges of `crystals` crystals on the histograms
+    of the six unit cell parameters, as the class:`GUI_tools.CellExplorer`.
+    """
+    crystals = 200000
+    items = crystals
+    unit = 'crystals'
+
+    def setup(self):
+        self.engine = CellEngine(crystal_list(self.crystals))
+        cross_filter = self.engine.cross_filter
+        self.fig, axs_list = plt.subplots(2, 3)
+        self.histogram_list = [
+            Histogram(axs=axs, name=name, xlabel='', data_to_histogram=None,
+                      colors=COLORS, bins=16,
+                      fine_counts=cross_filter.fine_counts[index],
+                      value_range=cross_filter.value_ranges[index])
+            for index, (axs, name) in enumerate(zip(
+                axs_list.ravel(), ['a', 'b', 'c', 'alfa', 'beta', 'gamma']))]
+        self.span_list = [Span(fig=self.fig, cross_filter=cross_filter,
+                               histogram_list=self.histogram_list,
+                               name=hist.name, index=index)
+                          for index, hist in enumerate(self.histogram_list)]
+        # Each call moves the crystals of one of the cells in or out.
+        self.ranges = [(55.0, 85.0), (55.0, 65.0)]
+        self.calls = 0
+
+    def teardown(self):
+        plt.close(self.fig)
+
+    def select(self):
+        self.span_list[0].onselect(*self.ranges[self.calls % 2])
+        self.calls += 1
+
+    def time_onselect(self):
+        self.select()
+
+    def time_histogram_update(self):
+        for hist in self.histogram_list:
+            hist.update()
+
+    def time_onselect_draw(self):
+        self.select()
+        self.fig.canvas.draw()
@@ -0,0 +1,36 @@
+"""Benchmarks of importing the package in a new interpreter, as each
+batch job does.
+"""
+import subprocess
+import sys
+
+
+def import_module(module):
+    """Imports the module in a new interpreter."""
+    subprocess.run([sys.executable, '-c', 'import ' + module], check=True)
+
+
+class ImportTime:
+    """Start of the interpreter and import of the modules of the batch
+    jobs and of the graphical interface.
+    """
+    items = 1
+    unit = 'imports'
+
+    def setup(self):
+        pass
+
+    def teardown(self):
+        pass
+
+    def time_import_package(self):
+        import_module('CrystFEL_Jupyter_utilities')
+
+    def time_import_stream_read(self):
+        import_module('CrystFEL_Jupyter_utilities.stream_read')
+
+    def time_import_cell_engine(self):
+        import_module('CrystFEL_Jupyter_utilities.cell_engine')
+
+    def time_import_hdfsee(self):
+        import_module('CrystFEL_Jupyter_utilities.hdfsee')
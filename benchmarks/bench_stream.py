@@ -0,0 +1,37 @@
+"""Benchmarks of parsing the indexing stream file."""
+import os
+import shutil
+import tempfile
+
+from CrystFEL_Jupyter_utilities.stream_read import (search_crystals_parameters,
+                                                    search_peaks)
+from CrystFEL_Jupyter_utilities.synthetic import (panel_layout, size_spec,
+                                                  write_stream)
+
+
+class StreamParsing:
+    """Parsing of a stream of `chunks` frames with on average `crystals`
+    crystals, `peaks` peaks and `reflections` reflections of each crystal.
+    """
+    chunks = 10000
+    crystals = 1
+    peaks = 30
+    reflections = 50
+    items = chunks
+    unit = 'chunks'
+
+    def setup(self):
+        self.directory = tempfile.mkdtemp()
+        self.streamfile = os.path.join(self.directory, 'bench.stream')
+        spec = size_spec('small', chunks=self.chunks, crystals=self.crystals,
+                         peaks=self.peaks, reflections=self.reflections)
+        write_stream(self.streamfile, spec, panel_layout())
+
+    def teardown(self):
+        shutil.rmtree(self.directory)
+
+    def time_search_crystals_parameters(self):
+        search_crystals_parameters(self.streamfile)
+
+    def time_search_peaks(self):
+        search_peaks(self.streamfile, 'image_00003.h5')
@@ -0,0 +1,159 @@
+"""Runs the benchmarks, records the time, throughput and peak memory
+of each one and compares them against the stored baselines.
+
+    python -m benchmarks.run                 # compare with baseline.json
+    python -m benchmarks.run --save          # store new baselines
+    python -m benchmarks.run -k onselect     # only matching benchmarks
+"""
+import argparse
+import gc
+import importlib
+import inspect
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+# Modules with the benchmark classes.
+MODULES = ['bench_import', 'bench_stream', 'bench_assembly',
+           'bench_gui']
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'baseline.json')
+
+
+def find_benchmarks(pattern=None):
+    """Returns (name, class, method name) of the benchmarks, the name
+    is `module.Class.time_method`.
+    """
+    benchmarks = []
+    for module_name in MODULES:
+        module = importlib.import_module('.' + module_name, __package__)
+        for class_name, cls in inspect.getmembers(module, inspect.isclass):
+            if cls.__module__ != module.__name__:
+                continue
+            for method in sorted(vars(cls)):
+                if not method.startswith('time_'):
+                    continue
+                name = '.'.join([module_name, class_name, method])
+                if pattern is None or pattern in name:
+                    benchmarks.append((name, cls, method))
+    return benchmarks
+
+
+def run_benchmark(cls, method, repeat=5):
+    """Returns the result of one benchmark: the best and the median time
+    of `repeat` calls, the throughput in `cls.unit` per second and the
+    peak of the memory allocated during a call.
+    """
+    instance = cls()
+    instance.setup()
+    try:
+        function = getattr(instance, method)
+        times = []
+        for _ in range(repeat):
+            gc.collect()
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+        # Traced separately, tracing slows the calls down.
+        gc.collect()
+        tracemalloc.start()
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    finally:
+        instance.teardown()
+    best = min(times)
+    return {'seconds': best, 'median_seconds': float(np.median(times)),
+            'throughput': cls.items / best, 'unit': cls.unit,
+            'peak_bytes': peak}
+
+
+def compare(results, baselines, tolerance):
+    """Returns names of the benchmarks slower or using more memory than
+    `tolerance` times their baseline, and prints the comparison.
+    """
+    regressions = []
+    for name, result in results.items():
+        baseline = baselines.get(name)
+        if baseline is None:
+            print("{:60s} no baseline".format(name))
+            continue
+        time_ratio = result['seconds'] / baseline['seconds']
+        memory_ratio = result['peak_bytes'] / max(baseline['peak_bytes'], 1)
+        regressed = time_ratio > tolerance or memory_ratio > tolerance
+        if regressed:
+            regressions.append(name)
+        print("{:60s} time x{:.2f} memory x{:.2f}{}".format(
+            name, time_ratio, memory_ratio,
+            "  REGRESSION" if regressed else ""))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmarks of the stream parsing, the image assembly"
+        " and the cell explorer updates.")
+    parser.add_argument('-k', dest='pattern', metavar='TEXT',
+                        help="Run only benchmarks with TEXT in the name")
+    parser.add_argument('-r', '--repeat', type=int, default=5,
+                        help="Number of timed calls (default: 5)")
+    parser.add_argument('--baseline', default=BASELINE, metavar='FILE',
+                        help="Stored baselines (default: baseline.json)")
+    parser.add_argument('--save', action='store_true',
+                        help="Store the results as the new baselines")
+    parser.add_argument('--tolerance', type=float, default=1.5,
+                        help="Allowed ratio to the baseline (default: 1.5)")
+    parser.add_argument('-o', '--output', metavar='FILE',
+                        help="Write the results to JSON file")
+    args = parser.parse_args(argv)
+
+    results = {}
+    failures = []
+    for name, cls, method in find_benchmarks(args.pattern):
+        # A broken benchmark doesn't stop the others.
+        try:
+            result = run_benchmark(cls, method, args.repeat)
+        except Exception as error:
+            failures.append(name)
+            print("{:60s} FAILED {}: {}".format(name, type(error).__name__,
+                                                error))
+            continue
+        results[name] = result
+        print("{:60s} {:9.4f} s {:12.4g} {}/s {:8.1f} MiB".format(
+            name, result['seconds'], result['throughput'], result['unit'],
+            result['peak_bytes'] / 2**20))
+    machine = {'python': platform.python_version(),
+               'numpy': np.__version__, 'machine': platform.machine(),
+               'processor': platform.processor()}
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'machine': machine, 'results': results}, file,
+                      indent=1, sort_keys=True)
+    if args.save:
+        stored = {'machine': machine, 'results': {}}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as file:
+                stored['results'] = json.load(file)['results']
+        stored['results'].update(results)
+        with open(args.baseline, 'w') as file:
+            json.dump(stored, file, indent=1, sort_keys=True)
+        return 1 if failures else 0
+    if not os.path.exists(args.baseline):
+        print("No baselines in {}, run with --save".format(args.baseline))
+        return 1 if failures else 0
+    with open(args.baseline) as file:
+        baselines = json.load(file)['results']
+    regressions = compare(results, baselines, args.tolerance)
+    if failures:
+        print("{} benchmarks failed: {}".format(len(failures),
+                                                 ", ".join(failures)))
+    return 1 if regressions or failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
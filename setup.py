@@ -28,12 +28,20 @@ setup(name='CrystFEL_Jupyter_utilities',
       long_description=read("README.md"),
       long_description_content_type='text/markdown',
       license="BSD-3-Clause",
-      packages=find_packages(),
+      packages=find_packages(exclude=['benchmarks']),
       scripts=['scripts/check-peak-detection'],
       entry_points={
           "console_scripts": [
               "hdfsee_py = CrystFEL_Jupyter_utilities.hdfsee:main",
-              "cell_explorer_py = CrystFEL_Jupyter_utilities.GUI_tools:main"
+              "cell_explorer_py = CrystFEL_Jupyter_utilities.GUI_tools:main",
+              "cell_batch_py = CrystFEL_Jupyter_utilities.cell_batch:main",
+              "stream_tables_py = "
+              "CrystFEL_Jupyter_utilities.stream_tables:main",
+              "stream_stats_py = CrystFEL_Jupyter_utilities.stream_stats:main",
+              "synthetic_data_py = "
+              "CrystFEL_Jupyter_utilities.synthetic:main",
+              "run_vds_py = CrystFEL_Jupyter_utilities.run_reader:main",
+              "powder_py = CrystFEL_Jupyter_utilities.powder:main"
           ],
       },
       install_requires=[
@@ -47,6 +55,9 @@ setup(name='CrystFEL_Jupyter_utilities',
           'docs': [
               'ipython',
           ],
+          'tables': [
+              'pyarrow',
+          ],
           'test': [
               'coverage<5',
           ]